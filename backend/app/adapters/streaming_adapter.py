@@ -1,19 +1,134 @@
 import asyncio
 import logging
+import re
 import traceback
 import importlib.util
-from typing import Dict, List, Optional, Any, AsyncGenerator
+from typing import Dict, List, Optional, Any, AsyncGenerator, Tuple
 from sqlalchemy.orm import Session
 
 from ..config import get_settings
 from ..services.llm.openai_service import OpenAIService
-from ..rag.rag_service import RAGService
+from ..services.circuit_breaker import get_circuit_breaker
+from ..services.llm.metadata_extractor import classify_intent
+from ..rag.rag_service import RAGService, rag_settings
+from ..rag.rag_provider import rag_provider
+from ..rag.answer_cache import AnswerCache, ContextKey, document_ids, replay_answer
+from ..rag.single_flight import SingleFlight
+from ..rag.problem_renderer import is_problem_display_request, render_problem_display
+from ..rag.query_extractor_vn import normalize_text
 from ..rag.prompts.templates import LinearAlgebraTemplates
 from ..crud import chat_crud, message_crud
 from ..database import get_db
 
 logger = logging.getLogger(__name__)
 
+# Cache câu trả lời dùng chung cho mọi request trong process
+answer_cache = AnswerCache(
+    max_size=rag_settings.answer_cache_size,
+    ttl_seconds=rag_settings.answer_cache_ttl,
+    threshold=rag_settings.answer_cache_threshold
+)
+
+# Các generation giống nhau đang chạy đồng thời chỉ gọi LLM một lần
+generation_single_flight = SingleFlight()
+
+
+def generation_flight_key(query: str, documents: List[Any], model_name: str, system_message: str) -> Optional[Tuple]:
+    """Khóa single-flight: (câu hỏi đã chuẩn hóa, ids documents, model, system prompt); None nếu bị tắt"""
+    if not rag_settings.single_flight_enabled:
+        return None
+    return " ".join(normalize_text(query or "").split()), document_ids(documents), model_name, hash(system_message)
+
+
+_HINT_PATTERN = re.compile(r"(?<!\w)(?:gợi ý|goi y|hint|ý tưởng|y tuong)(?!\w)", re.IGNORECASE)
+
+
+def answer_intent(query: str, problem_only: bool = False) -> str:
+    """Loại câu trả lời được yêu cầu: problem (đề bài) / hint (gợi ý) / solution (lời giải) / explain"""
+    if problem_only:
+        return "problem"
+    if _HINT_PATTERN.search(query or ""):
+        return "hint"
+    return "solution" if classify_intent(query).requesting_solution else "explain"
+
+
+def answer_cache_context(
+    rag_service: Optional[RAGService],
+    query: str,
+    documents: List[Any],
+    model_name: str,
+    problem_only: bool = False
+) -> Tuple[Optional[ContextKey], Optional[List[float]]]:
+    """
+    Khóa ngữ cảnh và embedding câu hỏi cho cache câu trả lời.
+    Chỉ dùng embedding mà bước truy xuất đã tính (cache của QdrantConnector); truy xuất không cần
+    embedding (exact index, BM25, cache kết quả) thì bỏ qua cache câu trả lời, không gọi thêm API
+
+    Returns:
+        Tuple: (key, query_vector), (None, None) nếu không dùng cache được
+    """
+    if answer_cache.max_size <= 0 or not documents or rag_service is None or rag_service.qdrant is None:
+        return None, None
+    query_vector = rag_service.qdrant.cached_query_vector(query)
+    if query_vector is None:
+        logger.info("Answer cache skipped, retrieval did not embed the query")
+        return None, None
+    key = AnswerCache.make_key(
+        model_name, LinearAlgebraTemplates.TEMPLATE_VERSION, answer_intent(query, problem_only), document_ids(documents)
+    )
+    return key, query_vector
+
+
+async def generate_stream_with_answer_cache(
+    openai_service: OpenAIService,
+    system_message: str,
+    user_message: str,
+    cache_key: Optional[ContextKey] = None,
+    query_vector: Optional[List[float]] = None,
+    flight_key: Optional[Tuple] = None
+) -> AsyncGenerator[str, None]:
+    """
+    OpenAIService.generate_stream có cache câu trả lời phía trước:
+    hit thì phát lại câu trả lời đã cache, miss thì sinh mới và lưu khi stream hoàn tất.
+    Với flight_key, các request giống nhau đang chạy đồng thời dùng chung một lần sinh
+    """
+    if cache_key is not None:
+        cached_answer = answer_cache.get(cache_key, query_vector)
+        if cached_answer is not None:
+            logger.info(f"Answer cache hit ({len(cached_answer)} chars), replaying cached answer")
+            async for chunk in replay_answer(
+                cached_answer,
+                chunk_chars=rag_settings.answer_cache_replay_chunk_chars,
+                delay=rag_settings.answer_cache_replay_delay
+            ):
+                yield chunk
+            return
+
+    async def generate() -> AsyncGenerator[str, None]:
+        answer = ""
+        async for chunk in openai_service.generate_stream(
+            system_message=system_message,
+            user_message=user_message
+        ):
+            answer += chunk
+            yield chunk
+        if cache_key is not None:
+            answer_cache.put(cache_key, query_vector, answer)
+
+    stream = generate() if flight_key is None else generation_single_flight.stream(flight_key, generate)
+    async for chunk in stream:
+        yield chunk
+
+
+async def stream_problem_display(documents: List[Any]) -> AsyncGenerator[str, None]:
+    """Stream đề bài dựng sẵn (không gọi LLM) theo từng đoạn nhỏ"""
+    async for chunk in replay_answer(
+        render_problem_display(documents),
+        chunk_chars=rag_settings.answer_cache_replay_chunk_chars
+    ):
+        yield chunk
+
+
 class StreamingAdapter:
     """
     Adapter để kết nối hệ thống streaming cũ với OpenAI và RAG
@@ -46,24 +161,28 @@ class StreamingAdapter:
             enhanced_prompt = ""
             
             # Kiểm tra xem người dùng có chỉ muốn xem đề bài không
-            problem_only = False
-            problem_request_keywords = ["cho tôi một bài tập", "cho tôi bài tập", "cho tôi đề bài", 
-                                      "cung cấp bài tập", "cung cấp đề bài", "đề bài", "bài tập", "cho đề"]
-            if any(keyword in user_message.lower() for keyword in problem_request_keywords):
-                problem_only = True
+            problem_only = is_problem_display_request(user_message)
+            if problem_only:
                 logger.info(f"Người dùng chỉ yêu cầu đề bài: {problem_only}")
             
             if self.settings.rag_enabled:
                 try:
-                    # Khởi tạo RAG service
-                    rag_service = RAGService()
+                    # Dùng RAG service chung của process
+                    rag_service = await rag_provider.get_service()
                     
                     # Lấy context
                     documents, success = await rag_service.get_context(
                         user_message,
-                        use_query_metadata=True
+                        use_query_metadata=True,
+                        problem_only=problem_only
                     )
                     
+                    if success and documents and problem_only and rag_settings.display_fast_path:
+                        # Hiển thị nguyên văn đề bài, không cần gọi LLM
+                        async for chunk in stream_problem_display(documents):
+                            await queue.put(chunk)
+                        await queue.put("[DONE]")
+                        return
                     if success and documents:
                         # Tạo prompt với context
                         prompt_templates = LinearAlgebraTemplates()
@@ -114,6 +233,7 @@ async def generate_ai_response_stream_impl(
     file_ids: List[str] = None,
     db: Session = None,  # Thêm tham số db
     queue: asyncio.Queue = None,
+    rag_service: Optional[RAGService] = None,
 ) -> AsyncGenerator[str, None]:
     """
     Implementation của generate_ai_response_stream sử dụng async generator
@@ -128,6 +248,10 @@ async def generate_ai_response_stream_impl(
     
     # Initialize RAG service if enabled
     rag_context = ""
+    retrieved_documents = []
+    # Đề bài hiển thị nguyên văn, không cần LLM
+    display_documents = None
+    problem_only = is_problem_display_request(user_message_content)
     is_linear_algebra_question = True  # Giả định mọi câu đều liên quan đến ĐSTT
     
     # Khởi tạo biến cho system message và enhanced prompt
@@ -138,17 +262,22 @@ async def generate_ai_response_stream_impl(
     if settings.rag_enabled and is_linear_algebra_question:
         try:
             logger.info(f"Áp dụng RAG cho câu hỏi ĐSTT")
-            rag_service = RAGService()
+            rag_service = rag_service or await rag_provider.get_service()
             
             # Truy vấn context từ RAG với chat history
             documents, success = await rag_service.get_context_with_history(
                 user_message_content,
                 chat_history=[],  # TODO: Implement chat history properly
-                use_query_metadata=True
+                use_query_metadata=True,
+                problem_only=problem_only
             )
             
-            if success and documents:
+            if success and documents and problem_only and rag_settings.display_fast_path:
+                logger.info(f"Hiển thị nguyên văn {len(documents)} đề bài, bỏ qua LLM")
+                display_documents = documents
+            elif success and documents:
                 logger.info(f"Tìm thấy {len(documents)} tài liệu liên quan")
+                retrieved_documents = documents
                 
                 # Sử dụng template để định dạng context
                 prompt_templates = LinearAlgebraTemplates()
@@ -211,6 +340,10 @@ async def generate_ai_response_stream_impl(
     # Khởi tạo AI service với fallback mechanism
     use_openai = settings.use_openai
     logger.info(f"Configuration: use_openai={use_openai}, rag_enabled={settings.rag_enabled}")
+    # Gemini đang ngắt mạch: dùng OpenAI (nếu có key) thay vì trả lời lỗi
+    if not use_openai and settings.openai_api_key and get_circuit_breaker("llm:gemini").is_open:
+        logger.warning("Gemini circuit is open, using OpenAI instead")
+        use_openai = True
     
     # Tạo system prompt đặc biệt để đảm bảo nội dung LaTeX được bảo toàn
     latex_preservation_prompt = """
@@ -227,18 +360,36 @@ Ví dụ: nếu dữ liệu có "\\begin{matrix}", hãy giữ nguyên không tha
     ai_message_content = ""
     openai_failed = False
     
+    # Đề bài đã được dựng sẵn: stream trực tiếp, không gọi LLM
+    if display_documents is not None:
+        async for chunk in stream_problem_display(display_documents):
+            ai_message_content += chunk
+            if queue:
+                await queue.put(chunk)
+            yield chunk
+
     # Thử OpenAI trước nếu được cấu hình
-    if use_openai:
+    elif use_openai:
         try:
             logger.info("Attempting to use OpenAI service...")
             openai_service = OpenAIService(
                 api_key=settings.openai_api_key,
                 model_name=settings.openai_model_name
             )
+            cache_key, query_vector = answer_cache_context(
+                rag_service, user_message_content, retrieved_documents, settings.openai_model_name, problem_only
+            )
+            flight_key = generation_flight_key(
+                user_message_content, retrieved_documents, settings.openai_model_name, system_message
+            )
             
-            async for chunk in openai_service.generate_stream(
+            async for chunk in generate_stream_with_answer_cache(
+                openai_service,
                 system_message=system_message,
-                user_message=enhanced_prompt
+                user_message=enhanced_prompt,
+                cache_key=cache_key,
+                query_vector=query_vector,
+                flight_key=flight_key
             ):
                 ai_message_content += chunk
                 if queue:
@@ -256,7 +407,7 @@ Ví dụ: nếu dữ liệu có "\\begin{matrix}", hãy giữ nguyên không tha
                 logger.warning(f"OpenAI error: {e}, falling back to Gemini...")
     
     # Sử dụng Gemini nếu OpenAI không được cấu hình hoặc failed
-    if not use_openai or openai_failed:
+    if display_documents is None and (not use_openai or openai_failed):
         try:
             logger.info("Using Gemini service...")
             from ..services.llm.gemini_service import gemini_stream_handler
@@ -302,7 +453,8 @@ async def generate_ai_response_stream(
     user_message_content: str,
     file_ids: List[str] = None,
     db: Session = None,
-    queue: asyncio.Queue = None
+    queue: asyncio.Queue = None,
+    rag_service: Optional[RAGService] = None
 ) -> None:
     """
     Wrapper để gọi generate_ai_response_stream_impl từ asyncio.create_task
@@ -313,13 +465,15 @@ async def generate_ai_response_stream(
         file_ids: Danh sách file IDs
         db: Database session
         queue: Queue để gửi phản hồi
+        rag_service: RAGService dùng chung (lấy từ rag_provider nếu không có)
     """
     async_gen = generate_ai_response_stream_impl(
         chat_id=chat_id,
         user_message_content=user_message_content,
         file_ids=file_ids,
         db=db,
-        queue=queue
+        queue=queue,
+        rag_service=rag_service
     )
     
     try:
@@ -31,6 +31,12 @@ class Settings(BaseSettings):
     rag_enabled: bool = os.getenv("RAG_ENABLED", "True").lower() == "true"
     use_openai: bool = os.getenv("USE_OPENAI", "False").lower() == "true"
 
+    # Circuit breakers (embedding, Qdrant, từng LLM provider)
+    circuit_breaker_error_rate: float = float(os.getenv("CIRCUIT_BREAKER_ERROR_RATE", "0.5"))
+    circuit_breaker_min_calls: int = int(os.getenv("CIRCUIT_BREAKER_MIN_CALLS", "5"))
+    circuit_breaker_window: float = float(os.getenv("CIRCUIT_BREAKER_WINDOW", "60"))
+    circuit_breaker_reset_timeout: float = float(os.getenv("CIRCUIT_BREAKER_RESET_TIMEOUT", "30"))
+
     # File Upload Settings
     upload_dir: str = os.getenv("UPLOAD_DIR", "/tmp/ai-math-chatbot-uploads")
     max_file_size: int = 20 * 1024 * 1024  # 20MB default
@@ -9,9 +9,11 @@ import google.genai.errors
 from sqlalchemy import inspect
 
 from .database import engine, Base
+from .config import get_settings
 # Import models to ensure they are registered with Base
 from . import models # noqa
 from .tasks import start_background_tasks
+from .rag.rag_provider import rag_provider
 
 # Import middleware and exception handlers
 from .middleware import (
@@ -111,4 +113,15 @@ async def startup_event():
     """Start background tasks when the application starts."""
     # Start the background tasks in a separate task
     asyncio.create_task(start_background_tasks())
-    logger.info("Background tasks started.")
\ No newline at end of file
+    logger.info("Background tasks started.")
+
+    # Warm up the shared RAG stack once so the first chat turn doesn't pay for it
+    if get_settings().rag_enabled:
+        await rag_provider.warm_up()
+        # Kiểm tra Qdrant / làm mới chỉ mục chạy nền, không chặn request của người dùng
+        rag_provider.start_health_checks()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Release the shared RAG stack when the application stops."""
+    await rag_provider.close()
\ No newline at end of file
@@ -0,0 +1,132 @@
+"""
+Semantic cache of generated answers for repeated student questions.
+- Context key: LLM model + prompt template version + request intent + ids of the retrieved documents
+- Within one context key, a hit needs cosine(query embedding, cached embedding) >= threshold
+- Size-bounded LRU with TTL; hit/miss counters for monitoring
+- Cached answers are replayed in small chunks so the SSE stream looks like a live generation
+"""
+from __future__ import annotations
+import asyncio
+import itertools
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, AsyncGenerator, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+ContextKey = Tuple[str, str, str, Tuple[str, ...]]
+
+
+def document_ids(documents: Iterable[Any]) -> Tuple[str, ...]:
+    """Định danh ổn định của các documents đã truy xuất (doc_id, hoặc title + số bài)"""
+    ids = []
+    for doc in documents:
+        metadata = getattr(doc, "metadata", None) or {}
+        doc_id = metadata.get("doc_id")
+        if doc_id is None:
+            doc_id = f"{metadata.get('title', '')}#{metadata.get('question_number', '')}"
+        ids.append(str(doc_id))
+    return tuple(ids)
+
+
+class AnswerCache:
+    """
+    Cache câu trả lời theo ngữ nghĩa của câu hỏi và ngữ cảnh RAG đã dùng để sinh câu trả lời
+    """
+
+    def __init__(self, max_size: int = 1000, ttl_seconds: float = 86400.0, threshold: float = 0.97):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.threshold = threshold
+        # entry id -> (context key, thời điểm tạo, embedding đã chuẩn hóa, câu trả lời)
+        self._entries: "OrderedDict[int, Tuple[ContextKey, float, np.ndarray, str]]" = OrderedDict()
+        # context key -> các entry id cùng ngữ cảnh (chỉ so sánh cosine trong nhóm này)
+        self._groups: Dict[ContextKey, List[int]] = {}
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(model: str, template_version: str, intent: str, doc_ids: Iterable[str]) -> ContextKey:
+        # intent: cùng documents nhưng hỏi gợi ý / lời giải / đề bài thì câu trả lời khác nhau
+        return model, template_version, intent, tuple(doc_ids)
+
+    @staticmethod
+    def _normalize(vector: List[float]) -> np.ndarray:
+        array = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(array)
+        return array / norm if norm else array
+
+    def _remove_locked(self, entry_id: int) -> None:
+        key = self._entries.pop(entry_id)[0]
+        group = self._groups.get(key)
+        if group is not None:
+            group.remove(entry_id)
+            if not group:
+                del self._groups[key]
+
+    def get(self, key: ContextKey, query_vector: List[float]) -> Optional[str]:
+        """Câu trả lời đã cache nếu có câu hỏi đủ giống với cùng ngữ cảnh, None nếu không có"""
+        query = self._normalize(query_vector)
+        now = time.monotonic()
+        with self._lock:
+            best_id, best_score = None, self.threshold
+            for entry_id in list(self._groups.get(key, ())):
+                _, created_at, vector, _ = self._entries[entry_id]
+                if now - created_at > self.ttl_seconds:
+                    self._remove_locked(entry_id)
+                    continue
+                score = float(vector @ query)
+                if score >= best_score:
+                    best_id, best_score = entry_id, score
+            if best_id is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(best_id)
+            self.hits += 1
+            return self._entries[best_id][3]
+
+    def put(self, key: ContextKey, query_vector: List[float], answer: str) -> None:
+        if self.max_size <= 0 or not answer:
+            return
+        entry_id = next(self._ids)
+        with self._lock:
+            self._entries[entry_id] = (key, time.monotonic(), self._normalize(query_vector), answer)
+            self._groups.setdefault(key, []).append(entry_id)
+            while len(self._entries) > self.max_size:
+                self._remove_locked(next(iter(self._entries)))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._groups.clear()
+
+    def stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "threshold": self.threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+async def replay_answer(answer: str, chunk_chars: int = 40, delay: float = 0.0) -> AsyncGenerator[str, None]:
+    """
+    Phát lại câu trả lời đã cache theo từng đoạn nhỏ (cắt ở khoảng trắng để không tách giữa từ/công thức)
+    """
+    start = 0
+    while start < len(answer):
+        end = min(start + max(chunk_chars, 1), len(answer))
+        if end < len(answer):
+            space = answer.rfind(" ", start + 1, end + 1)
+            if space > start:
+                end = space + 1
+        yield answer[start:end]
+        start = end
+        if delay > 0:
+            await asyncio.sleep(delay)
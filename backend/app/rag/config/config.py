@@ -4,6 +4,9 @@ from typing import Optional
 from pydantic_settings import BaseSettings
 from pydantic import SecretStr
 
+# Thư mục gốc backend/ (app/rag/config/config.py -> backend/)
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", ".."))
+
 class RAGSettings(BaseSettings):
     """
     Cấu hình cho RAG
@@ -12,15 +15,87 @@ class RAGSettings(BaseSettings):
     qdrant_url: str = os.getenv("QDRANT_URL", "https://04d6214d-bcb9-4473-b540-d5a6eadd16b2.us-east4-0.gcp.cloud.qdrant.io:6333")
     qdrant_api_key: SecretStr = SecretStr(os.getenv("QDRANT_API_KEY", ""))
     qdrant_collection_name: str = os.getenv("QDRANT_COLLECTION_NAME", "math_collection")
+    qdrant_timeout: int = int(os.getenv("QDRANT_TIMEOUT", "60"))
+    # Kết nối dùng chung của AsyncQdrantClient: gRPC nếu bật, ngược lại HTTP/2 với pool kết nối
+    qdrant_prefer_grpc: bool = os.getenv("QDRANT_PREFER_GRPC", "false").lower() == "true"
+    qdrant_http2: bool = os.getenv("QDRANT_HTTP2", "true").lower() == "true"
+    qdrant_pool_size: int = int(os.getenv("QDRANT_POOL_SIZE", "20"))
+
+    # Backend tìm kiếm vector: "qdrant" (Qdrant Cloud) hoặc "local" (snapshot NumPy trong process)
+    vector_backend: str = os.getenv("RAG_VECTOR_BACKEND", "qdrant")
+    local_index_path: str = os.getenv("RAG_LOCAL_INDEX_PATH", os.path.join(BACKEND_DIR, "data", "local_index"))
+    local_index_mmap: bool = os.getenv("RAG_LOCAL_INDEX_MMAP", "false").lower() == "true"
+
+    # Chế độ truy xuất: "dense" (semantic_vector) hoặc "hybrid" (semantic_vector + keyword_vector, RRF)
+    # Hybrid tự chuyển về dense nếu collection chưa có keyword_vector
+    retrieval_mode: str = os.getenv("RAG_RETRIEVAL_MODE", "hybrid")
+    hybrid_prefetch_k: int = int(os.getenv("RAG_HYBRID_PREFETCH_K", "20"))
 
     # Cấu hình embedding
     embedding_model_name: str = os.getenv("EMBEDDING_MODEL_NAME", "text-embedding-3-small")
+
+    # Cache embedding của câu truy vấn (LRU + TTL, trong bộ nhớ)
+    embedding_cache_size: int = int(os.getenv("RAG_EMBEDDING_CACHE_SIZE", "2048"))
+    embedding_cache_ttl: float = float(os.getenv("RAG_EMBEDDING_CACHE_TTL", "86400"))
+
+    # Cache câu trả lời theo ngữ nghĩa (cùng documents truy xuất + cosine câu hỏi >= ngưỡng); size 0 để tắt
+    answer_cache_size: int = int(os.getenv("RAG_ANSWER_CACHE_SIZE", "1000"))
+    answer_cache_ttl: float = float(os.getenv("RAG_ANSWER_CACHE_TTL", "86400"))
+    answer_cache_threshold: float = float(os.getenv("RAG_ANSWER_CACHE_THRESHOLD", "0.97"))
+    # Phát lại câu trả lời đã cache qua SSE: số ký tự mỗi chunk và độ trễ (giây) giữa các chunk
+    answer_cache_replay_chunk_chars: int = int(os.getenv("RAG_ANSWER_CACHE_REPLAY_CHUNK_CHARS", "40"))
+    answer_cache_replay_delay: float = float(os.getenv("RAG_ANSWER_CACHE_REPLAY_DELAY", "0.01"))
+
+    # Yêu cầu chỉ xem đề bài: dựng câu trả lời từ payload và stream trực tiếp, không gọi LLM
+    display_fast_path: bool = os.getenv("RAG_DISPLAY_FAST_PATH", "true").lower() == "true"
+
+    # Gộp các generation giống nhau đang chạy đồng thời (cùng câu hỏi, documents, model) thành một lần gọi LLM
+    single_flight_enabled: bool = os.getenv("RAG_SINGLE_FLIGHT", "true").lower() == "true"
+
+    # Kho embedding trên đĩa (SQLite) dùng chung giữa các worker và script ingest; để trống để tắt
+    embedding_store_path: str = os.getenv(
+        "RAG_EMBEDDING_STORE_PATH", os.path.join(BACKEND_DIR, "data", "embedding_store.sqlite3")
+    )
     
     # Cấu hình retrieval
     top_k: int = int(os.getenv("RAG_TOP_K", "3"))
 
-    # Budget for context assembly (approx tokens)
+    # Chỉ mục tra cứu chính xác số bài trong bộ nhớ: nguồn "qdrant" (scroll), "json" hoặc "off"
+    exact_index_source: str = os.getenv("RAG_EXACT_INDEX_SOURCE", "qdrant")
+    exact_index_json_dir: str = os.getenv(
+        "RAG_EXACT_INDEX_JSON_DIR", os.path.join(os.path.dirname(BACKEND_DIR), "data", "processed", "final")
+    )
+
+    # Chỉ mục BM25 trong bộ nhớ (dựng cùng nguồn với chỉ mục tra cứu chính xác):
+    # "fallback" khi embedding/tìm kiếm vector lỗi, "primary" dùng thay embedding, "off" để tắt
+    lexical_mode: str = os.getenv("RAG_LEXICAL_MODE", "fallback")
+
+    # Bỏ qua LLM MetadataExtractor khi bộ phân loại từ khóa đủ tin cậy; cache metadata theo câu truy vấn
+    intent_confidence_threshold: float = float(os.getenv("RAG_INTENT_CONFIDENCE_THRESHOLD", "0.75"))
+    metadata_cache_size: int = int(os.getenv("RAG_METADATA_CACHE_SIZE", "1024"))
+
+    # Timeout (giây) khi trích xuất metadata bằng LLM (quá hạn dùng parser VN) và khi truy xuất context
+    metadata_extraction_timeout: float = float(os.getenv("RAG_METADATA_TIMEOUT", "2.5"))
+    retrieval_timeout: float = float(os.getenv("RAG_RETRIEVAL_TIMEOUT", "10"))
+
+    # Budget (ms) cho toàn bộ truy xuất của một request, chia cho embedding và từng tầng tìm kiếm (0 = tắt, mặc định);
+    # embedding được tối đa retrieval_embedding_share budget; gửi request dự phòng khi Qdrant chậm hơn p95.
+    # Khi bật, đặt budget lớn hơn p95 của embedding + Qdrant (xem /rag/stats) để không mất context ở đường thường
+    retrieval_budget_ms: float = float(os.getenv("RAG_RETRIEVAL_BUDGET_MS", "0"))
+    retrieval_embedding_share: float = float(os.getenv("RAG_RETRIEVAL_EMBEDDING_SHARE", "0.6"))
+    hedge_requests: bool = os.getenv("RAG_HEDGE_REQUESTS", "true").lower() == "true"
+
+    # Gửi đồng thời các tầng tìm kiếm của get_context trong một query_batch_points
+    concurrent_search_tiers: bool = os.getenv("RAG_CONCURRENT_SEARCH_TIERS", "true").lower() == "true"
+
+    # Số kết quả truy xuất được cache (theo filter + k + câu truy vấn; xóa khi collection đổi phiên bản), 0 = tắt
+    retrieval_cache_size: int = int(os.getenv("RAG_RETRIEVAL_CACHE_SIZE", "512"))
+
+    # Budget for context assembly (tokens, tokenizer: RAG_TOKENIZER_ENCODING)
     context_token_budget: int = int(os.getenv("RAG_CONTEXT_TOKEN_BUDGET", "1800"))
+
+    # Chu kỳ (giây) kiểm tra sức khỏe kết nối Qdrant của RAGService dùng chung
+    health_check_interval: float = float(os.getenv("RAG_HEALTH_CHECK_INTERVAL", "30"))
     
     # Đường dẫn dữ liệu
     data_dir: str = os.getenv("RAG_DATA_DIR", "data/linear_algebra")
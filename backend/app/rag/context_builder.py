@@ -2,11 +2,14 @@
 Context assembly for RAG (semantic-only baseline).
 - Consumes Qdrant points (payload dicts) or LangChain Documents
 - Builds a Vietnamese context with citations (title/source_file/year)
-- Applies a simple character-based budget (approx tokens)
+- Applies a token budget (tiktoken); uses per-field token counts stored at ingestion
+  ("token_counts" payload field) so packing is integer arithmetic, counts at runtime otherwise
 """
 from __future__ import annotations
 from typing import List, Dict, Any, Tuple, Optional, Union
 
+from .token_budget import count_tokens, encoding_id, truncate_to_tokens
+
 
 def _get_payload(item: Any) -> Dict[str, Any]:
     # Supports Qdrant PointStruct (has .payload) or LangChain Document
@@ -23,21 +26,69 @@ def _get_payload(item: Any) -> Dict[str, Any]:
     return {}
 
 
-def _estimate_tokens(text: str) -> int:
-    # Simple heuristic ~4 chars per token
-    return max(1, len(text) // 4)
-
-
-def _truncate_to_tokens(text: str, max_tokens: int) -> str:
-    """Truncate text to approximately max_tokens (heuristic) and add ellipsis if truncated."""
-    if not text or max_tokens <= 0:
-        return ""
-    approx_chars = max_tokens * 4
-    if len(text) <= approx_chars:
-        return text
-    # Reserve a few chars for ellipsis
-    cut = max(0, approx_chars - 3)
-    return (text[:cut].rstrip()) + "..."
+def _problem_texts(payload: Dict[str, Any]) -> Tuple[str, str]:
+    """(dòng đề bài, các dòng ý nhỏ) — ưu tiên natural fields, fallback về raw"""
+    psn = payload.get("problem_statement_natural") or payload.get("problem_statement")
+    statement = f"De bai: {psn}" if psn else ""
+
+    part_lines: List[str] = []
+    ppn = payload.get("problem_parts_natural") or payload.get("problem_parts")
+    if isinstance(ppn, dict):
+        # Keep stable ordering by key when possible
+        for k in sorted(ppn.keys()):
+            v = ppn.get(k)
+            if v:
+                part_lines.append(f"({k}) {v}")
+    return statement, "\n".join(part_lines)
+
+
+def _solution_text(payload: Dict[str, Any]) -> str:
+    """Lời giải đầy đủ + lời giải từng ý (ưu tiên natural, fallback về raw)"""
+    solution_chunks: List[str] = []
+    soln = payload.get("solution_natural")
+    raw_soln = payload.get("solution") if not soln else None
+
+    # Full solution
+    full_sol = None
+    if isinstance(soln, dict):
+        full_sol = soln.get("full_solution")
+    if full_sol is None and isinstance(raw_soln, dict):
+        full_sol = raw_soln.get("full_solution")
+    if full_sol:
+        solution_chunks.append(f"Loi giai: {full_sol}")
+
+    # Solution parts
+    sol_parts = None
+    if isinstance(soln, dict):
+        sol_parts = soln.get("solution_parts")
+    if sol_parts is None and isinstance(raw_soln, dict):
+        sol_parts = raw_soln.get("solution_parts")
+    if isinstance(sol_parts, dict):
+        for k in sorted(sol_parts.keys()):
+            v = sol_parts.get(k)
+            if v:
+                solution_chunks.append(f"({k}) {v}")
+
+    return "\n".join(solution_chunks).strip()
+
+
+def payload_token_counts(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Số token của từng phần context (problem, parts, solution); ingestion lưu vào payload["token_counts"]"""
+    statement, parts = _problem_texts(payload)
+    return {
+        "encoding": encoding_id(),
+        "problem": count_tokens(statement),
+        "parts": count_tokens(parts),
+        "solution": count_tokens(_solution_text(payload)),
+    }
+
+
+def _token_counts(payload: Dict[str, Any]) -> Dict[str, Any]:
+    # Chỉ dùng số token đã lưu nếu được đếm bằng cùng tokenizer
+    counts = payload.get("token_counts")
+    if isinstance(counts, dict) and counts.get("encoding") == encoding_id():
+        return counts
+    return payload_token_counts(payload)
 
 
 def assemble_context(points: List[Any], budget_tokens: int = 1200) -> Tuple[str, List[Dict[str, Any]]]:
@@ -79,65 +130,27 @@ def assemble_context(points: List[Any], budget_tokens: int = 1200) -> Tuple[str,
             cite.append(f"year={year}")
         header = " | ".join(cite)
 
-        # Build problem text (prefer natural fields, fallback to raw)
-        problem_chunks: List[str] = []
-        psn = payload.get("problem_statement_natural") or payload.get("problem_statement")
-        if psn:
-            problem_chunks.append(f"De bai: {psn}")
-
-        ppn = payload.get("problem_parts_natural") or payload.get("problem_parts")
-        if isinstance(ppn, dict):
-            # Keep stable ordering by key when possible
-            for k in sorted(ppn.keys()):
-                v = ppn.get(k)
-                if v:
-                    problem_chunks.append(f"({k}) {v}")
-
-        problem_text = "\n".join(problem_chunks).strip()
-
-        # Build solution text (prefer natural, fallback to raw)
-        solution_chunks: List[str] = []
-        soln = payload.get("solution_natural")
-        raw_soln = payload.get("solution") if not soln else None
-
-        # Full solution
-        full_sol = None
-        if isinstance(soln, dict):
-            full_sol = soln.get("full_solution")
-        if full_sol is None and isinstance(raw_soln, dict):
-            full_sol = raw_soln.get("full_solution")
-        if full_sol:
-            solution_chunks.append(f"Loi giai: {full_sol}")
-
-        # Solution parts
-        sol_parts = None
-        if isinstance(soln, dict):
-            sol_parts = soln.get("solution_parts")
-        if sol_parts is None and isinstance(raw_soln, dict):
-            sol_parts = raw_soln.get("solution_parts")
-        if isinstance(sol_parts, dict):
-            for k in sorted(sol_parts.keys()):
-                v = sol_parts.get(k)
-                if v:
-                    solution_chunks.append(f"({k}) {v}")
-
-        solution_text = "\n".join(solution_chunks).strip()
+        statement, parts = _problem_texts(payload)
+        problem_text = "\n".join(text for text in (statement, parts) if text).strip()
+        solution_text = _solution_text(payload)
 
         # Skip if no content at all
         if not problem_text and not solution_text:
             continue
 
-        # Compute header cost
-        header_cost = _estimate_tokens(header) if header else 0
+        counts = _token_counts(payload)
 
         # Always try to include header (if any)
         piece_lines: List[str] = []
+        header_cost = 0
         if header:
             piece_lines.append(f"### {header}")
+            header_cost = count_tokens(piece_lines[0])
 
-        # Attempt to include full problem first
-        problem_cost = _estimate_tokens(problem_text) if problem_text else 0
+        # Attempt to include full problem first (dòng đề + các ý, nối bằng một "\n")
+        problem_cost = counts["problem"] + counts["parts"] + (1 if statement and parts else 0)
         available = max(0, remaining - header_cost)
+        initial_available = available
 
         if problem_text:
             if problem_cost <= available:
@@ -145,7 +158,7 @@ def assemble_context(points: List[Any], budget_tokens: int = 1200) -> Tuple[str,
                 available -= problem_cost
             else:
                 # Truncate problem as last resort
-                truncated = _truncate_to_tokens(problem_text, available)
+                truncated = truncate_to_tokens(problem_text, available)
                 if truncated:
                     piece_lines.append(truncated)
                     available = 0
@@ -155,13 +168,13 @@ def assemble_context(points: List[Any], budget_tokens: int = 1200) -> Tuple[str,
 
         # Then include solution, truncate only if needed
         if solution_text and available > 0:
-            sol_cost = _estimate_tokens(solution_text)
+            sol_cost = counts["solution"]
             if sol_cost <= available:
                 piece_lines.append("")
                 piece_lines.append(solution_text)
                 available -= sol_cost
             else:
-                truncated_sol = _truncate_to_tokens(solution_text, available)
+                truncated_sol = truncate_to_tokens(solution_text, available)
                 if truncated_sol:
                     piece_lines.append("")
                     piece_lines.append(truncated_sol)
@@ -172,11 +185,8 @@ def assemble_context(points: List[Any], budget_tokens: int = 1200) -> Tuple[str,
             lines.extend(piece_lines)
             lines.append("")
             used_payloads.append(payload)
-            # Update remaining after we used header + (problem/solution) tokens
-            used_cost = header_cost + (problem_cost if problem_cost <= (remaining - header_cost) else _estimate_tokens(piece_lines[-1]))
-            # Conservative: recompute remaining using text we actually appended
-            appended_text = "\n".join(piece_lines)
-            remaining -= _estimate_tokens(appended_text)
+            # header + nội dung đã dùng + một token xuống dòng cho mỗi dòng của piece
+            remaining -= header_cost + (initial_available - available) + len(piece_lines)
 
         if remaining <= 0:
             break
@@ -0,0 +1,98 @@
+"""
+Pre-rendered per-document context fragments.
+- problem_block: <metadata> + <problem> XML of LinearAlgebraTemplates.format_document_for_context
+- solution_block: <solution_hints> / <solution> XML (omitted for problem-only requests)
+- display_block: DISPLAY MODE markdown of problem_renderer.render_problem
+- Rendered once at ingestion (deterministic per document), stored in the payload with
+  fragments_version; rendered on the fly when missing or outdated
+"""
+from __future__ import annotations
+from typing import Any, Dict, Optional
+
+# Tăng mỗi khi đổi định dạng fragment: payload cũ sẽ được render lại lúc chạy cho tới khi ingest lại
+FRAGMENT_VERSION = "2"
+
+FRAGMENT_FIELDS = ["problem_block", "solution_block", "display_block"]
+
+
+def render_problem_block(metadata: Dict[str, Any], page_content: str = "") -> str:
+    """Khối <metadata> + <problem> của một document"""
+    # 1. Phần Metadata
+    formatted_str = "<metadata>\n"
+    source_info = {
+        "title": metadata.get("title", "N/A"),
+        "source": metadata.get("source_school") or metadata.get("source", "N/A"),
+        "year": metadata.get("year", "N/A"),
+        "question_number": metadata.get("question_number", "N/A"),
+        "category": metadata.get("category", "N/A"),
+        "subcategory": metadata.get("subcategory", "N/A"),
+        "problem_section": metadata.get("problem_section", "N/A")
+    }
+    for key, value in source_info.items():
+        formatted_str += f"  <{key}>{value}</{key}>\n"
+    formatted_str += "</metadata>\n"
+
+    # 2. Phần Đề bài (Problem) - hỗ trợ cả cấu trúc mới và cũ
+    problem_statement = metadata.get('problem_statement')
+    problem_parts = metadata.get('problem_parts', {})
+
+    if problem_statement:
+        # Cấu trúc mới: có problem_statement riêng
+        problem_content = problem_statement
+
+        # Thêm problem_parts nếu có
+        if problem_parts and isinstance(problem_parts, dict):
+            problem_content += "\n\n"
+            for part_key, part_content in problem_parts.items():
+                problem_content += f"\n**({part_key})** {part_content}\n"
+
+        formatted_str += f"<problem>\n{problem_content}\n</problem>\n"
+    else:
+        # Cấu trúc cũ: lấy từ content trong metadata hoặc page_content
+        old_content = metadata.get('content') or page_content
+        formatted_str += f"<problem>\n{old_content}\n</problem>\n"
+    return formatted_str
+
+
+def render_solution_block(metadata: Dict[str, Any]) -> str:
+    """Khối <solution_hints> (cấu trúc mới) hoặc <solution> (cấu trúc cũ), rỗng nếu không có lời giải"""
+    solution_data = metadata.get('solution', {})
+    if solution_data and isinstance(solution_data, dict):
+        solution_content = solution_data.get('full_solution', '')
+        solution_parts = solution_data.get('solution_parts', {})
+
+        if solution_content or solution_parts:
+            if solution_parts and isinstance(solution_parts, dict):
+                solution_content += "\n\n**Gợi ý từng phần:**\n"
+                for part_key, part_solution in solution_parts.items():
+                    solution_content += f"**Phần {part_key}:** {part_solution}\n"
+            return f"<solution_hints>\n{solution_content}\n</solution_hints>\n"
+        return ""
+
+    # Fallback cho cấu trúc cũ
+    solution = metadata.get("suggested_solution")
+    if solution:
+        return f"<solution>\n{solution}\n</solution>\n"
+    return ""
+
+
+def render_fragments(payload: Dict[str, Any], page_content: str = "") -> Dict[str, Any]:
+    """Các fragment để ingestion ghi vào payload (kèm phiên bản)"""
+    from types import SimpleNamespace
+    from .problem_renderer import render_problem
+
+    fragments = {
+        "problem_block": render_problem_block(payload, page_content),
+        "solution_block": render_solution_block(payload),
+        "display_block": render_problem(SimpleNamespace(metadata=payload, page_content=page_content)),
+    }
+    fragments["fragments_version"] = FRAGMENT_VERSION
+    return fragments
+
+
+def stored_fragment(metadata: Optional[Dict[str, Any]], name: str) -> Optional[str]:
+    """Fragment đã render sẵn trong payload, None nếu chưa có hoặc khác phiên bản"""
+    if not metadata or metadata.get("fragments_version") != FRAGMENT_VERSION:
+        return None
+    fragment = metadata.get(name)
+    return fragment if isinstance(fragment, str) else None
@@ -0,0 +1,72 @@
+"""
+In-memory LRU + TTL cache for query embeddings.
+- Key: normalize_text(query) + embedding model name
+- Vectors stored as float32 numpy arrays (~4x smaller than lists of Python floats)
+- Hit/miss counters for monitoring
+"""
+from __future__ import annotations
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .query_extractor_vn import normalize_text
+
+
+class EmbeddingCache:
+    """
+    Cache LRU có giới hạn kích thước và thời gian sống cho embedding của câu truy vấn
+    """
+
+    def __init__(self, max_size: int = 2048, ttl_seconds: float = 86400.0):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, np.ndarray]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(query: str, model: str) -> Tuple[str, str]:
+        return normalize_text(query or ""), model
+
+    def get(self, query: str, model: str) -> Optional[List[float]]:
+        """Trả về vector nếu còn hạn, None nếu không có trong cache"""
+        key = self.make_key(query, model)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or now - entry[0] > self.ttl_seconds:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1].tolist()
+
+    def put(self, query: str, model: str, vector: List[float]) -> None:
+        if self.max_size <= 0:
+            return
+        key = self.make_key(query, model)
+        with self._lock:
+            self._entries[key] = (time.monotonic(), np.asarray(vector, dtype=np.float32))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
@@ -0,0 +1,110 @@
+"""
+Persistent embedding store shared by backend workers and ingestion scripts.
+- SQLite (WAL mode) so several uvicorn workers and CLI scripts can read/write concurrently
+- Key: sha256(model + normalised text), vectors stored as float32 blobs; callers pass raw text,
+  normalisation (NFC, lowercase, collapsed whitespace) happens here so backend and ingestion share entries
+- Only depends on the standard library and numpy; safe to import from data/scripts
+"""
+from __future__ import annotations
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from typing import Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingStore:
+    """
+    Kho embedding trên đĩa, dùng chung giữa các process
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self.hits = 0
+        self.misses = 0
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._connect().execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                content_key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                dim INTEGER NOT NULL,
+                vector BLOB NOT NULL,
+                created_at REAL NOT NULL
+            )
+            """
+        )
+
+    def _connect(self) -> sqlite3.Connection:
+        # sqlite3 connection không dùng chung được giữa các thread
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def normalize_key_text(text: str) -> str:
+        """Dạng chuẩn của text dùng làm khóa (mọi process ghi/đọc cùng một khóa cho cùng nội dung)"""
+        return " ".join(unicodedata.normalize("NFC", text or "").lower().split())
+
+    @classmethod
+    def content_key(cls, text: str, model: str) -> str:
+        return hashlib.sha256(f"{model}\x00{cls.normalize_key_text(text)}".encode("utf-8")).hexdigest()
+
+    def get(self, text: str, model: str) -> Optional[List[float]]:
+        """Trả về vector đã lưu hoặc None"""
+        try:
+            row = self._connect().execute(
+                "SELECT vector FROM embeddings WHERE content_key = ?",
+                (self.content_key(text, model),)
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"Embedding store read failed: {e}")
+            return None
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return np.frombuffer(row[0], dtype=np.float32).tolist()
+
+    def put(self, text: str, model: str, vector: List[float]) -> None:
+        array = np.asarray(vector, dtype=np.float32)
+        try:
+            self._connect().execute(
+                "INSERT OR REPLACE INTO embeddings (content_key, model, dim, vector, created_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (self.content_key(text, model), model, int(array.shape[0]), array.tobytes(), time.time())
+            )
+        except sqlite3.Error as e:
+            logger.warning(f"Embedding store write failed: {e}")
+
+    def stats(self) -> Dict[str, float]:
+        try:
+            size = self._connect().execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        except sqlite3.Error:
+            size = None
+        total = self.hits + self.misses
+        return {
+            "size": size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+    def close(self) -> None:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
@@ -0,0 +1,215 @@
+"""
+In-process exact-lookup index for question_number / problem_section queries.
+- Key: (category, subcategory, year, field, value); missing parts of a filter act as wildcards
+- Built from a Qdrant scroll of the collection, or from data/processed/final/**/*.json
+- Rebuilt when the collection fingerprint (points_count + collection metadata) changes
+- Lookups are plain dict hits: no embedding call, no network round trip
+"""
+from __future__ import annotations
+import glob
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+try:
+    from langchain_core.documents import Document
+except ImportError:
+    # Fallback for development environment
+    class Document:
+        def __init__(self, page_content: str = "", metadata: dict = None):
+            self.page_content = page_content
+            self.metadata = metadata or {}
+
+from .payload_fields import has_current_fragments, project_payload, resolve_fields
+
+logger = logging.getLogger(__name__)
+
+EXACT_FIELDS = ("question_number", "problem_section")
+
+# Trường chỉ dùng khi ingest, không cần giữ trong bộ nhớ
+_DROPPED_PAYLOAD_FIELDS = ("embedding_text",)
+
+IndexKey = Tuple[Optional[str], Optional[str], Optional[str], str, str]
+
+
+def _norm(value: Any) -> Optional[str]:
+    if value is None or value == "":
+        return None
+    return str(value).strip()
+
+
+def extract_problem_section(question_number: str, category: str) -> str:
+    """Giống data/scripts/import_to_qdrant_hybrid.py: baitap lấy phần trước dấu chấm"""
+    if not question_number:
+        return ""
+    if category == "baitap" and "." in question_number:
+        return question_number.split(".")[0].strip()
+    return question_number.strip()
+
+
+def payload_from_processed_item(item: Dict[str, Any]) -> Dict[str, Any]:
+    """Dựng payload (cùng schema với Qdrant, thiếu các trường *_natural) từ một item JSON đã xử lý"""
+    metadata = item.get("metadata", {}) or {}
+    question_number = item.get("question_number", "") or ""
+    return {
+        "doc_id": item.get("id"),
+        "source_file": metadata.get("source_file"),
+        "category": item.get("category"),
+        "subcategory": item.get("subcategory"),
+        "metadata": metadata,
+        "latex_string": item.get("problem_statement", ""),
+        "title": item.get("title"),
+        "question_number": question_number,
+        "source_path": item.get("source_path"),
+        "problem_statement": item.get("problem_statement", ""),
+        "problem_parts": item.get("problem_parts", {}),
+        "solution": item.get("solution", {}),
+        "problem_section": extract_problem_section(question_number, item.get("category", "")),
+    }
+
+
+def load_processed_payloads(data_dir: str) -> Tuple[List[Dict[str, Any]], int]:
+    """
+    Đọc payload từ data/processed/final/**/*.json
+
+    Returns:
+        Tuple[List[Dict[str, Any]], int]: (payloads, số file JSON đã đọc)
+    """
+    json_files = glob.glob(os.path.join(data_dir, "**", "*.json"), recursive=True)
+    json_files = [f for f in json_files if "processing_summary.json" not in f]
+    payloads = []
+    for json_file in json_files:
+        try:
+            with open(json_file, "r", encoding="utf-8") as f:
+                payloads.extend(payload_from_processed_item(item) for item in json.load(f))
+        except Exception as e:
+            logger.warning(f"Could not read processed data {json_file}: {e}")
+    return payloads, len(json_files)
+
+
+class ExactLookupIndex:
+    """
+    Chỉ mục tra cứu chính xác đề bài theo (category, subcategory, year, số bài/section)
+    """
+
+    def __init__(self):
+        self._entries: Dict[IndexKey, List[Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+        self.fingerprint: Optional[Tuple[Any, ...]] = None
+        self.size = 0
+        self.built_at: Optional[float] = None
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def ready(self) -> bool:
+        return self.built_at is not None
+
+    def build(self, payloads: Iterable[Dict[str, Any]], fingerprint: Optional[Tuple[Any, ...]] = None) -> int:
+        """
+        Dựng lại toàn bộ chỉ mục từ danh sách payload
+
+        Returns:
+            int: Số payload đã đưa vào chỉ mục
+        """
+        entries: Dict[IndexKey, List[Dict[str, Any]]] = {}
+        count = 0
+        for payload in payloads:
+            if not payload:
+                continue
+            payload = {k: v for k, v in payload.items() if k not in _DROPPED_PAYLOAD_FIELDS}
+            category = _norm(payload.get("category"))
+            subcategory = _norm(payload.get("subcategory"))
+            year = _norm((payload.get("metadata") or {}).get("year"))
+            indexed = False
+            for field in EXACT_FIELDS:
+                value = _norm(payload.get(field))
+                if value is None:
+                    continue
+                # Ghi dưới mọi tổ hợp wildcard để filter thiếu năm/bảng vẫn tra được O(1)
+                for cat, sub, yr in itertools.product((category, None), (subcategory, None), (year, None)):
+                    entries.setdefault((cat, sub, yr, field, value), []).append(payload)
+                indexed = True
+            count += indexed
+        with self._lock:
+            self._entries = entries
+            self.fingerprint = fingerprint
+            self.size = count
+            self.built_at = time.time()
+        logger.info(f"Exact lookup index built with {count} problems ({len(entries)} keys)")
+        return count
+
+    def build_from_json(self, data_dir: str) -> int:
+        """Dựng chỉ mục từ data/processed/final/**/*.json"""
+        payloads, file_count = load_processed_payloads(data_dir)
+        return self.build(payloads, fingerprint=("json", file_count, len(payloads)))
+
+    @staticmethod
+    def key_for_filter(filter: Dict[str, Any]) -> Optional[IndexKey]:
+        """Khóa tra cứu cho filter của STRATEGY 1, None nếu filter có điều kiện ngoài chỉ mục"""
+        for field in EXACT_FIELDS:
+            if field in filter:
+                if set(filter) - {field, "category", "subcategory", "year"}:
+                    return None
+                value = _norm(filter[field])
+                if value is None:
+                    return None
+                return (
+                    _norm(filter.get("category")),
+                    _norm(filter.get("subcategory")),
+                    _norm(filter.get("year")),
+                    field,
+                    value,
+                )
+        return None
+
+    def lookup(self, filter: Dict[str, Any], k: int, fields: Optional[Sequence[str]] = None) -> Optional[List[Document]]:
+        """
+        Tra cứu chính xác theo filter (fields: field set hoặc danh sách trường payload cần giữ)
+
+        Returns:
+            Optional[List[Document]]: Documents nếu khớp không quá k đề bài;
+            None nếu chỉ mục chưa sẵn sàng, filter không hỗ trợ hoặc cần xếp hạng bằng vector
+        """
+        if not self.ready:
+            return None
+        key = self.key_for_filter(filter)
+        if key is None:
+            return None
+        matches = self._entries.get(key)
+        if not matches or len(matches) > k:
+            # Không có hoặc quá nhiều đề khớp: để tìm kiếm vector xử lý (và xếp hạng)
+            self.misses += 1
+            return None
+        self.hits += 1
+        documents = []
+        for payload in matches:
+            metadata = project_payload(payload, resolve_fields(fields, fragments=has_current_fragments(payload)))
+            metadata["score"] = 1.0
+            documents.append(Document(
+                page_content=(
+                    payload.get("problem_statement_natural")
+                    or payload.get("natural_language_desc")
+                    or payload.get("latex_string")
+                    or payload.get("problem_statement")
+                    or ""
+                ),
+                metadata=metadata
+            ))
+        return documents
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "ready": self.ready,
+            "size": self.size,
+            "keys": len(self._entries),
+            "built_at": self.built_at,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
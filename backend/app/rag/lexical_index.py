@@ -0,0 +1,195 @@
+"""
+In-process BM25 index over the problem corpus (no embedding call, no network).
+- Text: title + problem_statement_natural (or problem_statement) + latex_string
+- Tokens from text_tokenizer.tokenize: accent-insensitive Vietnamese, LaTeX commands, bigrams
+- Postings per token: doc ids as array('I') and term frequencies as array('H'), scored with NumPy
+- Built from the same collection snapshot as the exact-lookup index
+"""
+from __future__ import annotations
+import logging
+import math
+import threading
+import time
+from array import array
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+try:
+    from langchain_core.documents import Document
+except ImportError:
+    # Fallback for development environment
+    class Document:
+        def __init__(self, page_content: str = "", metadata: dict = None):
+            self.page_content = page_content
+            self.metadata = metadata or {}
+
+from .local_vector_index import filter_columns, filter_mask
+from .payload_fields import has_current_fragments, project_payload, resolve_fields
+from .text_tokenizer import BM25_B, BM25_K1, tokenize
+
+logger = logging.getLogger(__name__)
+
+# Trường payload được đánh chỉ mục (ngoài các trường cần để trả về kết quả)
+LEXICAL_TEXT_FIELDS = ["title", "problem_statement_natural", "problem_statement", "latex_string"]
+
+# Giới hạn của array('H')
+_MAX_TF = 65535
+
+
+def lexical_text(payload: Dict[str, Any]) -> str:
+    """Văn bản được đánh chỉ mục của một đề bài"""
+    parts = [
+        payload.get("title") or "",
+        payload.get("problem_statement_natural") or payload.get("problem_statement") or "",
+    ]
+    latex = payload.get("latex_string") or ""
+    if latex and latex not in parts:
+        parts.append(latex)
+    return "\n".join(part for part in parts if part)
+
+
+class LexicalIndex:
+    """
+    Chỉ mục BM25 trong bộ nhớ, dùng làm tầng truy xuất không tốn API embedding
+    """
+
+    def __init__(self, k1: float = BM25_K1, b: float = BM25_B):
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, Tuple[array, array]] = {}
+        self._payloads: List[Dict[str, Any]] = []
+        self._doc_len = np.zeros(0, dtype=np.float32)
+        self._avg_doc_len = 0.0
+        self._codes: Dict[str, np.ndarray] = {}
+        self._vocab: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+        self.fingerprint: Optional[Tuple[Any, ...]] = None
+        self.built_at: Optional[float] = None
+        self.searches = 0
+
+    @property
+    def ready(self) -> bool:
+        return self.built_at is not None and len(self._payloads) > 0
+
+    def __len__(self) -> int:
+        return len(self._payloads)
+
+    def build(self, payloads: Iterable[Dict[str, Any]], fingerprint: Optional[Tuple[Any, ...]] = None) -> int:
+        """
+        Dựng lại toàn bộ chỉ mục từ danh sách payload
+
+        Returns:
+            int: Số tài liệu đã đưa vào chỉ mục
+        """
+        start_time = time.time()
+        doc_ids: Dict[str, array] = {}
+        tfs: Dict[str, array] = {}
+        kept: List[Dict[str, Any]] = []
+        lengths = array("I")
+        for payload in payloads:
+            tokens = tokenize(lexical_text(payload or {}))
+            if not tokens:
+                continue
+            doc_id = len(kept)
+            kept.append(payload)
+            lengths.append(len(tokens))
+            for token, tf in Counter(tokens).items():
+                if token not in doc_ids:
+                    doc_ids[token] = array("I")
+                    tfs[token] = array("H")
+                doc_ids[token].append(doc_id)
+                tfs[token].append(min(tf, _MAX_TF))
+
+        # Cột filter mã hóa từ điển, cùng ngữ nghĩa với LocalVectorIndex
+        codes, vocabs = filter_columns(kept)
+
+        doc_len = np.frombuffer(lengths, dtype=np.uint32).astype(np.float32)
+        with self._lock:
+            self._postings = {token: (doc_ids[token], tfs[token]) for token in doc_ids}
+            self._payloads = kept
+            self._doc_len = doc_len
+            self._avg_doc_len = float(doc_len.mean()) if len(kept) else 0.0
+            self._codes = codes
+            self._vocab = vocabs
+            self.fingerprint = fingerprint
+            self.built_at = time.time()
+        logger.info(f"Lexical index built with {len(kept)} documents, {len(doc_ids)} terms "
+                    f"in {time.time() - start_time:.2f}s")
+        return len(kept)
+
+    def _mask(self, filter: Optional[Dict[str, Any]]) -> Optional[np.ndarray]:
+        """Mặt nạ boolean cho filter dạng dict (xem filter_mask)"""
+        return filter_mask(filter, self._payloads, self._codes, self._vocab)
+
+    def search(self, query: str, k: int = 5, filter: Optional[Dict[str, Any]] = None,
+               fields: Optional[Sequence[str]] = None) -> List[Document]:
+        """
+        Top-k theo BM25 trong các tài liệu thỏa filter
+
+        Args:
+            query: Câu truy vấn
+            k: Số lượng kết quả
+            filter: Bộ lọc metadata (dạng dict của RAGService)
+            fields: Field set hoặc danh sách trường payload cần giữ trong metadata
+        """
+        if not self.ready or k <= 0:
+            return []
+        self.searches += 1
+        with self._lock:
+            postings = self._postings
+            payloads = self._payloads
+            doc_len = self._doc_len
+            avg_doc_len = self._avg_doc_len
+            mask = self._mask(filter)
+
+        n_docs = len(payloads)
+        scores = np.zeros(n_docs, dtype=np.float32)
+        norm = self.k1 * (1 - self.b + self.b * doc_len / avg_doc_len)
+        for token in set(tokenize(query)):
+            posting = postings.get(token)
+            if posting is None:
+                continue
+            docs = np.frombuffer(posting[0], dtype=np.uint32)
+            tf = np.frombuffer(posting[1], dtype=np.uint16).astype(np.float32)
+            df = docs.shape[0]
+            idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+            # Mỗi tài liệu xuất hiện đúng một lần trong posting nên cộng trực tiếp được
+            scores[docs] += idf * tf * (self.k1 + 1) / (tf + norm[docs])
+
+        if mask is not None:
+            scores[~mask] = 0.0
+        candidates = np.flatnonzero(scores > 0)
+        if candidates.size == 0:
+            return []
+        if candidates.size > k:
+            candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+        candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+
+        documents = []
+        for row in candidates:
+            payload = payloads[row]
+            metadata = project_payload(payload, resolve_fields(fields, fragments=has_current_fragments(payload)))
+            metadata["score"] = float(scores[row])
+            metadata["_retrieval"] = "lexical"
+            documents.append(Document(
+                page_content=(
+                    payload.get("problem_statement_natural")
+                    or payload.get("natural_language_desc")
+                    or payload.get("latex_string")
+                    or payload.get("problem_statement")
+                    or ""
+                ),
+                metadata=metadata
+            ))
+        return documents
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "ready": self.ready,
+            "documents": len(self._payloads),
+            "terms": len(self._postings),
+            "built_at": self.built_at,
+            "searches": self.searches,
+        }
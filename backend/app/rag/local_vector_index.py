@@ -0,0 +1,275 @@
+"""
+Embedded vector search over a snapshot of the Qdrant collection.
+- Normalised float32 matrix of `semantic_vector` (in RAM or memory-mapped .npy)
+- Columnar, dictionary-encoded filter arrays: category, subcategory, year, question_number, problem_section
+- Brute-force (blocked) cosine top-k with a filter mask; filter-only scroll; no network, works offline
+- Snapshot = directory with vectors.npy, payloads.json, manifest.json (see export_snapshot)
+"""
+from __future__ import annotations
+import json
+import logging
+import os
+import time
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+VECTORS_FILE = "vectors.npy"
+PAYLOADS_FILE = "payloads.json"
+MANIFEST_FILE = "manifest.json"
+
+# Các trường filter được mã hóa thành cột (payload path -> tên filter)
+COLUMN_FIELDS = {
+    "category": ("category",),
+    "subcategory": ("subcategory",),
+    "year": ("metadata", "year"),
+    "question_number": ("question_number",),
+    "problem_section": ("problem_section",),
+}
+
+# Trường payload mà filter_mask đọc (chỉ mục dựng từ payload đã chiếu phải giữ các trường này)
+FILTER_PAYLOAD_FIELDS = [
+    "category", "subcategory", "metadata", "question", "question_number", "problem_section", "topic", "tags",
+]
+
+
+class LocalPoint(NamedTuple):
+    """Kết quả tìm kiếm có cùng dạng với ScoredPoint của Qdrant"""
+    id: Any
+    payload: Dict[str, Any]
+    score: Optional[float]  # None cho scroll (không tính điểm)
+
+
+def _column_value(payload: Dict[str, Any], path: Tuple[str, ...]) -> Optional[str]:
+    value: Any = payload
+    for part in path:
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    if value is None or value == "":
+        return None
+    return str(value).strip()
+
+
+def _matches(payload_value: Any, value: Any) -> bool:
+    # Giống MatchValue của Qdrant: trường mảng khớp nếu có một phần tử bằng value
+    if isinstance(payload_value, list):
+        return value in payload_value
+    return payload_value == value
+
+
+def filter_columns(payloads: List[Dict[str, Any]]) -> Tuple[Dict[str, np.ndarray], Dict[str, Dict[str, int]]]:
+    """Cột filter mã hóa từ điển (COLUMN_FIELDS) cho filter_mask"""
+    codes: Dict[str, np.ndarray] = {}
+    vocabs: Dict[str, Dict[str, int]] = {}
+    for name, path in COLUMN_FIELDS.items():
+        vocab: Dict[str, int] = {}
+        column = np.full(len(payloads), -1, dtype=np.int32)
+        for row, payload in enumerate(payloads):
+            value = _column_value(payload, path)
+            if value is not None:
+                column[row] = vocab.setdefault(value, len(vocab))
+        codes[name] = column
+        vocabs[name] = vocab
+    return codes, vocabs
+
+
+def filter_mask(filter: Optional[Dict[str, Any]], payloads: List[Dict[str, Any]],
+                codes: Dict[str, np.ndarray], vocabs: Dict[str, Dict[str, int]]) -> Optional[np.ndarray]:
+    """
+    Mặt nạ boolean cho filter dạng dict, cùng ngữ nghĩa với QdrantConnector._build_search_filter
+    (dùng chung cho LocalVectorIndex và LexicalIndex); None nếu không có filter
+    """
+    if not filter:
+        return None
+    mask = np.ones(len(payloads), dtype=bool)
+    for key, value in filter.items():
+        # Bỏ qua trường không có giá trị (như _build_search_filter)
+        if value is None or value == "" or value == []:
+            continue
+        if key == "question":
+            # should: question hoặc question_number
+            q_value = str(value).strip()
+            rows = np.flatnonzero(mask)
+            mask[rows] = [
+                _matches(payloads[row].get("question"), q_value)
+                or _matches(payloads[row].get("question_number"), q_value)
+                for row in rows
+            ]
+        elif key == "level":
+            topic = f"đề thi bảng {value.upper() if isinstance(value, str) else value}"
+            rows = np.flatnonzero(mask)
+            mask[rows] = [_matches(payloads[row].get("topic"), topic) for row in rows]
+        elif key in codes:
+            code = vocabs[key].get(str(value).strip(), -2)
+            mask &= codes[key] == code
+        elif key == "tags" and isinstance(value, list):
+            # should: khớp nếu có ít nhất một tag
+            rows = np.flatnonzero(mask)
+            mask[rows] = [any(_matches(payloads[row].get("tags"), tag) for tag in value) for row in rows]
+        else:
+            rows = np.flatnonzero(mask)
+            mask[rows] = [_matches(payloads[row].get(key), value) for row in rows]
+        if not mask.any():
+            break
+    return mask
+
+
+class LocalVectorIndex:
+    """
+    Chỉ mục vector cục bộ, thay thế Qdrant Cloud cho truy vấn semantic_vector
+    """
+
+    def __init__(self, ids: List[Any], vectors: np.ndarray, payloads: List[Dict[str, Any]],
+                 manifest: Optional[Dict[str, Any]] = None, block_size: int = 8192):
+        if len(ids) != vectors.shape[0] or len(payloads) != vectors.shape[0]:
+            raise ValueError("ids, vectors and payloads must have the same length")
+        self.ids = ids
+        self.vectors = vectors
+        self.payloads = payloads
+        self.manifest = manifest or {}
+        self.block_size = block_size
+        self._codes, self._vocab = filter_columns(payloads)
+
+    def __len__(self) -> int:
+        return self.vectors.shape[0]
+
+    @property
+    def dim(self) -> int:
+        return int(self.vectors.shape[1])
+
+    @property
+    def fingerprint(self) -> Tuple[Any, ...]:
+        return ("local", self.manifest.get("points_count", len(self)), self.manifest.get("exported_at"))
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = False) -> "LocalVectorIndex":
+        """Nạp snapshot; mmap=True để ánh xạ ma trận vector từ đĩa thay vì đọc vào RAM"""
+        start_time = time.time()
+        vectors = np.load(os.path.join(path, VECTORS_FILE), mmap_mode="r" if mmap else None)
+        with open(os.path.join(path, PAYLOADS_FILE), "r", encoding="utf-8") as f:
+            records = json.load(f)
+        manifest = {}
+        manifest_path = os.path.join(path, MANIFEST_FILE)
+        if os.path.exists(manifest_path):
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+        index = cls(
+            ids=[record["id"] for record in records],
+            vectors=vectors,
+            payloads=[record.get("payload") or {} for record in records],
+            manifest=manifest,
+        )
+        logger.info(f"Loaded local vector index from {path}: {len(index)} points, "
+                    f"dim={index.dim}, mmap={mmap} in {time.time() - start_time:.2f}s")
+        return index
+
+    @staticmethod
+    def export_snapshot(client, collection_name: str, path: str,
+                        vector_name: str = "semantic_vector", batch_size: int = 256) -> int:
+        """
+        Xuất collection Qdrant ra snapshot cục bộ (dùng QdrantClient đồng bộ)
+
+        Returns:
+            int: Số point đã xuất
+        """
+        ids, payloads, rows = [], [], []
+        offset = None
+        while True:
+            records, offset = client.scroll(
+                collection_name=collection_name,
+                limit=batch_size,
+                offset=offset,
+                with_payload=True,
+                with_vectors=[vector_name],
+            )
+            for record in records:
+                vector = record.vector.get(vector_name) if isinstance(record.vector, dict) else record.vector
+                if vector is None:
+                    continue
+                ids.append(record.id)
+                payloads.append({"id": record.id, "payload": record.payload or {}})
+                rows.append(vector)
+            if offset is None:
+                break
+
+        matrix = np.asarray(rows, dtype=np.float32)
+        if len(rows):
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            matrix /= np.where(norms == 0, 1.0, norms)
+
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, VECTORS_FILE), matrix)
+        with open(os.path.join(path, PAYLOADS_FILE), "w", encoding="utf-8") as f:
+            json.dump(payloads, f, ensure_ascii=False)
+        with open(os.path.join(path, MANIFEST_FILE), "w", encoding="utf-8") as f:
+            json.dump({
+                "collection": collection_name,
+                "vector_name": vector_name,
+                "points_count": len(ids),
+                "dim": int(matrix.shape[1]) if len(rows) else 0,
+                "exported_at": time.time(),
+            }, f, indent=2)
+        logger.info(f"Exported {len(ids)} points from {collection_name} to {path}")
+        return len(ids)
+
+    def _mask(self, filter: Optional[Dict[str, Any]]) -> Optional[np.ndarray]:
+        """Mặt nạ boolean cho filter dạng dict (xem filter_mask)"""
+        return filter_mask(filter, self.payloads, self._codes, self._vocab)
+
+    def _scores(self, query: np.ndarray, rows: Optional[np.ndarray]) -> np.ndarray:
+        if rows is not None:
+            return self.vectors[rows] @ query
+        # Nhân theo khối để ma trận memory-mapped không phải đọc hết vào RAM một lần
+        scores = np.empty(len(self), dtype=np.float32)
+        for start in range(0, len(self), self.block_size):
+            end = start + self.block_size
+            scores[start:end] = self.vectors[start:end] @ query
+        return scores
+
+    def scroll(self, filter: Optional[Dict[str, Any]] = None, limit: int = 10) -> List[LocalPoint]:
+        """
+        Các point thỏa filter theo thứ tự trong snapshot (= thứ tự id của scroll lúc export), không tính điểm
+        """
+        mask = self._mask(filter)
+        rows = np.flatnonzero(mask) if mask is not None else np.arange(len(self))
+        return [LocalPoint(id=self.ids[row], payload=self.payloads[row], score=None) for row in rows[:limit]]
+
+    def search(self, query_vector: List[float], k: int = 5,
+               filter: Optional[Dict[str, Any]] = None) -> List[LocalPoint]:
+        """
+        Top-k theo cosine similarity trong các point thỏa filter
+        """
+        if len(self) == 0 or k <= 0:
+            return []
+        query = np.asarray(query_vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+
+        mask = self._mask(filter)
+        rows = np.flatnonzero(mask) if mask is not None else None
+        if rows is not None and rows.size == 0:
+            return []
+        if rows is not None and rows.size * 4 > len(self):
+            # Filter ít chọn lọc: nhân cả ma trận (không copy) rồi bỏ các dòng ngoài mask
+            scores = self._scores(query, None)
+            scores = scores[rows]
+        else:
+            scores = self._scores(query, rows)
+
+        if scores.shape[0] > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+        else:
+            top = np.arange(scores.shape[0])
+        top = top[np.argsort(-scores[top], kind="stable")]
+        if rows is not None:
+            positions = rows[top]
+        else:
+            positions = top
+        return [
+            LocalPoint(id=self.ids[row], payload=self.payloads[row], score=float(score))
+            for row, score in zip(positions, scores[top])
+        ]
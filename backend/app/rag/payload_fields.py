@@ -0,0 +1,100 @@
+"""
+Declarative payload field sets: which payload fields each use of retrieval actually reads.
+- display: show the problem verbatim (no solution)
+- solution: full prompt context (problem + solution); superset of display
+- search: /rag/rag-search API results (citation + problem text)
+- display_raw / solution_raw: always the raw fields, for consumers that re-format the problem
+  and solution text themselves (context_builder, tiered search tagging)
+When the payload carries current pre-rendered fragments (fragments_version), "display" and
+"solution" fetch the rendered blocks instead of the raw fields they were rendered from.
+Passed to Qdrant as PayloadSelectorInclude so unused fields (embedding_text, latex_string,
+source_path, ...) are neither transferred nor decoded.
+"""
+from __future__ import annotations
+from typing import Any, Dict, List, Optional, Sequence, Union
+
+from qdrant_client.http import models
+
+from .context_fragments import FRAGMENT_VERSION
+
+# Trường định danh / trích dẫn (log, cache câu trả lời, citation, cờ problem_only)
+IDENTITY_FIELDS: List[str] = [
+    "doc_id", "title", "source_file", "source", "source_school",
+    "category", "subcategory", "metadata", "year", "tags",
+    "question_number", "problem_section",
+]
+
+DISPLAY_FIELDS: List[str] = IDENTITY_FIELDS + [
+    "problem_statement", "problem_parts",
+    "problem_statement_natural", "problem_parts_natural",
+    "content",
+]
+
+SOLUTION_FIELDS: List[str] = DISPLAY_FIELDS + [
+    "solution", "solution_natural", "suggested_solution",
+    "token_counts",
+]
+
+DISPLAY_FRAGMENT_FIELDS: List[str] = IDENTITY_FIELDS + [
+    "problem_block", "display_block", "fragments_version",
+]
+
+SOLUTION_FRAGMENT_FIELDS: List[str] = IDENTITY_FIELDS + [
+    "problem_block", "solution_block", "fragments_version",
+]
+
+SEARCH_FIELDS: List[str] = [
+    "doc_id", "title", "source_file", "category", "subcategory", "metadata", "tags",
+    "question_number", "problem_section",
+    "problem_statement", "problem_statement_natural",
+]
+
+PAYLOAD_FIELD_SETS: Dict[str, List[str]] = {
+    "display": DISPLAY_FIELDS,
+    "solution": SOLUTION_FIELDS,
+    "search": SEARCH_FIELDS,
+    "display_raw": DISPLAY_FIELDS,
+    "solution_raw": SOLUTION_FIELDS,
+}
+
+# Field set dùng khi payload đã có fragment render sẵn đúng phiên bản
+FRAGMENT_FIELD_SETS: Dict[str, List[str]] = {
+    "display": DISPLAY_FRAGMENT_FIELDS,
+    "solution": SOLUTION_FRAGMENT_FIELDS,
+}
+
+
+def resolve_fields(fields: Union[str, Sequence[str], None], fragments: bool = False) -> Optional[List[str]]:
+    """
+    Tên field set ("display", "solution", "search", ...) hoặc danh sách trường -> danh sách trường
+
+    Args:
+        fields: Tên field set hoặc danh sách trường
+        fragments: Payload có fragment đúng phiên bản: lấy các khối render sẵn thay cho trường gốc
+    """
+    if fields is None:
+        return None
+    if isinstance(fields, str):
+        if fragments and fields in FRAGMENT_FIELD_SETS:
+            return FRAGMENT_FIELD_SETS[fields]
+        return PAYLOAD_FIELD_SETS[fields]
+    return list(fields)
+
+
+def has_current_fragments(payload: Dict[str, Any]) -> bool:
+    """Payload có fragment render sẵn với phiên bản hiện tại"""
+    return payload.get("fragments_version") == FRAGMENT_VERSION
+
+
+def payload_selector(fields: Optional[Sequence[str]]) -> Union[bool, models.PayloadSelectorInclude]:
+    """with_payload cho Qdrant: True (toàn bộ payload) nếu không chỉ định trường"""
+    if not fields:
+        return True
+    return models.PayloadSelectorInclude(include=list(fields))
+
+
+def project_payload(payload: Dict, fields: Optional[Sequence[str]]) -> Dict:
+    """Giữ lại các trường được chọn (dùng cho backend không hỗ trợ projection như chỉ mục cục bộ)"""
+    if not fields:
+        return payload.copy()
+    return {key: payload[key] for key in fields if key in payload}
@@ -0,0 +1,127 @@
+"""
+Deterministic rendering of retrieved problems for display-mode requests ("cho tôi đề bài ...").
+- Same markdown layout as the DISPLAY MODE section of MATH_CHATBOT_SYSTEM_INSTRUCTION
+- Verbatim problem_statement + problem_parts (LaTeX untouched), no LLM call
+- is_problem_display_request: explicit display-phrase check shared by the streaming paths
+- render_problem_display prefers the display_block fragment stored at ingestion
+"""
+from __future__ import annotations
+import re
+from typing import Any, Dict, List
+
+from .context_fragments import stored_fragment
+
+CATEGORY_NAMES = {
+    "dethi": "Đề thi",
+    "baitap": "Bài tập",
+}
+
+SUBCATEGORY_NAMES = {
+    "bangA": "Bảng A",
+    "bangB": "Bảng B",
+    "mt": "Ma trận",
+    "dt": "Định thức",
+    "hpt": "Hệ phương trình",
+    "gtr": "Giá trị riêng",
+    "kgvt": "Không gian vector",
+    "tohop": "Tổ hợp",
+    "dathuc": "Đa thức",
+}
+
+DIFFICULTY_NAMES = {
+    "co_ban": "Cơ bản",
+    "trung_binh": "Trung bình",
+    "kho": "Khó",
+    "quoc_gia": "Olympic/Quốc gia",
+}
+
+# Cụm từ yêu cầu xem đề một cách tường minh (StreamingAdapter trả đề dựng sẵn, không gọi LLM);
+# chỉ nhắc tới "bài tập" / "đề bài" thì vẫn là câu hỏi cho LLM
+PROBLEM_REQUEST_KEYWORDS = [
+    "cho tôi một bài tập", "cho tôi bài tập", "cho tôi đề bài", "cho tôi đề", "cho tôi xem đề",
+    "cung cấp một bài tập", "cung cấp bài tập", "cung cấp đề",
+    "cho đề", "xem đề bài", "hiển thị đề", "đưa ra đề",
+]
+SOLUTION_REQUEST_KEYWORDS = ["giải", "hướng dẫn", "cách làm", "làm thế nào", "tại sao", "chứng minh"]
+
+# Dấu hiệu câu hỏi ("... có khả nghịch không", "dùng định lý nào"): cần LLM trả lời
+QUESTION_PATTERN = re.compile(r"\?|\b(?:không|nào|bao nhiêu|gì|sao|mấy|chưa|có phải)\b")
+
+
+def is_problem_display_request(message: str) -> bool:
+    """
+    Người dùng chỉ muốn xem đề bài: có cụm từ yêu cầu xem đề, không yêu cầu lời giải và không phải câu hỏi
+    """
+    text = (message or "").lower()
+    if not any(keyword in text for keyword in PROBLEM_REQUEST_KEYWORDS):
+        return False
+    if any(keyword in text for keyword in SOLUTION_REQUEST_KEYWORDS):
+        return False
+    # "không gian vector" là tên chủ đề, không phải từ hỏi
+    return not QUESTION_PATTERN.search(text.replace("không gian", ""))
+
+
+def _problem_text(metadata: Dict[str, Any], page_content: str) -> str:
+    statement = metadata.get("problem_statement")
+    if not statement:
+        return (metadata.get("content") or page_content or "").strip()
+    text = statement.strip()
+    parts = metadata.get("problem_parts")
+    if parts and isinstance(parts, dict):
+        text += "\n\n" + "\n".join(f"**({key})** {value}" for key, value in parts.items())
+    return text
+
+
+def render_problem(document: Any) -> str:
+    """Một đề bài theo định dạng DISPLAY MODE"""
+    metadata = getattr(document, "metadata", None) or {}
+    category = metadata.get("category")
+    subcategory = metadata.get("subcategory")
+    subcategory_name = SUBCATEGORY_NAMES.get(subcategory, subcategory or "")
+    title = metadata.get("title")
+
+    if category == "dethi":
+        kind = f"Đề thi {subcategory_name}".strip()
+        header = f"## 🏆 {kind.upper()}"
+    else:
+        kind = f"Bài tập - {subcategory_name}" if subcategory_name else "Bài tập"
+        header = f"## 📚 {kind.upper()}"
+    if title:
+        header += f" - {title}"
+
+    lines = [header, "", "**Đề bài:**", _problem_text(metadata, getattr(document, "page_content", "")), ""]
+
+    year = metadata.get("year") or (metadata.get("metadata") or {}).get("year")
+    difficulty = metadata.get("difficulty_level") or (metadata.get("metadata") or {}).get("difficulty_level")
+    info = [f"- 🎯 Loại: {kind}"]
+    year_line = []
+    if year:
+        year_line.append(f"📅 Năm: {year}")
+    if difficulty:
+        year_line.append(f"📊 Mức độ: {DIFFICULTY_NAMES.get(difficulty, difficulty)}")
+    if year_line:
+        info.append("- " + " - ".join(year_line))
+    source = (
+        metadata.get("source_school") or metadata.get("source")
+        or (metadata.get("metadata") or {}).get("source")
+    )
+    source_line = []
+    tags = metadata.get("tags")
+    if tags:
+        tags_text = ", ".join(tags) if isinstance(tags, list) else str(tags)
+        source_line.append(f"🏷️ Chủ đề: {tags_text}")
+    if source:
+        source_line.append(f"📖 Nguồn: {source}")
+    if source_line:
+        info.append("- " + " - ".join(source_line))
+    lines += ["**📋 Thông tin:**"] + info
+    return "\n".join(lines)
+
+
+def render_problem_display(documents: List[Any]) -> str:
+    """Các đề bài đã truy xuất, ngăn cách bằng đường kẻ ngang (dùng display_block render sẵn nếu có)"""
+    blocks = []
+    for document in documents:
+        block = stored_fragment(getattr(document, "metadata", None), "display_block")
+        blocks.append(block if block is not None else render_problem(document))
+    return "\n\n---\n\n".join(blocks)
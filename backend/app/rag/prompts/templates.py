@@ -1,9 +1,14 @@
 from typing import Dict, List, Optional
 
+from ..context_fragments import render_problem_block, render_solution_block, stored_fragment
+
 class LinearAlgebraTemplates:
     """
     Các template cho RAG đại số tuyến tính Olympic.
     """
+
+    # Tăng mỗi khi sửa prompt: câu trả lời đã cache với phiên bản cũ sẽ không được dùng lại
+    TEMPLATE_VERSION = "1"
     
     @staticmethod
     def get_system_prompt(rag_enabled: bool = True) -> str:
@@ -187,6 +192,7 @@ class LinearAlgebraTemplates:
         """
         Định dạng một document thành chuỗi XML rõ ràng để đưa vào ngữ cảnh.
         Sử dụng thẻ XML giúp LLM phân tách thông tin cực kỳ hiệu quả.
+        Các khối <metadata>/<problem> và lời giải lấy từ fragment render sẵn lúc ingest nếu có.
         """
         # Lấy metadata một cách an toàn
         metadata = getattr(document, "metadata", {})
@@ -194,65 +200,18 @@ class LinearAlgebraTemplates:
         # Bắt đầu khối tài liệu
         formatted_str = f"<document index='{index+1}'>\n"
         
-        # 1. Phần Metadata
-        formatted_str += "<metadata>\n"
-        source_info = {
-            "title": metadata.get("title", "N/A"),
-            "source": metadata.get("source_school") or metadata.get("source", "N/A"),
-            "year": metadata.get("year", "N/A"),
-            "question_number": metadata.get("question_number", "N/A"),
-            "category": metadata.get("category", "N/A"),
-            "subcategory": metadata.get("subcategory", "N/A"),
-            "problem_section": metadata.get("problem_section", "N/A")
-        }
-        for key, value in source_info.items():
-            formatted_str += f"  <{key}>{value}</{key}>\n"
-        formatted_str += "</metadata>\n"
-        
-        # 2. Phần Đề bài (Problem) - hỗ trợ cả cấu trúc mới và cũ
-        content = getattr(document, "page_content", "")
-        
-        # Ưu tiên cấu trúc mới nếu có
-        problem_statement = metadata.get('problem_statement')
-        problem_parts = metadata.get('problem_parts', {})
-        
-        if problem_statement:
-            # Cấu trúc mới: có problem_statement riêng
-            problem_content = problem_statement
-            
-            # Thêm problem_parts nếu có
-            if problem_parts and isinstance(problem_parts, dict):
-                problem_content += "\n\n"
-                for part_key, part_content in problem_parts.items():
-                    problem_content += f"\n**({part_key})** {part_content}\n"
-            
-            formatted_str += f"<problem>\n{problem_content}\n</problem>\n"
-        else:
-            # Cấu trúc cũ: lấy từ content trong metadata hoặc page_content
-            old_content = metadata.get('content') or content
-            formatted_str += f"<problem>\n{old_content}\n</problem>\n"
-        
-        # 3. Phần Lời giải (Solution) - hỗ trợ cấu trúc mới
-        problem_only_requested = metadata.get("_looking_for_problem_only", False)
+        # 1-2. Metadata + Đề bài
+        problem_block = stored_fragment(metadata, "problem_block")
+        if problem_block is None:
+            problem_block = render_problem_block(metadata, getattr(document, "page_content", ""))
+        formatted_str += problem_block
         
-        if not problem_only_requested:
-            # Ưu tiên cấu trúc mới từ payload
-            solution_data = metadata.get('solution', {})
-            if solution_data and isinstance(solution_data, dict):
-                solution_content = solution_data.get('full_solution', '')
-                solution_parts = solution_data.get('solution_parts', {})
-                
-                if solution_content or solution_parts:
-                    if solution_parts and isinstance(solution_parts, dict):
-                        solution_content += "\n\n**Gợi ý từng phần:**\n"
-                        for part_key, part_solution in solution_parts.items():
-                            solution_content += f"**Phần {part_key}:** {part_solution}\n"
-                    formatted_str += f"<solution_hints>\n{solution_content}\n</solution_hints>\n"
-            else:
-                # Fallback cho cấu trúc cũ
-                solution = metadata.get("suggested_solution")
-                if solution:
-                    formatted_str += f"<solution>\n{solution}\n</solution>\n"
+        # 3. Phần Lời giải (Solution)
+        if not metadata.get("_looking_for_problem_only", False):
+            solution_block = stored_fragment(metadata, "solution_block")
+            if solution_block is None:
+                solution_block = render_solution_block(metadata)
+            formatted_str += solution_block
             
         # Đóng khối tài liệu
         formatted_str += "</document>"
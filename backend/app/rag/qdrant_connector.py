@@ -1,19 +1,38 @@
 import sys
 import os
+import asyncio
 import json
-import requests
+import httpx
+import grpc
 import logging
+import threading
 import importlib.util
-from typing import List, Optional, Dict, Any, Union
+from typing import List, Optional, Dict, Any, Sequence, Tuple, Union
 from langchain_core.documents import Document
 from langchain_openai import OpenAIEmbeddings
-from qdrant_client import QdrantClient
+from qdrant_client import AsyncQdrantClient, QdrantClient
 from qdrant_client.http.models import Filter, FieldCondition, MatchValue
 from qdrant_client.http import models
+from qdrant_client.http.exceptions import ResponseHandlingException, UnexpectedResponse
 from langchain_qdrant import QdrantVectorStore
 
 # Import trực tiếp từ config/__init__.py
 from ..config import get_settings
+from .embedding_cache import EmbeddingCache
+from .embedding_store import EmbeddingStore
+from .local_vector_index import LocalVectorIndex
+from .text_tokenizer import sparse_query_vector
+from .payload_fields import has_current_fragments, payload_selector, project_payload, resolve_fields
+from ..services.circuit_breaker import CircuitOpenError, get_circuit_breaker
+
+
+def _is_transport_error(error: Exception) -> bool:
+    """Lỗi kết nối / Qdrant không phản hồi được (khác lỗi request như filter sai)"""
+    if isinstance(error, UnexpectedResponse):
+        return error.status_code is None or error.status_code >= 500
+    return isinstance(error, (
+        ResponseHandlingException, httpx.TransportError, grpc.RpcError, ConnectionError, OSError, asyncio.TimeoutError
+    ))
 
 # Đường dẫn tuyệt đối đến các module
 app_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
@@ -30,12 +49,36 @@ rag_settings = rag_config.rag_settings
 
 logger = logging.getLogger(__name__)
 
+# Cache embedding dùng chung cho mọi QdrantConnector trong process (sống qua các lần reconnect)
+query_embedding_cache = EmbeddingCache(
+    max_size=rag_settings.embedding_cache_size,
+    ttl_seconds=rag_settings.embedding_cache_ttl
+)
+
+# Kho embedding trên đĩa, dùng chung giữa các worker; mở ở lần dùng đầu (không tạo file khi import)
+_query_embedding_store: Optional[EmbeddingStore] = None
+_query_embedding_store_opened = False
+_query_embedding_store_lock = threading.Lock()
+
+def get_query_embedding_store() -> Optional[EmbeddingStore]:
+    """Kho embedding trên đĩa dùng chung trong process (None nếu bị tắt hoặc không mở được)"""
+    global _query_embedding_store, _query_embedding_store_opened
+    with _query_embedding_store_lock:
+        if not _query_embedding_store_opened:
+            _query_embedding_store_opened = True
+            if rag_settings.embedding_store_path:
+                try:
+                    _query_embedding_store = EmbeddingStore(rag_settings.embedding_store_path)
+                except Exception as e:
+                    logger.warning(f"Embedding store disabled, could not open {rag_settings.embedding_store_path}: {e}")
+        return _query_embedding_store
+
 class QdrantConnector:
     """
     Kết nối và tương tác với Qdrant
     """
     
-    def __init__(self, qdrant_url=None, qdrant_api_key=None, collection_name=None, client=None, embeddings=None, *args, **kwargs):
+    def __init__(self, qdrant_url=None, qdrant_api_key=None, collection_name=None, client=None, embeddings=None, embedding_cache=None, embedding_store=None, local_index=None, *args, **kwargs):
         self.qdrant_url = qdrant_url or rag_settings.qdrant_url
         # Nếu là Secret, dùng get_secret_value, nếu không thì lấy trực tiếp
         if qdrant_api_key is not None:
@@ -48,28 +91,41 @@ class QdrantConnector:
                 self.qdrant_api_key = api_key
         self.collection_name = collection_name or rag_settings.qdrant_collection_name
         
+        self.embedding_cache = embedding_cache if embedding_cache is not None else query_embedding_cache
+        self.embedding_store = embedding_store if embedding_store is not None else get_query_embedding_store()
+        
         # Lấy API key từ config
         self.openai_api_key = os.getenv("OPENAI_API_KEY") or get_settings().openai_api_key
         
-        # Cài đặt Qdrant client
+        # Cài đặt Qdrant client: AsyncQdrantClient với pool kết nối dùng chung (HTTP/2 hoặc gRPC).
+        # Không gọi mạng ở đây, kết nối được kiểm tra bằng health_check().
+        self._sync_client = None
+        # Collection có keyword_vector (sparse) cho hybrid search không; None = chưa kiểm tra
+        self._sparse_available: Optional[bool] = None
+        # Fingerprint của lần đọc collection gần nhất: đổi thì kiểm tra lại keyword_vector
+        self._fingerprint: Optional[Tuple[Any, ...]] = None
+        # Ingestion gần nhất đã ghi fragment đúng phiên bản cho mọi point (metadata fragments_version của collection):
+        # field set "display"/"solution" lấy các khối render sẵn thay cho trường gốc
+        self._fragments_current = False
         if client:
             self.client = client
         else:
             try:
                 logger.info(f"Connecting to Qdrant at {self.qdrant_url}")
-                self.client = QdrantClient(
+                self.client = AsyncQdrantClient(
                     url=self.qdrant_url,
                     api_key=self.qdrant_api_key,
-                    timeout=60  # Tăng timeout để xử lý mạng chậm
+                    timeout=rag_settings.qdrant_timeout,  # Tăng timeout để xử lý mạng chậm
+                    prefer_grpc=rag_settings.qdrant_prefer_grpc,
+                    http2=rag_settings.qdrant_http2,
+                    pool_size=rag_settings.qdrant_pool_size,
                 )
-                # Kiểm tra kết nối
-                self.client.get_collections()
-                logger.info(f"Connected to Qdrant at {self.qdrant_url}")
             except Exception as e:
                 logger.error(f"Failed to connect to Qdrant: {e}")
                 raise ConnectionError(f"Could not connect to Qdrant: {e}") from e
                 
-        # Cài đặt embeddings model với error handling
+        # Cài đặt embeddings model. Không gọi thử embed_query ở đây: mỗi lần gọi
+        # là một round trip có tính phí, lỗi quota sẽ lộ ra ở lần search đầu tiên.
         try:
             if not self.openai_api_key:
                 raise ValueError("OpenAI API key is required for embeddings")
@@ -79,38 +135,53 @@ class QdrantConnector:
                 model=rag_settings.embedding_model_name,
                 openai_api_key=self.openai_api_key  # Sử dụng openai_api_key thay vì api_key
             )
-            # Test embedding để kiểm tra quota
-            test_result = self.embeddings.embed_query("test")
             logger.info("OpenAI embeddings initialized successfully")
         except Exception as e:
-            logger.error(f"Failed to initialize vector store: {e}")
-            logger.warning("Could not initialize vector store: Could not initialize vector store: " + str(e))
+            logger.warning(f"Could not initialize embeddings: {e}")
             self.embeddings = None
         
-        # Khởi tạo vector store
-        try:
+        # Vector store (langchain) chỉ cần cho add_documents, khởi tạo lười
+        self._vector_store = None
+
+        # Backend "local": tìm kiếm trên snapshot NumPy trong process thay vì gọi Qdrant Cloud
+        self.local_index = local_index
+        if self.local_index is None and rag_settings.vector_backend == "local":
+            try:
+                self.local_index = LocalVectorIndex.load(
+                    rag_settings.local_index_path, mmap=rag_settings.local_index_mmap
+                )
+            except Exception as e:
+                logger.warning(f"Could not load local vector index from {rag_settings.local_index_path}, "
+                               f"falling back to Qdrant: {e}")
+
+    @property
+    def sync_client(self) -> QdrantClient:
+        """
+        Client đồng bộ, chỉ dùng cho script CLI và ingest (add_documents, langchain vector store)
+        """
+        if self._sync_client is None:
+            self._sync_client = QdrantClient(
+                url=self.qdrant_url,
+                api_key=self.qdrant_api_key,
+                timeout=rag_settings.qdrant_timeout,
+            )
+        return self._sync_client
+
+    @property
+    def vector_store(self) -> QdrantVectorStore:
+        """Vector store của langchain, khởi tạo ở lần dùng đầu tiên"""
+        if self._vector_store is None:
             self._init_vector_store()
-        except Exception as e:
-            logger.warning(f"Could not initialize vector store: {e}")
-            logger.warning("QdrantConnector initialized without vector store. Only HTTP API will be available.")
+        return self._vector_store
         
     def _init_vector_store(self):
         """
         Khởi tạo Vector Store
         """
         try:
-            # Kiểm tra xem collection đã tồn tại chưa
-            collections = self.client.get_collections().collections
-            collection_names = [c.name for c in collections]
-            
-            if self.collection_name not in collection_names:
-                logger.warning(f"Collection {self.collection_name} not found. Available collections: {collection_names}")
-            else:
-                logger.info(f"Collection {self.collection_name} exists")
-                
             # Tạo vector store
-            self.vector_store = QdrantVectorStore(
-                client=self.client,
+            self._vector_store = QdrantVectorStore(
+                client=self.sync_client,
                 collection_name=self.collection_name,
                 embedding=self.embeddings,  # Lưu ý: langchain-qdrant mới dùng embedding thay vì embeddings
                 vector_name="semantic_vector",  # Named vector in your collection
@@ -120,6 +191,72 @@ class QdrantConnector:
         except Exception as e:
             logger.error(f"Failed to initialize vector store: {e}")
             raise RuntimeError(f"Could not initialize vector store: {e}") from e
+
+    async def health_check(self) -> bool:
+        """
+        Kiểm tra Qdrant còn phản hồi và collection còn tồn tại
+
+        Returns:
+            Boolean: True nếu kết nối khỏe
+        """
+        if self.local_index is not None:
+            return True
+        try:
+            await self.client.get_collection(collection_name=self.collection_name)
+            return True
+        except Exception as e:
+            logger.warning(f"Qdrant health check failed for collection {self.collection_name}: {e}")
+            return False
+
+    async def close(self) -> None:
+        """Đóng kết nối tới Qdrant"""
+        try:
+            await self.client.close()
+        except Exception as e:
+            logger.warning(f"Error closing Qdrant client: {e}")
+        if self._sync_client is not None:
+            try:
+                self._sync_client.close()
+            except Exception as e:
+                logger.warning(f"Error closing Qdrant sync client: {e}")
+            self._sync_client = None
+    
+    async def collection_fingerprint(self) -> Tuple[Any, ...]:
+        """
+        Dấu vân tay của collection (points_count + metadata), thay đổi khi dữ liệu được ingest lại
+        """
+        if self.local_index is not None:
+            return self.local_index.fingerprint
+        info = await self.client.get_collection(collection_name=self.collection_name)
+        config_metadata = getattr(info.config, "metadata", None) or {}
+        fingerprint = (info.points_count, json.dumps(config_metadata, sort_keys=True, default=str))
+        if fingerprint != self._fingerprint:
+            # Collection đã được ingest lại / tạo lại: keyword_vector có thể vừa được thêm hoặc mất đi
+            self._fingerprint = fingerprint
+            self._sparse_available = "keyword_vector" in (info.config.params.sparse_vectors or {})
+            self._fragments_current = has_current_fragments(config_metadata)
+        return fingerprint
+
+    async def scroll_payloads(self, batch_size: int = 256, fields: Optional[Sequence[str]] = None) -> List[Dict[str, Any]]:
+        """
+        Đọc payload của toàn bộ collection (không kèm vector) bằng scroll phân trang
+        """
+        if self.local_index is not None:
+            return [project_payload(payload, fields) for payload in self.local_index.payloads]
+        payloads = []
+        offset = None
+        while True:
+            records, offset = await self.client.scroll(
+                collection_name=self.collection_name,
+                limit=batch_size,
+                offset=offset,
+                with_payload=payload_selector(fields),
+                with_vectors=False,
+            )
+            payloads.extend(record.payload or {} for record in records)
+            if offset is None:
+                break
+        return payloads
     
     async def add_documents(self, documents: List[Document], batch_size: int = 100) -> bool:
         """
@@ -135,7 +272,7 @@ class QdrantConnector:
         try:
             # Kiểm tra nếu collection không tồn tại, tạo mới
             try:
-                self.client.get_collection(collection_name=self.collection_name)
+                await self.client.get_collection(collection_name=self.collection_name)
                 logger.info(f"Collection {self.collection_name} exists")
             except Exception:
                 logger.info(f"Creating new collection: {self.collection_name}")
@@ -143,11 +280,11 @@ class QdrantConnector:
                 vector_size = len(await self.embeddings.aembed_query("Test"))
                 
                 # Tạo collection mới với cấu hình phù hợp
-                self.client.create_collection(
+                await self.client.create_collection(
                     collection_name=self.collection_name,
-                    vectors_config=rest.VectorParams(
+                    vectors_config=models.VectorParams(
                         size=vector_size,
-                        distance=rest.Distance.COSINE
+                        distance=models.Distance.COSINE
                     ),
                 )
                 logger.info(f"Created new collection: {self.collection_name}")
@@ -217,11 +354,214 @@ class QdrantConnector:
         # Nếu có nhiều điều kiện, dùng "must" (tương đương AND)
         return {"filter": {"must": conditions}}
     
+    def _build_search_filter(self, filter: Optional[Dict]) -> Optional[models.Filter]:
+        """
+        Chuyển filter dạng dict của RAGService sang Filter của Qdrant
+
+        Args:
+            filter: Bộ lọc metadata (question_number, problem_section, year, tags, question, level, ...)
+
+        Returns:
+            Optional[models.Filter]: Filter cho query_points / scroll, None nếu không có điều kiện
+        """
+        if not filter or not isinstance(filter, dict):
+            return None
+
+        logger.info(f"Original filter: {filter}")
+        # Bỏ qua trường không có giá trị (Qdrant không match được None)
+        filter = {key: value for key, value in filter.items() if value is not None and value != "" and value != []}
+        must_conditions = []
+        
+        # question: khớp cả hai khóa question / question_number, hỗ trợ 1 hoặc 1.2
+        if "question" in filter:
+            q_value = str(filter["question"]).strip()
+            must_conditions.append({"should": [
+                {"key": "question", "match": {"value": q_value}},
+                {"key": "question_number", "match": {"value": q_value}},
+            ]})
+        
+        # level (bảng đề thi): tìm trong topic "đề thi bảng A/B/C"
+        if "level" in filter:
+            level = filter["level"]
+            level_upper = level.upper() if isinstance(level, str) else level
+            must_conditions.append({
+                "key": "topic",
+                "match": {"value": f"đề thi bảng {level_upper}"}
+            })
+        
+        # Xử lý trường hợp question_number (exact match)
+        if "question_number" in filter:
+            q_value = str(filter["question_number"]).strip()
+            must_conditions.append({
+                "key": "question_number", 
+                "match": {"value": q_value}
+            })
+        
+        # Xử lý trường hợp problem_section (section match for baitap)
+        if "problem_section" in filter:
+            section_value = str(filter["problem_section"]).strip()
+            must_conditions.append({
+                "key": "problem_section", 
+                "match": {"value": section_value}
+            })
+
+        # Xử lý trường hợp năm - cần phải match chính xác
+        if "year" in filter:
+            must_conditions.append({
+                "key": "metadata.year", 
+                "match": {"value": filter["year"]}
+            })
+            
+        # Xử lý trường hợp tags - cần phải kiểm tra xem tag có trong danh sách
+        if "tags" in filter and isinstance(filter["tags"], list):
+            tag_conditions = []
+            for tag in filter["tags"]:
+                tag_conditions.append({
+                    "key": "tags", 
+                    "match": {"value": tag}
+                })
+            # Nếu chỉ cần 1 tag match
+            if tag_conditions:
+                must_conditions.append({"should": tag_conditions})
+        
+        # Xử lý các trường hợp còn lại
+        for key, value in filter.items():
+            if key not in ["question", "level", "question_number", "problem_section", "year", "tags"]:
+                must_conditions.append({
+                    "key": key, 
+                    "match": {"value": value}
+                })
+        
+        if not must_conditions:
+            return None
+        qdrant_filter = {"must": must_conditions}
+        logger.info(f"Converted filter: {qdrant_filter}")
+        return models.Filter(**qdrant_filter)
+
+    def cached_query_vector(self, query: str) -> Optional[List[float]]:
+        """Embedding đã tính trong process cho câu truy vấn (không gọi API), None nếu chưa có"""
+        return self.embedding_cache.get(query, rag_settings.embedding_model_name)
+
+    async def embed_query(self, query: str) -> List[float]:
+        """
+        Tạo embedding cho câu truy vấn
+
+        Args:
+            query: Câu truy vấn
+
+        Returns:
+            List[float]: Vector embedding
+        """
+        model_name = rag_settings.embedding_model_name
+        cached = self.embedding_cache.get(query, model_name)
+        if cached is not None:
+            return cached
+
+        # Tầng 2: kho trên đĩa, chia sẻ giữa các worker và qua các lần restart
+        if self.embedding_store is not None:
+            stored = await asyncio.to_thread(self.embedding_store.get, query, model_name)
+            if stored is not None:
+                self.embedding_cache.put(query, model_name, stored)
+                return stored
+
+        # Kiểm tra xem embeddings có khả dụng không
+        if self.embeddings is None:
+            logger.error("Embeddings not available - cannot perform similarity search")
+            raise Exception("Embeddings service not available")
+
+        try:
+            query_vector = await get_circuit_breaker("embedding").call(
+                lambda: self.embeddings.aembed_query(query)
+            )
+        except CircuitOpenError:
+            raise
+        except Exception as e:
+            logger.error(f"Failed to generate embeddings: {e}")
+            raise Exception(f"Failed to generate embeddings: {e}")
+        self.embedding_cache.put(query, model_name, query_vector)
+        if self.embedding_store is not None:
+            await asyncio.to_thread(self.embedding_store.put, query, model_name, query_vector)
+        return query_vector
+
+    @staticmethod
+    def _payload_to_document(payload: Dict[str, Any], score: Optional[float]) -> Document:
+        """Tạo Document từ payload (ưu tiên trường natural_*); payload thuộc về Document, không copy"""
+        page_content = (
+            payload.get("problem_statement_natural")
+            or payload.get("natural_language_desc")
+            or payload.get("latex_string")
+            or payload.get("problem_statement")
+            or ""
+        )
+        # Thêm score vào metadata nếu có
+        payload["score"] = score
+        return Document(page_content=page_content, metadata=payload)
+
+    def _resolve_fields(self, fields: Union[str, Sequence[str], None]) -> Optional[List[str]]:
+        """Danh sách trường cần lấy từ Qdrant (khối render sẵn thay trường gốc nếu collection có fragment mới)"""
+        return resolve_fields(fields, fragments=self._fragments_current)
+
+    def _points_to_documents(self, points: List[Any], fields: Union[str, Sequence[str], None] = None) -> List[Document]:
+        """
+        Chuyển kết quả tìm kiếm thành Document
+
+        Args:
+            points: Kết quả Qdrant (payload đã được chiếu phía server) hoặc LocalPoint
+            fields: Field set hoặc danh sách trường cần giữ khi chiếu phía client cho chỉ mục cục bộ
+                (payload của nó dùng chung, phải copy); fragment được xét theo từng payload
+        """
+        if self.local_index is not None:
+            documents = []
+            for result in points:
+                payload = result.payload or {}
+                projected = project_payload(payload, resolve_fields(fields, fragments=has_current_fragments(payload)))
+                documents.append(self._payload_to_document(projected, getattr(result, "score", None)))
+            return documents
+        return [
+            self._payload_to_document(result.payload or {}, getattr(result, "score", None))
+            for result in points
+        ]
+    
+    async def _use_hybrid(self) -> bool:
+        """Hybrid search được bật và collection có keyword_vector (ghi nhớ tới khi fingerprint collection đổi)"""
+        if rag_settings.retrieval_mode != "hybrid" or self.local_index is not None:
+            return False
+        if self._sparse_available is None:
+            try:
+                info = await self.client.get_collection(collection_name=self.collection_name)
+            except Exception as e:
+                logger.warning(f"Could not inspect collection for hybrid search: {e}")
+                return False
+            self._sparse_available = "keyword_vector" in (info.config.params.sparse_vectors or {})
+            if not self._sparse_available:
+                logger.info(f"Collection {self.collection_name} has no keyword_vector, using dense search only")
+        return self._sparse_available
+
+    def _hybrid_query(self, query_vector: List[float], query_text: str,
+                      qdrant_filter: Optional[models.Filter]) -> Dict[str, Any]:
+        """
+        Tham số query_points cho hybrid search: prefetch trên cả hai vector rồi hợp nhất bằng RRF phía server
+        """
+        prefetch_k = rag_settings.hybrid_prefetch_k
+        prefetch = [
+            models.Prefetch(query=query_vector, using="semantic_vector", filter=qdrant_filter, limit=prefetch_k)
+        ]
+        indices, values = sparse_query_vector(query_text)
+        if indices:
+            prefetch.append(models.Prefetch(
+                query=models.SparseVector(indices=indices, values=values),
+                using="keyword_vector",
+                filter=qdrant_filter,
+                limit=prefetch_k,
+            ))
+        return {"prefetch": prefetch, "query": models.FusionQuery(fusion=models.Fusion.RRF)}
+
     async def similarity_search(
         self, 
         query: str, 
         k: int = 5, 
-        filter: Optional[Dict] = None
+        filter: Optional[Dict] = None,
+        fields: Union[str, Sequence[str], None] = None
     ) -> List[Document]:
         """
         Tìm kiếm theo vector similarity
@@ -230,118 +570,76 @@ class QdrantConnector:
             query: Câu truy vấn
             k: Số lượng kết quả
             filter: Bộ lọc metadata
+            fields: Field set ("display", "solution", "search") hoặc danh sách trường payload; None = toàn bộ
             
         Returns:
             List[Document]: Kết quả tìm kiếm
         """
         logger.info(f"Searching for '{query}' in collection {self.collection_name}")
+        query_vector = await self.embed_query(query)
+        return await self.similarity_search_by_vector(query_vector, k=k, filter=filter, fields=fields, query_text=query)
+
+    async def similarity_search_by_vector(
+        self,
+        query_vector: List[float],
+        k: int = 5,
+        filter: Optional[Dict] = None,
+        fields: Union[str, Sequence[str], None] = None,
+        query_text: Optional[str] = None
+    ) -> List[Document]:
+        """
+        Tìm kiếm theo vector đã tính sẵn (không gọi embedding)
         
-        # Kiểm tra xem embeddings có khả dụng không
-        if self.embeddings is None:
-            logger.error("Embeddings not available - cannot perform similarity search")
-            raise Exception("Embeddings service not available")
-        
-        try:
-            # Kiểm tra filter và log
-            qdrant_filter = None
-            if filter:
-                logger.info(f"Original filter: {filter}")
-                # Chuyển đổi filter sang định dạng của Qdrant
-                if isinstance(filter, dict):
-                    # Xử lý filter dạng đặc biệt
-                    must_conditions = []
-                    
-                    # Xử lý trường hợp question_number (exact match)
-                    if "question_number" in filter:
-                        q_value = str(filter["question_number"]).strip()
-                        must_conditions.append({
-                            "key": "question_number", 
-                            "match": {"value": q_value}
-                        })
-                    
-                    # Xử lý trường hợp problem_section (section match for baitap)
-                    if "problem_section" in filter:
-                        section_value = str(filter["problem_section"]).strip()
-                        must_conditions.append({
-                            "key": "problem_section", 
-                            "match": {"value": section_value}
-                        })
-
-                    # Xử lý trường hợp năm - cần phải match chính xác
-                    if "year" in filter:
-                        must_conditions.append({
-                            "key": "metadata.year", 
-                            "match": {"value": filter["year"]}
-                        })
-                        
-                    # Xử lý trường hợp tags - cần phải kiểm tra xem tag có trong danh sách
-                    if "tags" in filter and isinstance(filter["tags"], list):
-                        tag_conditions = []
-                        for tag in filter["tags"]:
-                            tag_conditions.append({
-                                "key": "tags", 
-                                "match": {"value": tag}
-                            })
-                        # Nếu chỉ cần 1 tag match
-                        if tag_conditions:
-                            must_conditions.append({"should": tag_conditions})
-                    
-                    # Xử lý các trường hợp còn lại
-                    for key, value in filter.items():
-                        if key not in ["question", "question_number", "year", "tags"]:
-                            must_conditions.append({
-                                "key": key, 
-                                "match": {"value": value}
-                            })
-                    
-                    if must_conditions:
-                        qdrant_filter = {"must": must_conditions}
-                        logger.info(f"Converted filter: {qdrant_filter}")
+        Args:
+            query_vector: Vector embedding của câu truy vấn
+            k: Số lượng kết quả
+            filter: Bộ lọc metadata
+            fields: Field set hoặc danh sách trường payload cần lấy; None = toàn bộ
+            query_text: Câu truy vấn gốc, dùng cho keyword_vector khi ở chế độ hybrid
             
-            # Tìm kiếm bằng phương pháp search với error handling
-            try:
-                query_vector = await self.embeddings.aembed_query(query)
-            except Exception as e:
-                logger.error(f"Failed to search in Qdrant: {e}")
-                raise Exception(f"Failed to generate embeddings: {e}")
-
-            # Temporary: use deprecated search for compatibility, with named vector tuple
-            search_params = {
-                "collection_name": self.collection_name,
-                "query_vector": ("semantic_vector", query_vector),
-                "limit": k,
-                "with_payload": True,
-                "with_vectors": False,
-            }
-            if qdrant_filter:
-                search_params["query_filter"] = qdrant_filter
-
-            search_results = self.client.search(**search_params)
-
-            # Chuyển đổi kết quả thành documents
-            documents = []
-            for result in search_results:
-                # Lấy metadata và content từ payload (ưu tiên trường natural_*)
-                payload = result.payload or {}
-                page_content = (
-                    payload.get("problem_statement_natural")
-                    or payload.get("natural_language_desc")
-                    or payload.get("latex_string")
-                    or ""
+        Returns:
+            List[Document]: Kết quả tìm kiếm (rỗng nếu request lỗi)
+
+        Raises:
+            CircuitOpenError: Circuit "qdrant" đang mở
+            Exception: Lỗi kết nối tới Qdrant (timeout, mất kết nối, lỗi 5xx)
+        """
+        try:
+            if self.local_index is not None:
+                documents = self._points_to_documents(
+                    self.local_index.search(query_vector, k=k, filter=filter), fields
                 )
-                metadata = payload.copy()
-                # Thêm score vào metadata nếu có
-                metadata["score"] = getattr(result, "score", None)
+                logger.info(f"Found {len(documents)} documents (local index)")
+                return documents
 
-                documents.append(Document(
-                    page_content=page_content,
-                    metadata=metadata
+            qdrant_filter = self._build_search_filter(filter)
+            selector = payload_selector(self._resolve_fields(fields))
+
+            if query_text and await self._use_hybrid():
+                # Một round trip: dense + sparse prefetch, hợp nhất RRF phía server
+                response = await get_circuit_breaker("qdrant").call(lambda: self.client.query_points(
+                    collection_name=self.collection_name,
+                    limit=k,
+                    with_payload=selector,
+                    with_vectors=False,
+                    **self._hybrid_query(query_vector, query_text, qdrant_filter),
                 ))
+            else:
+                response = await get_circuit_breaker("qdrant").call(lambda: self.client.query_points(
+                    collection_name=self.collection_name,
+                    query=query_vector,
+                    using="semantic_vector",
+                    query_filter=qdrant_filter,
+                    limit=k,
+                    with_payload=selector,
+                    with_vectors=False,
+                ))
+            documents = self._points_to_documents(response.points)
             
             logger.info(f"Found {len(documents)} documents")
             
             # Log kết quả đầu tiên để debug
-            if documents and len(documents) > 0:
+            if documents:
                 first_doc = documents[0]
                 metadata_preview = {k: v for k, v in first_doc.metadata.items() 
                                    if k in ["question", "year", "tags", "type", "source", "score"]}
@@ -349,132 +647,130 @@ class QdrantConnector:
                 logger.info(f"Top result content preview: {first_doc.page_content[:100]}...")
             
             return documents
+        except CircuitOpenError:
+            # Circuit mở: để RetrievalContext chuyển ngay sang BM25 thay vì coi như không có kết quả
+            raise
         except Exception as e:
             logger.error(f"Failed to search in Qdrant: {e}")
+            if _is_transport_error(e):
+                # Qdrant không truy cập được: ném lỗi để RetrievalContext dùng BM25 (và không cache kết quả)
+                raise
             # Trả về danh sách rỗng thay vì ném exception để tăng khả năng chịu lỗi
             return [] 
 
-    def search_with_filter_http(self, filter_query, limit=5):
-        """Truy vấn filter tới Qdrant Cloud qua HTTP API, trả về kết quả tương tự search."""
-        qdrant_url = self.qdrant_url
-        api_key = self.qdrant_api_key
-        collection_name = self.collection_name
-        VECTOR_SIZE = 1536  # Sửa nếu dùng embedding khác
-        search_url = f"{qdrant_url}/collections/{collection_name}/points/search"
-        headers = {
-            "Content-Type": "application/json",
-        }
-        if api_key:
-            headers["api-key"] = api_key
-            
-        # Chuyển đổi filter_query thành định dạng Qdrant filter hợp lệ
-        qdrant_filter = {"must": []}
-        
-        # Log chi tiết filter gốc
-        logger.info(f"Filter gốc: {filter_query}")
+    async def similarity_search_batch(
+        self,
+        query_vector: List[float],
+        searches: List[Tuple[int, Optional[Dict]]],
+        fields: Union[str, Sequence[str], None] = None,
+        query_text: Optional[str] = None
+    ) -> List[List[Document]]:
+        """
+        Nhiều tìm kiếm với cùng một vector trong một lần gọi query_batch_points
         
-        # Xử lý đặc biệt cho trường level (chuyển thành tìm kiếm trong topic)
-        if "level" in filter_query:
-            level_value = filter_query.pop("level")
-            # Chuyển level thành chữ hoa để tìm trong topic
-            level_upper = level_value.upper() if isinstance(level_value, str) else level_value
+        Args:
+            query_vector: Vector embedding của câu truy vấn
+            searches: Danh sách (k, filter) theo thứ tự
+            fields: Field set hoặc danh sách trường payload cần lấy; None = toàn bộ
+            query_text: Câu truy vấn gốc, dùng cho keyword_vector khi ở chế độ hybrid
             
-            # Tìm kiếm trong topic với pattern "bảng A", "bảng B", "bảng C"
-            qdrant_filter["must"].append({
-                "key": "topic",
-                "match": {"value": f"đề thi bảng {level_upper}"}
-            })
-            logger.info(f"Chuyển filter level='{level_value}' thành tìm kiếm trong topic: đề thi bảng {level_upper}")
-        
-        for key, value in filter_query.items():
-            # Xử lý đặc biệt cho trường question/question_number
-            if key in ("question", "question_number"):
-                # Tạo điều kiện tương thích cả hai khóa, hỗ trợ 1 hoặc 1.2
-                q_val = str(value).strip()
-                question_should = [
-                    {"key": "question", "match": {"value": q_val}},
-                    {"key": "question_number", "match": {"value": q_val}},
-                ]
-                qdrant_filter["must"].append({"should": question_should})
-                logger.info(f"Điều kiện question OR question_number = {q_val}")
-            elif key == "tags" and isinstance(value, list):
-                tag_conditions = []
-                for tag in value:
-                    tag_conditions.append({
-                        "key": "tags", 
-                        "match": {"value": tag}
-                    })
-                if tag_conditions:
-                    qdrant_filter["must"].append({"should": tag_conditions})
-            else:
-                qdrant_filter["must"].append({
-                    "key": key,
-                    "match": {"value": value}
-                })
+        Returns:
+            List[List[Document]]: Kết quả của từng tìm kiếm, cùng thứ tự với searches
+            (ném exception khi lỗi để caller chuyển sang tìm tuần tự)
+        """
+        if self.local_index is not None:
+            return [
+                self._points_to_documents(self.local_index.search(query_vector, k=k, filter=search_filter), fields)
+                for k, search_filter in searches
+            ]
+        selector = payload_selector(self._resolve_fields(fields))
+        if query_text and await self._use_hybrid():
+            query_requests = [
+                models.QueryRequest(
+                    limit=k,
+                    with_payload=selector,
+                    with_vector=False,
+                    **self._hybrid_query(query_vector, query_text, self._build_search_filter(search_filter)),
+                )
+                for k, search_filter in searches
+            ]
+        else:
+            query_requests = [
+                models.QueryRequest(
+                    query=query_vector,
+                    using="semantic_vector",
+                    filter=self._build_search_filter(search_filter),
+                    limit=k,
+                    with_payload=selector,
+                    with_vector=False,
+                )
+                for k, search_filter in searches
+            ]
+        responses = await get_circuit_breaker("qdrant").call(lambda: self.client.query_batch_points(
+            collection_name=self.collection_name,
+            requests=query_requests,
+        ))
+        results = [self._points_to_documents(response.points) for response in responses]
+        logger.info(f"Batch search found {[len(docs) for docs in results]} documents")
+        return results
+
+    async def scroll_by_filter(
+        self,
+        filter_query: Dict,
+        limit: int = 5,
+        fields: Union[str, Sequence[str], None] = "solution",
+        page_size: int = 64
+    ) -> List[Document]:
+        """
+        Truy xuất chỉ theo filter (không vector) qua scroll, phân trang bằng next_page_offset
         
-        # Nếu không có điều kiện, không dùng filter
-        if not qdrant_filter["must"]:
-            qdrant_filter = None
+        Args:
+            filter_query: Bộ lọc metadata (year, question, level, tags, ...)
+            limit: Số documents tối đa
+            fields: Field set hoặc danh sách trường payload cần lấy (mặc định "solution")
+            page_size: Số point mỗi trang scroll
             
-        logger.info(f"HTTP filter query chi tiết: {qdrant_filter}")
-        
-        data = {
-            "vector": [0.0] * VECTOR_SIZE,  # Vector zero đúng kích thước
-            "filter": qdrant_filter,
-            "limit": limit,
-            "with_payload": True,  # Đảm bảo luôn lấy payload
-            "with_vectors": False  # Không cần vector để tiết kiệm băng thông
-        }
-        
+        Returns:
+            List[Document]: Kết quả theo thứ tự id, ổn định giữa các lần gọi (rỗng nếu request lỗi)
+
+        Raises:
+            Exception: Lỗi kết nối tới Qdrant ở bất kỳ trang nào (không trả về kết quả thiếu)
+        """
+        fields = fields or "solution"
+        documents = []
         try:
-            response = requests.post(search_url, headers=headers, data=json.dumps(data))
-            if response.status_code == 200:
-                result_data = response.json().get("result", [])
-                # Chuyển đổi kết quả thành documents
-                documents = []
-                
-                for result in result_data:
-                    try:
-                        # Lấy payload từ kết quả
-                        payload = result.get("payload", {})
-                        
-                        # Lấy nội dung từ các trường khác nhau
-                        page_content = payload.get("content", "")
-                        if not page_content and "suggested_solution" in payload:
-                            page_content = payload.get("suggested_solution", "")
-                        
-                        # Nếu không có content, bỏ qua point này
-                        if not page_content:
-                            continue
-                            
-                        # Tạo metadata từ payload
-                        metadata = {k: v for k, v in payload.items() if k not in ["content", "suggested_solution"]}
-                        
-                        # Thêm score vào metadata
-                        metadata["score"] = result.get("score", 0.0)
-                        
-                        documents.append(Document(
-                            page_content=page_content,
-                            metadata=metadata
-                        ))
-                    except Exception as e:
-                        logger.error(f"Lỗi khi xử lý point: {e}")
-                
-                # Log chi tiết kết quả
-                logger.info(f"Tìm thấy {len(documents)} documents qua HTTP API")
-                if documents:
-                    for i, doc in enumerate(documents[:3]):  # Log tối đa 3 kết quả đầu tiên
-                        meta_info = {k: v for k, v in doc.metadata.items() 
-                                    if k in ["id", "question", "year", "tags", "type", "score", "topic"]}
-                        logger.info(f"Kết quả {i+1}: {meta_info}")
-                else:
-                    logger.warning("Không tìm thấy kết quả nào cho filter")
-                
-                return documents
+            if self.local_index is not None:
+                documents = self._points_to_documents(self.local_index.scroll(filter_query, limit=limit), fields)
             else:
-                error_msg = f"Qdrant HTTP filter error: {response.status_code} {response.text}"
-                logger.error(error_msg)
-                return []
+                scroll_filter = self._build_search_filter(filter_query)
+                selector = payload_selector(self._resolve_fields(fields))
+                offset = None
+                while len(documents) < limit:
+                    records, offset = await self.client.scroll(
+                        collection_name=self.collection_name,
+                        scroll_filter=scroll_filter,
+                        limit=min(page_size, limit - len(documents)),
+                        offset=offset,
+                        with_payload=selector,
+                        with_vectors=False,
+                    )
+                    documents.extend(self._points_to_documents(records))
+                    if offset is None:
+                        break
         except Exception as e:
-            logger.error(f"Exception in HTTP filter: {str(e)}")
-            return [] 
\ No newline at end of file
+            logger.error(f"Exception in scroll by filter: {str(e)}")
+            if _is_transport_error(e):
+                # Qdrant không truy cập được (có thể giữa chừng): không trả kết quả thiếu như thể đã đủ
+                raise
+            return []
+
+        # Log chi tiết kết quả
+        logger.info(f"Tìm thấy {len(documents)} documents qua scroll")
+        if documents:
+            for i, doc in enumerate(documents[:3]):  # Log tối đa 3 kết quả đầu tiên
+                meta_info = {k: v for k, v in doc.metadata.items() 
+                            if k in ["doc_id", "question_number", "year", "tags", "category", "subcategory"]}
+                logger.info(f"Kết quả {i+1}: {meta_info}")
+        else:
+            logger.warning("Không tìm thấy kết quả nào cho filter")
+        return documents
@@ -2,27 +2,33 @@
 Vietnamese query parser for RAG filters.
 - Extracts: category (baitap/dethi), subcategory (mt/dt/gtr/hpt/kgvt/tohop), year (int)
 - Normalizes query (Unicode NFC, lowercase, trim)
+- Single scan with one compiled alternation (named groups, word boundaries, accent-folded multi-word variants)
+- parse_query is memoised (bounded LRU keyed on the raw query)
 - No external deps; safe to import.
 """
 from __future__ import annotations
 from dataclasses import dataclass
-from typing import Optional, Dict
+from functools import lru_cache
+from typing import Optional, Dict, List
 import re
 import unicodedata
 
+from .text_tokenizer import fold_accents
+
 
 CATEGORY_KEYWORDS = {
     "baitap": ["bài tập", "baitap", "bt"],
     "dethi": ["đề thi", "dethi", "đề", "de thi"],
 }
 
+# Khớp theo từ nguyên vẹn (QUERY_PATTERN): dạng số nhiều / từ đầy đủ tiếng Anh phải được liệt kê riêng
 SUBCATEGORY_KEYWORDS = {
-    "mt": ["ma trận", "ma-trận", "matrix", "mt"],
-    "dt": ["định thức", "dinh thuc", "det", "dt"],
-    "gtr": ["giá trị riêng", "gia tri rieng", "eigenvalue", "gtr"],
-    "hpt": ["hệ phương trình", "he phuong trinh", "system", "hpt"],
-    "kgvt": ["không gian vector", "khong gian vector", "vector space", "kgvt"],
-    "tohop": ["tổ hợp", "to hop", "combination", "tohop"],
+    "mt": ["ma trận", "ma-trận", "matrix", "matrices", "matrixes", "mt"],
+    "dt": ["định thức", "dinh thuc", "determinant", "determinants", "det", "dt"],
+    "gtr": ["giá trị riêng", "gia tri rieng", "eigenvalue", "eigenvalues", "gtr"],
+    "hpt": ["hệ phương trình", "he phuong trinh", "system", "systems", "hpt"],
+    "kgvt": ["không gian vector", "khong gian vector", "vector space", "vector spaces", "kgvt"],
+    "tohop": ["tổ hợp", "to hop", "combination", "combinations", "tohop"],
     # Exam boards for dethi
     "bangA": ["bảng a", "bang a", "banga", "board a"],
     "bangB": ["bảng b", "bang b", "bangb", "board b"],
@@ -32,8 +38,11 @@ YEAR_PATTERN = re.compile(r"\b(201[0-9]|202[0-9])\b")
 QUESTION_CODE_PATTERN = re.compile(r"\bbài\s+(\d+\.\d+)\b", re.IGNORECASE)
 QUESTION_NUM_PATTERN = re.compile(r"\bbài\s+(\d+)\b", re.IGNORECASE)
 
+# Số câu hỏi khác nhau được nhớ kết quả parse (cùng một tin nhắn được parse nhiều lần mỗi request)
+PARSE_CACHE_SIZE = 1024
+
 
-@dataclass
+@dataclass(frozen=True)
 class ParsedQuery:
     normalized_query: str
     category: Optional[str] = None
@@ -87,12 +96,66 @@ def match_keyword(text: str, mapping: Dict[str, list[str]]) -> Optional[str]:
     return None
 
 
+def _keyword_variants(variants: List[str]) -> List[str]:
+    """
+    Các biến thể có dấu + không dấu, dài trước để alternation ưu tiên cụm dài nhất.
+    Chỉ bỏ dấu cụm nhiều từ: từ đơn bỏ dấu dễ trùng từ thường ("đề" -> "de", như trong "để")
+    """
+    folded = {normalize_text(v) for v in variants}
+    folded |= {fold_accents(v) for v in variants if len(v.split()) > 1}
+    return sorted(folded, key=len, reverse=True)
+
+
+def _build_query_pattern():
+    """
+    Một regex duy nhất cho cả category, subcategory, năm và số bài.
+    Tên group -> (trường, key) để thứ tự ưu tiên giống match_keyword (thứ tự trong mapping).
+    """
+    groups: Dict[str, tuple] = {}
+    alternatives = [
+        r"b(?:ài|ai)\s+(?P<question_code>\d+\.\d+)",
+        r"b(?:ài|ai)\s+(?P<question_num>\d+)",
+        r"(?P<year>201[0-9]|202[0-9])",
+    ]
+    for field, mapping in (("category", CATEGORY_KEYWORDS), ("subcategory", SUBCATEGORY_KEYWORDS)):
+        for priority, (key, variants) in enumerate(mapping.items()):
+            name = f"{field}_{key}"
+            groups[name] = (field, key, priority)
+            escaped = "|".join(re.escape(v) for v in _keyword_variants(variants))
+            alternatives.append(f"(?P<{name}>{escaped})")
+    # Ranh giới từ ở hai đầu: "dt"/"mt"/"bt" không còn khớp bên trong từ khác
+    pattern = re.compile(r"(?<!\w)(?:" + "|".join(alternatives) + r")(?!\w)")
+    return pattern, groups
+
+
+QUERY_PATTERN, _KEYWORD_GROUPS = _build_query_pattern()
+
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
 def parse_query(query: str) -> ParsedQuery:
     nq = normalize_text(query or "")
-    year = extract_year(nq)
-    category = match_keyword(nq, CATEGORY_KEYWORDS)
-    subcat = match_keyword(nq, SUBCATEGORY_KEYWORDS)
-    question_code, question_num = extract_question_info(nq)
+    year = None
+    question_code = question_num = None
+    best: Dict[str, tuple] = {}
+    for match in QUERY_PATTERN.finditer(nq):
+        name = match.lastgroup
+        value = match.group(name)
+        if name == "year":
+            if year is None:
+                year = int(value)
+        elif name == "question_code":
+            if question_code is None:
+                question_code = value
+                question_num = value.split('.')[0]
+        elif name == "question_num":
+            if question_num is None:
+                question_num = value
+        else:
+            field, key, priority = _KEYWORD_GROUPS[name]
+            if field not in best or priority < best[field][0]:
+                best[field] = (priority, key)
+    category = best["category"][1] if "category" in best else None
+    subcat = best["subcategory"][1] if "subcategory" in best else None
 
     # If exam board detected, force category to dethi and normalize subcategory
     if subcat in ("bangA", "bangB"):
@@ -0,0 +1,136 @@
+"""
+Process-wide RAG stack.
+- Owns a single RAGService (QdrantConnector + MetadataExtractor) per process
+- Lazily initialised, warmed once at application startup
+- Periodic health check in a background task started at application startup (never on a request path);
+  reconnects Qdrant when it becomes unhealthy
+- Builds the in-memory indexes (exact lookup, BM25) at warm-up and refreshes them when the collection changes
+- get_rag_service() is the FastAPI dependency for routers; get_optional_rag_service() returns None when RAG is disabled
+"""
+from __future__ import annotations
+import asyncio
+import logging
+import time
+from typing import Optional
+
+from ..config import get_settings
+from .rag_service import RAGService, rag_settings
+from .qdrant_connector import QdrantConnector
+from .token_budget import get_encoder
+
+logger = logging.getLogger(__name__)
+
+
+class RAGProvider:
+    """
+    Giữ một RAGService dùng chung cho toàn bộ process
+    """
+
+    def __init__(self, health_check_interval: Optional[float] = None):
+        self.health_check_interval = (
+            health_check_interval if health_check_interval is not None
+            else rag_settings.health_check_interval
+        )
+        self._service: Optional[RAGService] = None
+        self._lock = asyncio.Lock()
+        self._health_task: Optional[asyncio.Task] = None
+
+    async def get_service(self) -> RAGService:
+        """
+        Trả về RAGService dùng chung, khởi tạo ở lần gọi đầu tiên
+        (kiểm tra sức khỏe chạy nền, request không bao giờ phải chờ)
+        """
+        if self._service is None:
+            async with self._lock:
+                if self._service is None:
+                    # AsyncQdrantClient không gọi mạng khi khởi tạo, kết nối được kiểm tra khi warm up
+                    self._service = RAGService()
+        return self._service
+
+    async def warm_up(self) -> None:
+        """Khởi tạo trước RAG stack khi ứng dụng khởi động"""
+        try:
+            start_time = time.time()
+            service = await self.get_service()
+            # Tải BPE của tiktoken ngay lúc khởi động thay vì ở request đầu tiên
+            await asyncio.to_thread(get_encoder)
+            healthy = service.qdrant is not None and await service.qdrant.health_check()
+            if healthy:
+                await service.refresh_local_indexes()
+            logger.info(f"RAG stack warmed up in {time.time() - start_time:.2f}s (qdrant_healthy={healthy})")
+        except Exception as e:
+            logger.error(f"Failed to warm up RAG stack: {e}")
+
+    def start_health_checks(self) -> None:
+        """Chạy kiểm tra sức khỏe định kỳ trong task nền (gọi một lần khi ứng dụng khởi động)"""
+        if self._health_task is None or self._health_task.done():
+            self._health_task = asyncio.create_task(self._health_loop())
+
+    async def _health_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.health_check_interval)
+            try:
+                await self._ensure_healthy()
+            except Exception as e:
+                logger.error(f"RAG health check failed: {e}")
+
+    async def _ensure_healthy(self) -> None:
+        async with self._lock:
+            if self._service is None:
+                return
+            qdrant = self._service.qdrant
+            if qdrant is not None and await qdrant.health_check():
+                # Collection có thể đã được ingest lại: dựng lại các chỉ mục trong bộ nhớ nếu cần
+                await self._service.refresh_local_indexes()
+                return
+            await self._reconnect_locked()
+
+    async def reconnect(self) -> None:
+        """Tạo lại QdrantConnector cho RAGService dùng chung"""
+        async with self._lock:
+            await self._reconnect_locked()
+
+    async def _reconnect_locked(self) -> None:
+        if self._service is None:
+            return
+        logger.warning("Qdrant connection unhealthy, reconnecting...")
+        try:
+            connector = QdrantConnector()
+        except Exception as e:
+            logger.error(f"Failed to reconnect to Qdrant: {e}")
+            return
+        old_connector = self._service.qdrant
+        self._service.qdrant = connector
+        if old_connector is not None:
+            await old_connector.close()
+        logger.info("Qdrant connection re-established")
+
+    async def close(self) -> None:
+        """Giải phóng kết nối khi ứng dụng tắt"""
+        if self._health_task is not None:
+            self._health_task.cancel()
+            try:
+                await self._health_task
+            except asyncio.CancelledError:
+                pass
+            self._health_task = None
+        async with self._lock:
+            if self._service is not None and self._service.qdrant is not None:
+                await self._service.qdrant.close()
+            self._service = None
+
+
+# Singleton instance
+rag_provider = RAGProvider()
+
+
+# Dependency to get the shared RAG service
+async def get_rag_service() -> RAGService:
+    return await rag_provider.get_service()
+
+
+# Dependency cho route chỉ dùng RAG khi được bật: không dựng RAG stack nếu rag_enabled=false
+async def get_optional_rag_service() -> Optional[RAGService]:
+    if not get_settings().rag_enabled:
+        return None
+    return await rag_provider.get_service()
@@ -1,7 +1,9 @@
 import sys
 import os
+import asyncio
 import logging
 import importlib.util
+from collections import OrderedDict
 from typing import List, Optional, Dict, Any, Tuple
 try:
     from langchain_core.documents import Document
@@ -31,24 +33,131 @@ rag_settings = rag_config.rag_settings
 # Import các module khác
 from .qdrant_connector import QdrantConnector
 # from .query_extractor import QueryMetadataExtractor  # Deprecated - using VN parser
-from .query_extractor_vn import parse_query, build_qdrant_filter
-from ..services.llm.metadata_extractor import MetadataExtractor, MathQueryMetadata
+from .query_extractor_vn import parse_query, build_qdrant_filter, normalize_text
+from ..services.llm.metadata_extractor import MetadataExtractor, MathQueryMetadata, classify_intent
+from ..services.circuit_breaker import CircuitOpenError
 from .context_builder import assemble_context
+from .exact_index import ExactLookupIndex, load_processed_payloads
+from .lexical_index import LEXICAL_TEXT_FIELDS, LexicalIndex
+from .context_fragments import FRAGMENT_FIELDS
+from .local_vector_index import FILTER_PAYLOAD_FIELDS
+from .payload_fields import SOLUTION_FIELDS
+from .retrieval_cache import RetrievalCache
+from .retrieval_deadline import Deadline, hedged, retrieval_latency
 
 logger = logging.getLogger(__name__)
 
+
+class RetrievalContext:
+    """
+    Trạng thái truy xuất của một request: embedding của câu truy vấn được tính
+    đúng một lần rồi dùng lại cho mọi chiến lược tìm kiếm; mọi lời gọi mạng nằm trong deadline của request
+    """
+
+    def __init__(self, qdrant: QdrantConnector, query: str, fields: str = "solution",
+                 lexical: Optional[LexicalIndex] = None, deadline: Optional[Deadline] = None):
+        self.qdrant = qdrant
+        self.query = query
+        # Field set payload cần lấy ("display", "solution", "search", "display_raw", "solution_raw")
+        self.fields = fields
+        # Chỉ mục BM25 cục bộ: dự phòng khi embedding lỗi, hoặc thay embedding ở chế độ "primary"
+        mode = rag_settings.lexical_mode
+        self.lexical = lexical if lexical is not None and lexical.ready and mode != "off" else None
+        self.lexical_primary = self.lexical is not None and mode == "primary"
+        self._vector: Optional[List[float]] = None
+        self._error: Optional[Exception] = None
+        # True nếu đã phải dùng BM25 thay cho tìm kiếm vector hoặc một tầng tìm kiếm bị lỗi / quá hạn
+        # (kết quả không phản ánh đúng thứ tự ưu tiên các tầng nên không được cache)
+        self.degraded = False
+        # Budget thời gian truy xuất (None = không giới hạn); chỉ hedge với Qdrant qua mạng
+        self.deadline = deadline
+        self.hedge = rag_settings.hedge_requests and getattr(qdrant, "local_index", None) is None
+
+    async def get_vector(self) -> List[float]:
+        """Embedding của câu truy vấn (lỗi cũng được ghi nhớ để không gọi lại API)"""
+        if self._error is not None:
+            raise self._error
+        if self._vector is None:
+            try:
+                if self.deadline is None:
+                    self._vector = await self.qdrant.embed_query(self.query)
+                else:
+                    # shield: quá hạn thì request này bỏ qua, nhưng embedding vẫn hoàn tất và vào cache
+                    embedding = asyncio.ensure_future(self.qdrant.embed_query(self.query))
+                    embedding.add_done_callback(lambda task: task.cancelled() or task.exception())
+                    timeout = self.deadline.slice(share=rag_settings.retrieval_embedding_share)
+                    self._vector = await asyncio.wait_for(asyncio.shield(embedding), timeout=timeout)
+            except Exception as e:
+                self._error = e
+                raise
+        return self._vector
+
+    async def _call(self, operation: str, factory, parts: int = 1):
+        """Gọi Qdrant trong phần budget còn lại (chia đều cho `parts` bước), hedge khi vượt p95"""
+        if self.deadline is None:
+            return await factory()
+        return await hedged(operation, factory, self.deadline.slice(parts), retrieval_latency, hedge=self.hedge)
+
+    def lexical_search(self, k: int, filter: Optional[Dict] = None) -> List[Document]:
+        """Tìm kiếm BM25 trong bộ nhớ (không gọi embedding, không round trip)"""
+        return self.lexical.search(self.query, k=k, filter=filter, fields=self.fields)
+
+    async def search(self, k: int, filter: Optional[Dict] = None, parts: int = 1) -> List[Document]:
+        """Tìm kiếm similarity với vector đã tính sẵn (parts: số bước còn lại chia nhau budget)"""
+        if self.lexical_primary:
+            return self.lexical_search(k, filter)
+        try:
+            query_vector = await self.get_vector()
+        except Exception as e:
+            if self.lexical is None:
+                raise
+            logger.warning(f"Embedding unavailable ({e}), using lexical index")
+            self.degraded = True
+            return self.lexical_search(k, filter)
+        try:
+            return await self._call("search", lambda: self.qdrant.similarity_search_by_vector(
+                query_vector, k=k, filter=filter, fields=self.fields, query_text=self.query
+            ), parts)
+        except Exception as e:
+            # Quá hạn, circuit mở hoặc Qdrant không truy cập được (lỗi khác connector trả về [])
+            if self.lexical is None:
+                raise
+            logger.warning(f"Vector search unavailable ({type(e).__name__}: {e}), using lexical index")
+            self.degraded = True
+            return self.lexical_search(k, filter)
+
+    async def search_batch(self, searches: List[Tuple[int, Optional[Dict]]]) -> List[List[Document]]:
+        """Nhiều tìm kiếm (k, filter) với cùng một vector trong một round trip"""
+        if self.lexical_primary:
+            return [self.lexical_search(k, search_filter) for k, search_filter in searches]
+        try:
+            query_vector = await self.get_vector()
+            return await self._call("search_batch", lambda: self.qdrant.similarity_search_batch(
+                query_vector, searches, fields=self.fields, query_text=self.query
+            ))
+        except Exception as e:
+            if self.lexical is None:
+                raise
+            logger.warning(f"Vector search unavailable ({e}), using lexical index")
+            self.degraded = True
+            return [self.lexical_search(k, search_filter) for k, search_filter in searches]
+
+
 class RAGService:
     """
     Service cho Retrieval Augmented Generation (RAG)
     """
     
-    def __init__(self, qdrant_connector: Optional[QdrantConnector] = None, metadata_extractor: Optional[MetadataExtractor] = None):
+    def __init__(self, qdrant_connector: Optional[QdrantConnector] = None, metadata_extractor: Optional[MetadataExtractor] = None, exact_index: Optional[ExactLookupIndex] = None, lexical_index: Optional[LexicalIndex] = None, retrieval_cache: Optional[RetrievalCache] = None):
         """
         Khởi tạo RAG Service
         
         Args:
             qdrant_connector: QdrantConnector instance (tạo mới nếu không có)
             metadata_extractor: MetadataExtractor instance (tạo mới nếu không có)
+            exact_index: Chỉ mục tra cứu chính xác số bài (rỗng cho tới khi refresh_local_indexes)
+            lexical_index: Chỉ mục BM25 trong bộ nhớ (rỗng cho tới khi refresh_local_indexes)
+            retrieval_cache: Cache kết quả truy xuất (bật khi refresh_local_indexes biết phiên bản collection)
         """
         self.settings = get_settings()
         self.rag_settings = rag_settings
@@ -66,6 +175,57 @@ class RAGService:
             logger.error(f"Failed to initialize MetadataExtractor: {str(e)}")
             self.metadata_extractor = None
             logger.warning("RAG Service initialized without MetadataExtractor. Will use old method.")
+
+        self.exact_index = exact_index or ExactLookupIndex()
+        self.lexical_index = lexical_index or LexicalIndex()
+        self.retrieval_cache = retrieval_cache or RetrievalCache(self.rag_settings.retrieval_cache_size)
+
+        # Metadata đã trích xuất theo câu truy vấn chuẩn hóa (cả rule-based lẫn LLM)
+        self._metadata_cache: "OrderedDict[str, MathQueryMetadata]" = OrderedDict()
+        self.metadata_stats = {"cache_hits": 0, "rule_based": 0, "llm_calls": 0, "llm_fallbacks": 0}
+
+    async def refresh_local_indexes(self, force: bool = False) -> bool:
+        """
+        Dựng lại các chỉ mục trong bộ nhớ (tra cứu chính xác, BM25) nếu collection đã thay đổi;
+        cả hai dùng chung một lần đọc snapshot của collection.
+        Phiên bản collection cũng được ghi nhận cho cache kết quả truy xuất (đổi phiên bản là xóa cache)
+
+        Returns:
+            Boolean: True nếu chỉ mục vừa được dựng lại
+        """
+        source = self.rag_settings.exact_index_source
+        try:
+            collection_version = None
+            if self.qdrant is not None:
+                try:
+                    collection_version = await self.qdrant.collection_fingerprint()
+                    self.retrieval_cache.set_version(collection_version)
+                except Exception as e:
+                    logger.warning(f"Could not read collection version: {e}")
+            if source == "json":
+                if self.exact_index.ready and not force:
+                    return False
+                payloads, file_count = await asyncio.to_thread(
+                    load_processed_payloads, self.rag_settings.exact_index_json_dir
+                )
+                fingerprint = ("json", file_count, len(payloads))
+            elif source == "qdrant" and collection_version is not None:
+                fingerprint = collection_version
+                if not force and fingerprint == self.exact_index.fingerprint:
+                    return False
+                # Trường gốc + fragment render sẵn: lookup chọn theo fragments_version của từng payload
+                fields = SOLUTION_FIELDS + FRAGMENT_FIELDS + ["fragments_version"]
+                fields += [f for f in LEXICAL_TEXT_FIELDS + FILTER_PAYLOAD_FIELDS if f not in fields]
+                payloads = await self.qdrant.scroll_payloads(fields=fields)
+            else:
+                return False
+            self.exact_index.build(payloads, fingerprint=fingerprint)
+            if self.rag_settings.lexical_mode != "off":
+                await asyncio.to_thread(self.lexical_index.build, payloads, fingerprint)
+            return True
+        except Exception as e:
+            logger.warning(f"Could not refresh local indexes: {e}")
+            return False
         
     def _extract_metadata_from_query(self, query: str) -> Dict:
         """
@@ -94,6 +254,84 @@ class RAGService:
             logger.warning(f"Error extracting metadata from query: {str(e)}")
             return {}
     
+    def _rule_based_metadata(self, query: str) -> Tuple[MathQueryMetadata, float]:
+        """
+        Metadata từ parser VN và bộ phân loại từ khóa (không gọi LLM)
+
+        Returns:
+            Tuple[MathQueryMetadata, float]: (metadata, độ tin cậy của requesting_solution/display_mode)
+        """
+        vn = parse_query(query)
+        intent = classify_intent(query)
+        metadata = MathQueryMetadata(
+            category=vn.category,
+            subcategory=vn.subcategory,
+            year=vn.year,
+            question=vn.question_code or vn.question_num,
+            requesting_solution=intent.requesting_solution,
+            display_mode=intent.display_mode
+        )
+        return metadata, intent.confidence
+
+    def _cache_metadata(self, key: str, metadata: MathQueryMetadata) -> None:
+        max_size = self.rag_settings.metadata_cache_size
+        if max_size <= 0:
+            return
+        self._metadata_cache[key] = metadata
+        self._metadata_cache.move_to_end(key)
+        while len(self._metadata_cache) > max_size:
+            self._metadata_cache.popitem(last=False)
+
+    async def _extract_metadata_with_timeout(self, query: str) -> MathQueryMetadata:
+        """
+        Metadata cho câu truy vấn: cache -> rule-based nếu đủ tin cậy -> LLM (có timeout);
+        LLM quá hạn hoặc lỗi thì dùng kết quả rule-based
+        """
+        key = " ".join(normalize_text(query or "").split())
+        cached = self._metadata_cache.get(key)
+        if cached is not None:
+            self._metadata_cache.move_to_end(key)
+            self.metadata_stats["cache_hits"] += 1
+            return cached.model_copy()
+
+        rule_metadata, confidence = self._rule_based_metadata(query)
+        if self.metadata_extractor is None or confidence >= self.rag_settings.intent_confidence_threshold:
+            self.metadata_stats["rule_based"] += 1
+            self._cache_metadata(key, rule_metadata)
+            return rule_metadata.model_copy()
+
+        # Từ khóa mơ hồ: cần LLM
+        self.metadata_stats["llm_calls"] += 1
+        timeout = self.rag_settings.metadata_extraction_timeout
+        try:
+            metadata = await asyncio.wait_for(self.metadata_extractor.extract_metadata(query), timeout=timeout)
+            self._cache_metadata(key, metadata)
+            return metadata.model_copy()
+        except asyncio.TimeoutError:
+            logger.warning(f"Metadata extraction exceeded {timeout}s, using rule-based metadata")
+        except Exception as e:
+            logger.warning(f"Metadata extraction failed, using rule-based metadata: {e}")
+        self.metadata_stats["llm_fallbacks"] += 1
+        return rule_metadata
+
+    async def _get_context_with_timeout(self, query: str, **kwargs) -> Tuple[List[Document], bool]:
+        """get_context trong giới hạn thời gian truy xuất (quá hạn = không có context)"""
+        timeout = self.rag_settings.retrieval_timeout
+        try:
+            return await asyncio.wait_for(self.get_context(query, **kwargs), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Retrieval exceeded {timeout}s, continuing without context")
+            return [], False
+
+    async def _prefetch_query_vector(self, retrieval: Optional[RetrievalContext]) -> None:
+        """Tính trước embedding của câu truy vấn trong lúc chờ việc khác (lỗi được RetrievalContext ghi nhớ)"""
+        if retrieval is None or retrieval.lexical_primary:
+            return
+        try:
+            await asyncio.wait_for(retrieval.get_vector(), timeout=self.rag_settings.retrieval_timeout)
+        except Exception as e:
+            logger.debug(f"Query embedding prefetch failed: {e}")
+
     def _log_document_details(self, documents: List[Document], prefix: str = ""):
         """
         Log chi tiết về các documents tìm được để debug
@@ -124,7 +362,8 @@ class RAGService:
         filter: Optional[Dict] = None,
         k: Optional[int] = None,
         use_query_metadata: bool = True,
-        problem_only: bool = False
+        problem_only: bool = False,
+        payload_fields: Optional[str] = None
     ) -> Tuple[List[Document], bool]:
         """
         Lấy ngữ cảnh cho truy vấn từ vector database
@@ -136,6 +375,8 @@ class RAGService:
             k: Số lượng documents lấy về
             use_query_metadata: Có trích xuất metadata từ câu truy vấn không
             problem_only: Chỉ lấy đề bài không lấy lời giải
+            payload_fields: Field set payload ("display", "solution", "search", "display_raw", "solution_raw");
+                mặc định "display" nếu problem_only, ngược lại "solution"
             
         Returns:
             Tuple[List[Document], bool]: (documents, success_flag)
@@ -199,150 +440,48 @@ class RAGService:
             else:
                 logger.info(f"Using standard top_k = {k}")
             
-            # Chiến lược tìm kiếm theo thứ tự ưu tiên
+            # Chiến lược tìm kiếm theo thứ tự ưu tiên (dùng chung một embedding)
+            payload_fields = payload_fields or ("display" if problem_only else "solution")
+            budget_ms = self.rag_settings.retrieval_budget_ms
+            deadline = Deadline(budget_ms / 1000) if budget_ms > 0 else None
+            retrieval = RetrievalContext(
+                self.qdrant, query, fields=payload_fields, lexical=self.lexical_index, deadline=deadline
+            )
+            tiers = self._plan_search_tiers(combined_filter)
             documents = []
             search_success = False
-            
-            # 1. Tìm kiếm chính xác với số bài
-            if "question_number" in combined_filter or "problem_section" in combined_filter:
-                # Determine filter type and value
-                if "question_number" in combined_filter:
-                    q_val = str(combined_filter["question_number"]).strip()
-                    logger.info(f"STRATEGY 1: Exact search with question_number: {q_val}")
-                    exact_search_filter = {"question_number": q_val}
-                elif "problem_section" in combined_filter:
-                    section_val = str(combined_filter["problem_section"]).strip()
-                    logger.info(f"STRATEGY 1: Section search with problem_section: {section_val}")
-                    exact_search_filter = {"problem_section": section_val}
-                else:
-                    logger.warning("STRATEGY 1: No valid question filter found")
-                    exact_search_filter = None
-                
-                # Thêm năm nếu có và filter hợp lệ
-                if exact_search_filter and "year" in combined_filter:
-                    exact_search_filter["year"] = combined_filter["year"]
-                    logger.info(f"Adding year {combined_filter['year']} to exact search filter")
-                
-                # Bảng nếu có và filter hợp lệ
-                if exact_search_filter and "subcategory" in combined_filter and combined_filter["subcategory"] in ("bangA", "bangB"):
-                    exact_search_filter["subcategory"] = combined_filter["subcategory"]
-                    exact_search_filter["category"] = "dethi"
-                
-                if exact_search_filter:
-                    try:
-                        # Tìm kiếm chính xác theo số bài (và năm/board nếu có)
-                        logger.info(f"Executing exact search with filter: {exact_search_filter}")
-                        exact_docs = await self.qdrant.similarity_search(
-                            query=query, 
-                            k=k,
-                            filter=exact_search_filter
-                        )
-                    
-                        if exact_docs:
-                            self._log_document_details(exact_docs, "STRATEGY 1:")
-                            documents = exact_docs
-                            search_success = True
-                            logger.info("STRATEGY 1 successful - using these results")
-                        else:
-                            logger.info("STRATEGY 1: No documents found with exact question match")
-                    except Exception as e:
-                        logger.warning(f"STRATEGY 1: Error during exact search: {e}")
-            
-            # 2. Nếu không tìm thấy theo số bài, tìm theo chủ đề (tags) và số bài kết hợp
-            if not documents and "tags" in combined_filter and "question" in combined_filter:
-                logger.info(f"STRATEGY 2: Topic + Question search with tags: {combined_filter['tags']} and question: {combined_filter['question']}")
-                topic_question_filter = {
-                    "tags": combined_filter["tags"],
-                    "question": combined_filter["question"]
-                }
-                
-                try:
-                    logger.info(f"Executing topic+question search with filter: {topic_question_filter}")
-                    topic_question_docs = await self.qdrant.similarity_search(
-                        query=query, 
-                        k=k,
-                        filter=topic_question_filter
-                    )
-                    
-                    if topic_question_docs:
-                        self._log_document_details(topic_question_docs, "STRATEGY 2:")
-                        documents = topic_question_docs
-                        search_success = True
-                        logger.info("STRATEGY 2 successful - using these results")
-                    else:
-                        logger.info("STRATEGY 2: No documents found with topic + question match")
-                except Exception as e:
-                    logger.warning(f"STRATEGY 2: Error during topic + question search: {e}")
-            
-            # 3. Nếu không tìm thấy theo số bài kết hợp tags, tìm theo chỉ riêng tags
-            if not documents and "tags" in combined_filter:
-                logger.info(f"STRATEGY 3: Topic search with tags: {combined_filter['tags']}")
-                topic_search_filter = {"tags": combined_filter["tags"]}
-                
-                # Thêm năm nếu có
-                if "year" in combined_filter:
-                    topic_search_filter["year"] = combined_filter["year"]
-                    logger.info(f"Adding year {combined_filter['year']} to topic search filter")
-                
-                try:
-                    logger.info(f"Executing topic search with filter: {topic_search_filter}")
-                    topic_docs = await self.qdrant.similarity_search(
-                        query=query, 
-                        k=k,
-                        filter=topic_search_filter
-                    )
-                    
-                    if topic_docs:
-                        self._log_document_details(topic_docs, "STRATEGY 3:")
-                        documents = topic_docs
-                        search_success = True
-                        logger.info("STRATEGY 3 successful - using these results")
-                    else:
-                        logger.info("STRATEGY 3: No documents found with topic match")
-                except Exception as e:
-                    logger.warning(f"STRATEGY 3: Error during topic search: {e}")
-            
-            # 4. Cuối cùng, tìm kiếm với filter đầy đủ, hoặc không có filter nếu các cách trên thất bại
-            if not documents:
-                search_filter = combined_filter if combined_filter else None
-                logger.info(f"STRATEGY 4: Full semantic search with filter: {search_filter}")
-                
-                try:
-                    logger.info(f"Executing semantic search with filter: {search_filter}")
-                    semantic_docs = await self.qdrant.similarity_search(
-                        query=query, 
-                        k=k, 
-                        filter=search_filter
-                    )
-                    
-                    if semantic_docs:
-                        self._log_document_details(semantic_docs, "STRATEGY 4:")
-                        documents = semantic_docs
-                        search_success = True
-                        logger.info("STRATEGY 4 successful - using these results")
-                    else:
-                        logger.warning(f"STRATEGY 4: No documents found for query with filter: {query}")
-                except Exception as e:
-                    logger.error(f"STRATEGY 4: Error in semantic search: {e}")
-                    
-                    # Thử lại lần cuối không có filter nếu trước đó có dùng filter
-                    if search_filter:
-                        try:
-                            logger.info("STRATEGY 5: Final attempt - semantic search without filter")
-                            final_docs = await self.qdrant.similarity_search(
-                                query=query, 
-                                k=k
-                            )
-                            
-                            if final_docs:
-                                self._log_document_details(final_docs, "STRATEGY 5:")
-                                documents = final_docs
-                                search_success = True
-                                logger.info("STRATEGY 5 successful - using these results")
-                            else:
-                                logger.warning("STRATEGY 5: No documents found even without filter")
-                        except Exception as retry_e:
-                            logger.error(f"STRATEGY 5: Final attempt failed: {retry_e}")
+
+            # Cùng filter + câu truy vấn trên cùng phiên bản collection: kết quả không đổi, bỏ qua Qdrant
+            cache_key = self.retrieval_cache.make_key(query, combined_filter, k, payload_fields)
+            cached_docs = self.retrieval_cache.get(cache_key)
+            if cached_docs:
+                logger.info(f"Retrieval cache hit ({len(cached_docs)} docs)")
+                documents = cached_docs
+                search_success = True
+                tiers = []
+
+            # Tra cứu chính xác số bài trong bộ nhớ: không embedding, không round trip
+            if tiers and tiers[0][0] == "STRATEGY 1":
+                exact_docs = self.exact_index.lookup(tiers[0][1], k, fields=payload_fields)
+                if exact_docs:
+                    self._log_document_details(exact_docs, "STRATEGY 1 (exact index):")
+                    logger.info("STRATEGY 1 answered from exact lookup index")
+                    documents = exact_docs
+                    search_success = True
+                    tiers = []
+
+            # Gửi đồng thời mọi chiến lược trong một batch, chọn tầng ưu tiên cao nhất có kết quả
+            batched = None
+            if self.rag_settings.concurrent_search_tiers and len(tiers) > 1:
+                batched = await self._batched_tier_search(retrieval, tiers, k)
+            if batched is not None:
+                documents = batched
+                search_success = bool(documents)
+            elif tiers:
+                documents = await self._sequential_tier_search(retrieval, tiers, k)
+                search_success = bool(documents)
+            if tiers and search_success and not retrieval.degraded:
+                self.retrieval_cache.put(cache_key, documents)
             
             # Đánh dấu documents nếu người dùng chỉ muốn xem đề bài
             if documents and problem_only:
@@ -365,6 +504,9 @@ class RAGService:
             
             # Không tìm thấy gì cả
             elapsed = time.time() - start_time
+            if retrieval.deadline is not None and retrieval.deadline.expired:
+                logger.warning(f"Retrieval budget of {retrieval.deadline.budget * 1000:.0f}ms exhausted, "
+                               f"answering without RAG context")
             logger.warning(f"❌ RAG FAILED: No documents found in {elapsed:.2f}s")
             return [], False
             
@@ -374,6 +516,139 @@ class RAGService:
             logger.error(f"Error retrieving context: {error_type} - {e}")
             return [], False
     
+    def _plan_search_tiers(self, combined_filter: Dict) -> List[Tuple[str, Optional[Dict]]]:
+        """
+        Lập danh sách các chiến lược tìm kiếm áp dụng được, theo thứ tự ưu tiên
+
+        Args:
+            combined_filter: Filter đã gộp từ request và parser VN
+
+        Returns:
+            List[Tuple[str, Optional[Dict]]]: (tên chiến lược, filter) - tầng đầu tiên có kết quả được dùng
+        """
+        tiers = []
+
+        # 1. Tìm kiếm chính xác với số bài
+        exact_search_filter = None
+        if "question_number" in combined_filter:
+            q_val = str(combined_filter["question_number"]).strip()
+            logger.info(f"STRATEGY 1: Exact search with question_number: {q_val}")
+            exact_search_filter = {"question_number": q_val}
+        elif "problem_section" in combined_filter:
+            section_val = str(combined_filter["problem_section"]).strip()
+            logger.info(f"STRATEGY 1: Section search with problem_section: {section_val}")
+            exact_search_filter = {"problem_section": section_val}
+        if exact_search_filter:
+            # Thêm năm nếu có
+            if "year" in combined_filter:
+                exact_search_filter["year"] = combined_filter["year"]
+                logger.info(f"Adding year {combined_filter['year']} to exact search filter")
+            # Bảng nếu có
+            if combined_filter.get("subcategory") in ("bangA", "bangB"):
+                exact_search_filter["subcategory"] = combined_filter["subcategory"]
+                exact_search_filter["category"] = "dethi"
+            tiers.append(("STRATEGY 1", exact_search_filter))
+
+        # 2. Tìm theo chủ đề (tags) và số bài kết hợp
+        if "tags" in combined_filter and "question" in combined_filter:
+            tiers.append(("STRATEGY 2", {
+                "tags": combined_filter["tags"],
+                "question": combined_filter["question"]
+            }))
+
+        # 3. Tìm theo chỉ riêng tags (thêm năm nếu có)
+        if "tags" in combined_filter:
+            topic_search_filter = {"tags": combined_filter["tags"]}
+            if "year" in combined_filter:
+                topic_search_filter["year"] = combined_filter["year"]
+            tiers.append(("STRATEGY 3", topic_search_filter))
+
+        # 4. Tìm kiếm với filter đầy đủ, hoặc không có filter
+        tiers.append(("STRATEGY 4", combined_filter if combined_filter else None))
+        return tiers
+
+    async def _sequential_tier_search(
+        self,
+        retrieval: RetrievalContext,
+        tiers: List[Tuple[str, Optional[Dict]]],
+        k: int
+    ) -> List[Document]:
+        """
+        Chạy lần lượt từng chiến lược, dừng ở tầng đầu tiên có kết quả;
+        mỗi tầng được chia phần budget còn lại (hết budget thì dừng, trả lời không có context)
+        """
+        for index, (name, tier_filter) in enumerate(tiers):
+            if retrieval.deadline is not None and retrieval.deadline.expired:
+                logger.warning(f"Retrieval budget exhausted before {name}, continuing without context")
+                retrieval.degraded = True
+                break
+            try:
+                logger.info(f"{name}: Executing search with filter: {tier_filter}")
+                docs = await retrieval.search(k=k, filter=tier_filter, parts=len(tiers) - index)
+            except CircuitOpenError as e:
+                logger.warning(f"{name}: {e}, continuing without context")
+                retrieval.degraded = True
+                break
+            except Exception as e:
+                logger.warning(f"{name}: Error during search: {e}")
+                # Tầng ưu tiên cao hơn lỗi: kết quả của tầng sau không được cache dưới khóa này
+                retrieval.degraded = True
+                # 5. Thử lại lần cuối không có filter nếu tìm kiếm đầy đủ lỗi
+                if name == "STRATEGY 4" and tier_filter:
+                    try:
+                        logger.info("STRATEGY 5: Final attempt - semantic search without filter")
+                        # Kết quả không filter cho truy vấn có filter: không cache
+                        retrieval.degraded = True
+                        final_docs = await retrieval.search(k=k)
+                        if final_docs:
+                            self._log_document_details(final_docs, "STRATEGY 5:")
+                            logger.info("STRATEGY 5 successful - using these results")
+                            return final_docs
+                        logger.warning("STRATEGY 5: No documents found even without filter")
+                    except Exception as retry_e:
+                        logger.error(f"STRATEGY 5: Final attempt failed: {retry_e}")
+                continue
+
+            if docs:
+                self._log_document_details(docs, f"{name}:")
+                logger.info(f"{name} successful - using these results")
+                return docs
+            logger.info(f"{name}: No documents found")
+        return []
+
+    async def _batched_tier_search(
+        self,
+        retrieval: RetrievalContext,
+        tiers: List[Tuple[str, Optional[Dict]]],
+        k: int
+    ) -> Optional[List[Document]]:
+        """
+        Gửi mọi chiến lược trong một lần query_batch_points (một round trip, một embedding)
+        và chọn tầng ưu tiên cao nhất có kết quả
+
+        Returns:
+            Optional[List[Document]]: Kết quả (có thể rỗng), None nếu batch lỗi và cần chạy tuần tự
+        """
+        try:
+            logger.info(f"Executing {len(tiers)} search tiers in one batch: {[name for name, _ in tiers]}")
+            results = await retrieval.search_batch([(k, tier_filter) for _, tier_filter in tiers])
+        except CircuitOpenError as e:
+            # Embedding/Qdrant đang ngắt mạch và không có BM25: chạy tuần tự cũng chỉ lỗi tiếp
+            logger.warning(f"{e}, continuing without context")
+            return []
+        except Exception as e:
+            logger.warning(f"Batched tier search failed, falling back to sequential search: {e}")
+            retrieval.degraded = True
+            return None
+
+        for (name, _), docs in zip(tiers, results):
+            if docs:
+                self._log_document_details(docs, f"{name}:")
+                logger.info(f"{name} successful - using these results")
+                return docs
+            logger.info(f"{name}: No documents found")
+        return []
+
     def format_context_for_prompt(self, documents: List[Document]) -> str:
         """
         Định dạng documents thành context cho prompt (ưu tiên natural_*)
@@ -410,21 +685,26 @@ class RAGService:
             - formatted_context: Context đã định dạng hoặc rỗng nếu lỗi
             - success_flag: True nếu retrieval thành công, False nếu fallback
         """
-        # Trích xuất metadata để xác định display_mode
-        metadata = None
-        if self.metadata_extractor and use_query_metadata:
-            try:
-                metadata = await self.metadata_extractor.extract_metadata(query)
-                logger.info(f"Extracted metadata for formatting: {metadata}")
-            except Exception as e:
-                logger.warning(f"Error extracting metadata for formatting: {str(e)}")
-        
-        documents, success = await self.get_context(query, filter, k, use_query_metadata)
+        # Truy xuất và trích xuất metadata (chỉ quyết định display_mode) chạy đồng thời, mỗi việc có timeout riêng;
+        # filter do parser VN quyết định nên truy xuất không cần chờ metadata
+        context_task = self._get_context_with_timeout(
+            query, filter=filter, k=k, use_query_metadata=use_query_metadata, payload_fields="solution_raw"
+        )
+        if use_query_metadata:
+            (documents, success), metadata = await asyncio.gather(
+                context_task, self._extract_metadata_with_timeout(query)
+            )
+            logger.info(f"Extracted metadata for formatting: {metadata}")
+        else:
+            documents, success = await context_task
+            metadata = None
+
+        display_mode = bool(metadata and getattr(metadata, 'display_mode', False))
         if not success:
             return "", False
         
         # Sử dụng display_mode nếu có
-        if metadata and hasattr(metadata, 'display_mode') and metadata.display_mode:
+        if display_mode:
             logger.info("Using display mode for problem presentation")
             return self.format_context_for_display(documents, query), True
         else:
@@ -434,25 +714,20 @@ class RAGService:
         """
         Truy xuất context sử dụng tiered search strategy
         """
+        prefetch = None
         try:
-            # Bước 1: Trích xuất metadata
-            if self.metadata_extractor:
-                metadata = await self.metadata_extractor.extract_metadata(query)
-                logger.info(f"Extracted metadata: {metadata}")
-            else:
-                # Fallback to old method
-                metadata_dict = self._extract_metadata_from_query(query)
-                metadata = MathQueryMetadata(
-                    year=metadata_dict.get('year'),
-                    exam=metadata_dict.get('exam'),
-                    question=metadata_dict.get('question'),
-                    level=metadata_dict.get('level'),
-                    tags=metadata_dict.get('tags'),
-                    requesting_solution=metadata_dict.get('requesting_solution', False)
-                )
+            # Bước 1: Trích xuất metadata (có timeout), đồng thời tính trước embedding cho tầng 2 và 3
+            # (bị hủy nếu tầng 1 đã trả lời: tầng 1 không cần vector)
+            retrieval = (
+                RetrievalContext(self.qdrant, query, fields="solution_raw", lexical=self.lexical_index)
+                if self.qdrant else None
+            )
+            prefetch = asyncio.ensure_future(self._prefetch_query_vector(retrieval))
+            metadata = await self._extract_metadata_with_timeout(query)
+            logger.info(f"Extracted metadata: {metadata}")
             
             # Bước 2: Tiered search
-            documents = await self._tiered_search(metadata, query, top_k)
+            documents = await self._tiered_search(metadata, query, top_k, retrieval, prefetch)
             
             # Bước 3: Tag context
             tagged_documents = self._tag_retrieved_context(documents, metadata.requesting_solution)
@@ -463,10 +738,19 @@ class RAGService:
             logger.error(f"Error in get_context_with_tiered_search: {str(e)}")
             # Fallback: semantic search
             return await self._semantic_search_fallback(query, top_k)
+        finally:
+            if prefetch is not None and not prefetch.done():
+                prefetch.cancel()
     
-    async def _tiered_search(self, metadata: MathQueryMetadata, query: str, top_k: int) -> List[Document]:
+    async def _tiered_search(
+        self, metadata: MathQueryMetadata, query: str, top_k: int,
+        retrieval: Optional[RetrievalContext] = None, prefetch: Optional[asyncio.Future] = None
+    ) -> List[Document]:
         """
         Thực hiện tìm kiếm 3 tầng
+
+        Args:
+            prefetch: Task tính trước embedding; bị hủy khi tầng 1 (không cần vector) đã có kết quả
         """
         
         # Tầng 1: Exact metadata matching
@@ -475,18 +759,33 @@ class RAGService:
             documents = await self._exact_metadata_search(metadata, top_k)
             if documents:
                 logger.info(f"Tier 1 successful: found {len(documents)} documents")
+                if prefetch is not None and not prefetch.done():
+                    # Hủy trước khi embedding vào cache / kho trên đĩa
+                    prefetch.cancel()
                 return documents
+
+        # Chờ embedding đang tính trước để tầng 2 và 3 không gọi API lần nữa
+        if prefetch is not None:
+            await prefetch
+        
+        # Tầng 2 và 3 dùng chung một embedding của câu truy vấn (chỉ lấy lời giải khi được yêu cầu);
+        # _tag_retrieved_context định dạng lại từ trường gốc nên không dùng fragment
+        payload_fields = "solution_raw" if metadata.requesting_solution else "display_raw"
+        if retrieval is not None:
+            retrieval.fields = payload_fields
+        elif self.qdrant:
+            retrieval = RetrievalContext(self.qdrant, query, fields=payload_fields, lexical=self.lexical_index)
         
         # Tầng 2: Hybrid search (metadata + semantic)
         logger.info("Trying Tier 2: Hybrid search")
-        documents = await self._hybrid_search(metadata, query, top_k)
+        documents = await self._hybrid_search(metadata, query, top_k, retrieval)
         if documents:
             logger.info(f"Tier 2 successful: found {len(documents)} documents")
             return documents
         
         # Tầng 3: Pure semantic search
         logger.info("Trying Tier 3: Pure semantic search")
-        documents = await self._semantic_search_fallback(query, top_k)
+        documents = await self._semantic_search_fallback(query, top_k, retrieval)
         logger.info(f"Tier 3 successful: found {len(documents)} documents")
         return documents
 
@@ -511,16 +810,16 @@ class RAGService:
                 query_filter["exam"] = metadata.exam
             if getattr(metadata, "source", None):
                 query_filter["source"] = metadata.source
-            # Nếu chỉ filter, dùng HTTP API
-            results = self.qdrant.search_with_filter_http(query_filter, limit=top_k)
-            # Chuyển đổi kết quả HTTP thành Document nếu cần
-            # ... giữ nguyên logic chuyển đổi ...
-            return results
+            # Chỉ filter: scroll (không vector, không tính điểm)
+            return await self.qdrant.scroll_by_filter(query_filter, limit=top_k, fields="solution_raw")
         except Exception as e:
             logger.error(f"Error in exact metadata search: {str(e)}")
             return []
 
-    async def _hybrid_search(self, metadata: MathQueryMetadata, query: str, top_k: int) -> List[Document]:
+    async def _hybrid_search(
+        self, metadata: MathQueryMetadata, query: str, top_k: int,
+        retrieval: Optional[RetrievalContext] = None
+    ) -> List[Document]:
         """Tầng 2: Tìm kiếm lai (metadata + semantic)"""
         try:
             if not self.qdrant:
@@ -540,34 +839,33 @@ class RAGService:
                 query_filter["source"] = metadata.source
             # Nếu không có filter nào, chuyển sang semantic
             if not query_filter:
-                return await self._semantic_search_fallback(query, top_k)
-            # Nếu chỉ filter, dùng HTTP API
+                return await self._semantic_search_fallback(query, top_k, retrieval)
+            # Nếu chỉ filter, dùng scroll (không vector)
             if not query:
-                results = self.qdrant.search_with_filter_http(query_filter, limit=top_k)
-                # Chuyển đổi kết quả HTTP thành Document nếu cần
-                # ... giữ nguyên logic chuyển đổi ...
-                return results
-            # Nếu có vector, dùng similarity_search như cũ
-            results = await self.qdrant.similarity_search(
-                query=query,
-                k=top_k,
-                filter=query_filter
+                return await self.qdrant.scroll_by_filter(
+                    query_filter, limit=top_k, fields=retrieval.fields if retrieval else "solution_raw"
+                )
+            # Nếu có câu truy vấn, tìm similarity với embedding dùng chung
+            retrieval = retrieval or RetrievalContext(
+                self.qdrant, query, fields="solution_raw", lexical=self.lexical_index
             )
+            results = await retrieval.search(k=top_k, filter=query_filter)
             return results
         except Exception as e:
             logger.error(f"Error in hybrid search: {str(e)}")
-            return await self._semantic_search_fallback(query, top_k)
+            return await self._semantic_search_fallback(query, top_k, retrieval)
 
-    async def _semantic_search_fallback(self, query: str, top_k: int) -> List[Document]:
+    async def _semantic_search_fallback(
+        self, query: str, top_k: int, retrieval: Optional[RetrievalContext] = None
+    ) -> List[Document]:
         """Tầng 3: Tìm kiếm ngữ nghĩa thuần túy"""
         try:
             if not self.qdrant:
                 return []
-            results = await self.qdrant.similarity_search(
-                query=query,
-                k=top_k,
-                filter=None
+            retrieval = retrieval or RetrievalContext(
+                self.qdrant, query, fields="solution_raw", lexical=self.lexical_index
             )
+            results = await retrieval.search(k=top_k, filter=None)
             return results
         except Exception as e:
             logger.error(f"Error in semantic search: {str(e)}")
@@ -645,7 +943,8 @@ class RAGService:
         filter: Optional[Dict] = None,
         k: Optional[int] = None,
         use_query_metadata: bool = True,
-        problem_only: bool = False
+        problem_only: bool = False,
+        payload_fields: Optional[str] = None
     ) -> Tuple[List[Document], bool]:
         """
         Lấy ngữ cảnh với xem xét chat history để xử lý follow-up questions
@@ -678,7 +977,8 @@ class RAGService:
                 filter=filter,
                 k=k,
                 use_query_metadata=use_query_metadata,
-                problem_only=problem_only
+                problem_only=problem_only,
+                payload_fields=payload_fields
             )
             
         except Exception as e:
@@ -0,0 +1,92 @@
+"""
+Cache of retrieval results for repeated (filtered) lookups.
+- Key: resolved filter + k + payload field set + normalised query
+- Value: the projected payloads (and page_content) of the hits; each hit gets fresh Document copies
+- Invalidated as a whole when the collection version (Qdrant collection fingerprint) changes
+- Size-bounded LRU; hit/miss counters for monitoring
+"""
+from __future__ import annotations
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+from .query_extractor_vn import normalize_text
+
+RetrievalKey = Tuple[str, int, str, str]
+
+
+class RetrievalCache:
+    """
+    Cache kết quả truy xuất theo phiên bản collection: ingest lại dữ liệu là cache tự làm mới
+    """
+
+    def __init__(self, max_size: int = 512):
+        self.max_size = max_size
+        self.version: Optional[Hashable] = None
+        self._entries: "OrderedDict[RetrievalKey, List[Tuple[str, Dict[str, Any]]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        # Chưa biết phiên bản collection thì không cache (không có cách nào biết khi nào hết hạn)
+        return self.max_size > 0 and self.version is not None
+
+    @staticmethod
+    def make_key(query: str, filter: Optional[Dict], k: int, fields: str) -> RetrievalKey:
+        filter_key = json.dumps(filter or {}, sort_keys=True, ensure_ascii=False, default=str)
+        return filter_key, k, fields, " ".join(normalize_text(query).split())
+
+    def set_version(self, version: Hashable) -> None:
+        """Ghi nhận phiên bản collection hiện tại; xóa cache nếu phiên bản đã đổi"""
+        with self._lock:
+            if version == self.version:
+                return
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self.version = version
+
+    def get(self, key: RetrievalKey) -> Optional[List[Document]]:
+        if not self.enabled:
+            return None
+        with self._lock:
+            hits = self._entries.get(key)
+            if hits is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        # Bản sao mới cho mỗi request (metadata bị gắn cờ theo từng request, vd. _looking_for_problem_only)
+        return [Document(page_content=page_content, metadata=dict(metadata)) for page_content, metadata in hits]
+
+    def put(self, key: RetrievalKey, documents: List[Document]) -> None:
+        if not self.enabled or not documents:
+            return
+        hits = [(doc.page_content, dict(doc.metadata)) for doc in documents]
+        with self._lock:
+            self._entries[key] = hits
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "enabled": self.enabled,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "invalidations": self.invalidations,
+        }
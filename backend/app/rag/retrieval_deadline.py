@@ -0,0 +1,149 @@
+"""
+Deadline-aware retrieval: one latency budget per request, hedged Qdrant calls.
+- Deadline: total retrieval budget of a request; each step (embedding, search tier) gets a slice
+- LatencyTracker: rolling latency window per operation (p95) + hedge / deadline counters
+- hedged(): when a call outlives the p95 of its operation, a duplicate is sent and the first
+  successful response wins (the other one is cancelled)
+- Running out of budget raises asyncio.TimeoutError; callers fall back (BM25 / no context)
+"""
+from __future__ import annotations
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class Deadline:
+    """
+    Hạn chót của một request truy xuất (tính theo đồng hồ monotonic)
+    """
+
+    def __init__(self, budget_seconds: float):
+        self.budget = budget_seconds
+        self.expires_at = time.monotonic() + budget_seconds
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def slice(self, parts: int = 1, share: float = 1.0) -> float:
+        """Phần thời gian cho một bước: min(share * budget, remaining / parts)"""
+        return min(self.budget * share, self.remaining() / max(parts, 1))
+
+
+class LatencyTracker:
+    """
+    Độ trễ gần đây của từng loại thao tác (embedding, search, search_batch) để tính p95
+    """
+
+    def __init__(self, window: int = 200, min_samples: int = 20):
+        self.window = window
+        self.min_samples = min_samples
+        self._samples: Dict[str, Deque[float]] = {}
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.deadline_exceeded = 0
+
+    def record(self, operation: str, seconds: float) -> None:
+        samples = self._samples.get(operation)
+        if samples is None:
+            samples = self._samples[operation] = deque(maxlen=self.window)
+        samples.append(seconds)
+
+    def p95(self, operation: str) -> Optional[float]:
+        """p95 độ trễ của thao tác, None nếu chưa đủ mẫu"""
+        samples = self._samples.get(operation)
+        if not samples or len(samples) < self.min_samples:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+    def stats(self) -> Dict[str, Any]:
+        p95_ms = {}
+        for operation in self._samples:
+            p95 = self.p95(operation)
+            if p95 is not None:
+                p95_ms[operation] = round(p95 * 1000, 1)
+        return {
+            "p95_ms": p95_ms,
+            "samples": {operation: len(samples) for operation, samples in self._samples.items()},
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "deadline_exceeded": self.deadline_exceeded,
+        }
+
+
+async def hedged(
+    operation: str,
+    factory: Callable[[], Awaitable[Any]],
+    timeout: float,
+    tracker: "LatencyTracker",
+    hedge: bool = True,
+) -> Any:
+    """
+    Chạy factory() trong giới hạn timeout; gửi thêm một bản sao nếu vượt p95 của thao tác
+
+    Args:
+        operation: Tên thao tác để tra p95 và ghi độ trễ
+        factory: Hàm tạo coroutine gọi upstream (gọi lại được cho request dự phòng)
+        timeout: Thời gian tối đa (giây) cho cả lời gọi chính lẫn bản sao
+        tracker: LatencyTracker dùng chung
+        hedge: Cho phép gửi request dự phòng
+
+    Raises:
+        asyncio.TimeoutError: Hết thời gian mà chưa có phản hồi thành công
+    """
+    if timeout <= 0:
+        tracker.deadline_exceeded += 1
+        raise asyncio.TimeoutError(f"No retrieval budget left for {operation}")
+
+    loop = asyncio.get_running_loop()
+    expires_at = loop.time() + timeout
+    started: Dict[asyncio.Future, float] = {}
+
+    def launch() -> asyncio.Future:
+        task = asyncio.ensure_future(factory())
+        started[task] = loop.time()
+        return task
+
+    primary = launch()
+    pending = {primary}
+    error: Optional[BaseException] = None
+    try:
+        hedge_after = tracker.p95(operation) if hedge else None
+        if hedge_after is not None and hedge_after < timeout:
+            done, _ = await asyncio.wait(pending, timeout=hedge_after)
+            if not done:
+                tracker.hedges += 1
+                logger.info(f"{operation} slower than p95 ({hedge_after * 1000:.0f}ms), sending hedge request")
+                pending.add(launch())
+
+        while pending:
+            remaining = expires_at - loop.time()
+            done, pending = await asyncio.wait(
+                pending, timeout=max(remaining, 0), return_when=asyncio.FIRST_COMPLETED
+            )
+            if not done:
+                tracker.deadline_exceeded += 1
+                raise asyncio.TimeoutError(f"{operation} exceeded its {timeout * 1000:.0f}ms budget")
+            for task in done:
+                if task.exception() is None:
+                    tracker.record(operation, loop.time() - started[task])
+                    if task is not primary:
+                        tracker.hedge_wins += 1
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+# Độ trễ truy xuất dùng chung cho toàn bộ process
+retrieval_latency = LatencyTracker()
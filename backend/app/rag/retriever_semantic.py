@@ -2,41 +2,51 @@
 Semantic-only retriever using Qdrant query_points and Vietnamese query parsing.
 - Uses named vector 'semantic_vector'
 - Applies filters: category, subcategory, metadata.year (if present)
+- Async: shares the pooled AsyncQdrantClient/AsyncOpenAI connections of the backend
 - Returns raw Qdrant points
 """
 from __future__ import annotations
+import asyncio
 from typing import Optional, List, Any
-from qdrant_client import QdrantClient
-from qdrant_client.http import models
-from openai import OpenAI
+from qdrant_client import AsyncQdrantClient
+from openai import AsyncOpenAI
 import os
 
 from .query_extractor_vn import parse_query, build_qdrant_filter
+from .embedding_store import EmbeddingStore
 
 
 class SemanticRetriever:
-    def __init__(self, qdrant: QdrantClient, openai_client: OpenAI, collection_name: str, embedding_model: str = "text-embedding-3-small"):
+    def __init__(self, qdrant: AsyncQdrantClient, openai_client: AsyncOpenAI, collection_name: str, embedding_model: str = "text-embedding-3-small", embedding_store: Optional[EmbeddingStore] = None):
         self.qdrant = qdrant
         self.openai = openai_client
         self.collection = collection_name
         self.embedding_model = embedding_model
+        self.embedding_store = embedding_store
 
-    def embed(self, text: str):
-        resp = self.openai.embeddings.create(model=self.embedding_model, input=text)
-        return resp.data[0].embedding
+    async def embed(self, text: str):
+        if self.embedding_store is not None:
+            stored = await asyncio.to_thread(self.embedding_store.get, text, self.embedding_model)
+            if stored is not None:
+                return stored
+        resp = await self.openai.embeddings.create(model=self.embedding_model, input=text)
+        vec = resp.data[0].embedding
+        if self.embedding_store is not None:
+            await asyncio.to_thread(self.embedding_store.put, text, self.embedding_model, vec)
+        return vec
 
-    def retrieve(self, query: str, top_k: int = 10) -> List[Any]:
+    async def retrieve(self, query: str, top_k: int = 10) -> List[Any]:
         parsed = parse_query(query)
-        vec = self.embed(parsed.normalized_query)
+        vec = await self.embed(parsed.normalized_query)
         qfilter = build_qdrant_filter(parsed.category, parsed.subcategory, parsed.year)
 
-        req = models.QueryRequest(
-            query=models.NearestQuery(vector=models.NamedVector(name="semantic_vector", vector=vec)),
+        res = await self.qdrant.query_points(
+            collection_name=self.collection,
+            query=vec,
+            using="semantic_vector",
+            query_filter=qfilter,
             limit=top_k,
             with_payload=True,
             with_vectors=False,
-            filter=qfilter,
         )
-        res = self.qdrant.query_points(collection_name=self.collection, query=req)
         return list(res.points or [])
-
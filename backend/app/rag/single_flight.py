@@ -0,0 +1,99 @@
+"""
+Single-flight coalescing of identical in-flight LLM generations.
+- The first request for a key starts one upstream generation (a separate task)
+- Later requests with the same key subscribe: they get the chunks produced so far, then live chunks
+- The flight is forgotten as soon as it finishes; the upstream task is cancelled when every subscriber left
+- Callers keep their own side effects (each chat still saves its own messages)
+"""
+from __future__ import annotations
+import asyncio
+import logging
+from typing import Any, AsyncGenerator, AsyncIterator, Callable, Dict, Hashable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_END = object()
+
+
+class _Flight:
+    def __init__(self):
+        self.chunks: List[str] = []
+        self.subscribers: List[asyncio.Queue] = []
+        self.task: Optional[asyncio.Task] = None
+
+
+class SingleFlight:
+    """
+    Gộp các generation giống nhau đang chạy đồng thời thành một lần gọi upstream
+    """
+
+    def __init__(self):
+        self._flights: Dict[Hashable, _Flight] = {}
+        self.started = 0
+        self.coalesced = 0
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._flights
+
+    async def _run(self, key: Hashable, flight: _Flight, factory: Callable[[], AsyncIterator[str]]) -> None:
+        end: Any = _END
+        try:
+            async for chunk in factory():
+                flight.chunks.append(chunk)
+                for queue in flight.subscribers:
+                    queue.put_nowait(chunk)
+        except asyncio.CancelledError:
+            end = asyncio.CancelledError()
+            raise
+        except Exception as e:
+            end = e
+        finally:
+            # Request mới đến sau thời điểm này sẽ khởi động một flight khác
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+            for queue in flight.subscribers:
+                queue.put_nowait(end)
+
+    async def stream(self, key: Hashable, factory: Callable[[], AsyncIterator[str]]) -> AsyncGenerator[str, None]:
+        """
+        Stream kết quả của generation cho key; chỉ gọi factory() nếu chưa có flight nào đang chạy
+
+        Args:
+            key: Khóa gộp (các request cùng khóa nhận cùng một câu trả lời)
+            factory: Hàm tạo async iterator sinh các chunk từ upstream
+        """
+        flight = self._flights.get(key)
+        queue: asyncio.Queue = asyncio.Queue()
+        if flight is None:
+            flight = _Flight()
+            self._flights[key] = flight
+            flight.task = asyncio.create_task(self._run(key, flight, factory))
+            self.started += 1
+        else:
+            self.coalesced += 1
+            logger.info(f"Joining in-flight generation ({len(flight.subscribers)} subscribers, "
+                        f"{len(flight.chunks)} chunks so far)")
+            for chunk in flight.chunks:
+                queue.put_nowait(chunk)
+        flight.subscribers.append(queue)
+
+        try:
+            while True:
+                item = await queue.get()
+                if item is _END:
+                    return
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            flight.subscribers.remove(queue)
+            if not flight.subscribers and flight.task is not None and not flight.task.done():
+                # Không còn ai nghe: dừng generation upstream
+                flight.task.cancel()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "in_flight": len(self._flights),
+            "started": self.started,
+            "coalesced": self.coalesced,
+        }
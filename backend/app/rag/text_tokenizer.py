@@ -0,0 +1,96 @@
+"""
+Lexical tokenisation shared by ingestion (data/scripts) and the backend.
+- Accent-insensitive Vietnamese: NFD + drop combining marks, đ -> d
+- LaTeX commands kept as tokens (\\det, \\lambda, ...), plus word unigrams and bigrams
+- BM25-style sparse vectors for Qdrant (token ids = crc32, IDF applied server-side)
+- Standard library only: safe to import from data/scripts via sys.path
+"""
+from __future__ import annotations
+import re
+import unicodedata
+import zlib
+from collections import Counter
+from typing import Dict, List, Tuple
+
+# Tham số BM25 (k1, b) và độ dài tài liệu trung bình ước lượng cho phía ingest
+BM25_K1 = 1.2
+BM25_B = 0.75
+AVG_DOC_LEN = 120.0
+
+LATEX_COMMAND_PATTERN = re.compile(r"\\([a-z]+)")
+WORD_PATTERN = re.compile(r"[a-z0-9]+")
+
+# Hư từ tiếng Việt (đã bỏ dấu) không mang nghĩa khi tìm kiếm
+STOPWORDS = frozenset({
+    "va", "la", "cua", "cho", "cac", "mot", "nhung", "voi", "thi", "ma", "de", "trong",
+    "khi", "nay", "do", "duoc", "co", "khong", "hay", "hoac", "tai", "tu", "ve", "nhu",
+    "toi", "ban", "em", "a", "the", "of", "and", "to", "in",
+})
+
+
+def fold_accents(text: str) -> str:
+    """Chữ thường, bỏ dấu tiếng Việt (đ -> d)"""
+    text = unicodedata.normalize("NFD", text.lower())
+    text = "".join(ch for ch in text if unicodedata.category(ch) != "Mn")
+    return text.replace("đ", "d")
+
+
+def tokenize(text: str, bigrams: bool = True) -> List[str]:
+    """
+    Tách token: lệnh LaTeX ("\\det"), từ đơn và cặp từ liền kề ("dinh_thuc")
+
+    Args:
+        text: Văn bản (tiếng Việt, có thể chứa LaTeX)
+        bigrams: Có sinh cặp từ liền kề không
+    """
+    if not text:
+        return []
+    folded = fold_accents(text)
+    tokens = ["\\" + command for command in LATEX_COMMAND_PATTERN.findall(folded)]
+    # Bỏ lệnh LaTeX trước khi tách từ để "\\frac" không sinh thêm từ "frac"
+    words = [
+        word for word in WORD_PATTERN.findall(LATEX_COMMAND_PATTERN.sub(" ", folded))
+        if word not in STOPWORDS
+    ]
+    tokens.extend(words)
+    if bigrams:
+        tokens.extend(f"{first}_{second}" for first, second in zip(words, words[1:]))
+    return tokens
+
+
+def token_id(token: str) -> int:
+    """Chỉ số ổn định giữa các process (uint32) cho sparse vector"""
+    return zlib.crc32(token.encode("utf-8"))
+
+
+def _to_sparse(weights: Dict[int, float]) -> Tuple[List[int], List[float]]:
+    indices = sorted(weights)
+    return indices, [weights[index] for index in indices]
+
+
+def sparse_document_vector(text: str, avg_doc_len: float = AVG_DOC_LEN,
+                           k1: float = BM25_K1, b: float = BM25_B) -> Tuple[List[int], List[float]]:
+    """
+    Sparse vector phía tài liệu: trọng số TF bão hòa của BM25 (IDF do Qdrant tính với Modifier.IDF)
+
+    Returns:
+        Tuple[List[int], List[float]]: (indices, values)
+    """
+    tokens = tokenize(text)
+    if not tokens:
+        return [], []
+    doc_len = len(tokens)
+    norm = k1 * (1 - b + b * doc_len / avg_doc_len)
+    weights: Dict[int, float] = {}
+    for token, tf in Counter(tokens).items():
+        index = token_id(token)
+        weights[index] = weights.get(index, 0.0) + tf * (k1 + 1) / (tf + norm)
+    return _to_sparse(weights)
+
+
+def sparse_query_vector(text: str) -> Tuple[List[int], List[float]]:
+    """Sparse vector phía truy vấn: mỗi token khác nhau có trọng số 1"""
+    weights: Dict[int, float] = {}
+    for token in set(tokenize(text)):
+        weights[token_id(token)] = 1.0
+    return _to_sparse(weights)
@@ -0,0 +1,67 @@
+"""
+Token counting for context budgeting (tiktoken, cached encoder).
+- One encoder per process; encoding chosen by RAG_TOKENIZER_ENCODING (default cl100k_base)
+- Falls back to a conservative UTF-8 byte heuristic when tiktoken or its BPE file is unavailable
+- encoding_id() tags stored counts so ingestion and runtime only share counts from the same tokenizer
+- Truncation lands on token boundaries (never splits a multi-byte character)
+- Safe to import from data/scripts via sys.path
+"""
+from __future__ import annotations
+import logging
+import os
+from functools import lru_cache
+from typing import Any, Optional
+
+logger = logging.getLogger(__name__)
+
+ENCODING_NAME = os.getenv("RAG_TOKENIZER_ENCODING", "cl100k_base")
+HEURISTIC_ENCODING = "heuristic"
+
+# Tiếng Việt có dấu và LaTeX dày đặc: ~3 byte UTF-8 mỗi token (ước lượng dư để không tràn budget)
+HEURISTIC_BYTES_PER_TOKEN = 3
+
+
+@lru_cache(maxsize=1)
+def get_encoder() -> Optional[Any]:
+    """Encoder tiktoken dùng chung, None nếu không tải được (dùng heuristic)"""
+    try:
+        import tiktoken
+        return tiktoken.get_encoding(ENCODING_NAME)
+    except Exception as e:
+        logger.warning(f"tiktoken encoding '{ENCODING_NAME}' unavailable, using heuristic token counts: {e}")
+        return None
+
+
+def encoding_id() -> str:
+    """Định danh tokenizer đang dùng (lưu kèm số token trong payload)"""
+    return ENCODING_NAME if get_encoder() is not None else HEURISTIC_ENCODING
+
+
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    encoder = get_encoder()
+    if encoder is None:
+        return max(1, len(text.encode("utf-8")) // HEURISTIC_BYTES_PER_TOKEN)
+    return len(encoder.encode_ordinary(text))
+
+
+def truncate_to_tokens(text: str, max_tokens: int, suffix: str = "...") -> str:
+    """Cắt text còn tối đa max_tokens (tính cả suffix), tại ranh giới token"""
+    if not text or max_tokens <= 0:
+        return ""
+    encoder = get_encoder()
+    if encoder is None:
+        data = text.encode("utf-8")
+        limit = max_tokens * HEURISTIC_BYTES_PER_TOKEN
+        if len(data) <= limit:
+            return text
+        keep = max(0, limit - len(suffix.encode("utf-8")))
+        return data[:keep].decode("utf-8", errors="ignore").rstrip() + suffix
+
+    tokens = encoder.encode_ordinary(text)
+    if len(tokens) <= max_tokens:
+        return text
+    keep = max(0, max_tokens - len(encoder.encode_ordinary(suffix)))
+    # decode_bytes + errors="ignore": bỏ phần ký tự nhiều byte bị cắt dở ở token cuối
+    return encoder.decode_bytes(tokens[:keep]).decode("utf-8", errors="ignore").rstrip() + suffix
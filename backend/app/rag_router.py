@@ -9,11 +9,22 @@ from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 
 from . import crud, schemas
-from .adapters.streaming_adapter import streaming_adapter
+from .adapters.streaming_adapter import (
+    answer_cache,
+    answer_cache_context,
+    generate_stream_with_answer_cache,
+    generation_flight_key,
+    generation_single_flight,
+    streaming_adapter,
+)
 from .config import get_settings
 from .database import get_db
 from .services.topic_classifier import topic_classifier
 from .rag.rag_service import RAGService
+from .rag.rag_provider import get_rag_service
+from .rag.qdrant_connector import get_query_embedding_store, query_embedding_cache
+from .rag.retrieval_deadline import retrieval_latency
+from .services.circuit_breaker import circuit_breaker_stats
 from .services.llm.openai_service import OpenAIService
 from .rag.query_extractor_vn import parse_query
 from .rag.prompts.templates import LinearAlgebraTemplates
@@ -28,7 +39,8 @@ async def openai_chat_stream(
     chat_id: int,
     user_message: str = Query(..., description="User message content"),
     background_tasks: BackgroundTasks = None,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    rag_service: RAGService = Depends(get_rag_service)
 ):
     """
     Stream OpenAI chat response with RAG integration for a specific chat.
@@ -55,9 +67,6 @@ async def openai_chat_stream(
     elif parsed_query.question_num:
         logger.info(f"Request for question section: {parsed_query.question_num}")
     
-    # Khởi tạo RAG service
-    rag_service = RAGService()
-    
     # Function để xử lý streaming
     async def event_stream():
         try:
@@ -145,11 +154,21 @@ IMPORTANT: If the user asks for a specific problem (e.g., "bài 2.1"), you MUST
                 logger.error(f"Error saving user message: {e}")
                 yield f"data: Error saving user message: {str(e)}\n\n"
             
-            # Stream response từ OpenAI
+            # Stream response từ OpenAI (hoặc phát lại từ cache câu trả lời)
+            cache_key, query_vector = answer_cache_context(
+                rag_service, user_message, documents if success else [], settings.openai_model_name
+            )
+            flight_key = generation_flight_key(
+                user_message, documents if success else [], settings.openai_model_name, system_message
+            )
             ai_message_content = ""
-            async for chunk in openai_service.generate_stream(
+            async for chunk in generate_stream_with_answer_cache(
+                openai_service,
                 system_message=system_message,
-                user_message=enhanced_prompt
+                user_message=enhanced_prompt,
+                cache_key=cache_key,
+                query_vector=query_vector,
+                flight_key=flight_key
             ):
                 # Chuyển đổi xuống dòng thành <br> để hiển thị trên web
                 chunk_length = len(chunk) if chunk else 0
@@ -244,21 +263,42 @@ async def classify_topic(
             detail=f"Error classifying topic: {str(e)}"
         )
 
+@router.get("/stats")
+async def rag_stats(rag_service: RAGService = Depends(get_rag_service)):
+    """
+    Số liệu cache của RAG để theo dõi (hit/miss, kích thước).
+    """
+    embedding_store = get_query_embedding_store()
+    return {
+        "embedding_cache": query_embedding_cache.stats(),
+        "embedding_store": embedding_store.stats() if embedding_store else None,
+        "exact_index": rag_service.exact_index.stats(),
+        "lexical_index": rag_service.lexical_index.stats(),
+        "retrieval_cache": rag_service.retrieval_cache.stats(),
+        "retrieval_latency": retrieval_latency.stats(),
+        "answer_cache": answer_cache.stats(),
+        "single_flight": generation_single_flight.stats(),
+        "metadata": rag_service.metadata_stats,
+        "query_parser": parse_query.cache_info()._asdict(),
+        "circuit_breakers": circuit_breaker_stats()
+    }
+
 @router.get("/rag-search")
 async def rag_search(
     query: str = Query(..., description="Search query"),
     top_k: int = Query(3, description="Number of results to return"),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    rag_service: RAGService = Depends(get_rag_service)
 ):
     """
     Tìm kiếm thông tin liên quan trong RAG.
     """
     try:
-        rag_service = RAGService()
         documents, success = await rag_service.get_context(
             query, 
             k=top_k,
-            use_query_metadata=True
+            use_query_metadata=True,
+            payload_fields="search"
         )
         
         if not success or not documents:
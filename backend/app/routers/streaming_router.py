@@ -15,6 +15,8 @@ from ..crud import file_crud
 from ..database import get_db
 from ..utils import sanitize_text
 from ..adapters.streaming_adapter import generate_ai_response_stream
+from ..rag.rag_service import RAGService
+from ..rag.rag_provider import get_optional_rag_service
 
 # Set up logging
 logger = logging.getLogger(__name__)
@@ -47,6 +49,7 @@ async def stream_chat_response(
     user_message: schemas.UserMessageInput, # Use the schema from schemas.py
     db: Session = Depends(get_db),
     x_chat_context: Optional[str] = Header(None), # Keep for now, though context handling changed
+    rag_service: Optional[RAGService] = Depends(get_optional_rag_service),
 ):
     """
     Stream a response from the AI to the user.
@@ -154,6 +157,7 @@ async def stream_chat_response(
                 file_ids=user_message.file_ids,      # Pass the list of UUIDs
                 db=db,
                 queue=queue,
+                rag_service=rag_service,
                 # context=None, # context handling has changed
             )
         )
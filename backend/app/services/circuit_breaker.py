@@ -0,0 +1,186 @@
+"""
+Circuit breakers for upstream dependencies (embeddings, Qdrant search, LLM providers, metadata extraction).
+- closed: calls go through; outcomes and latency are tracked in a rolling time window
+- open: error rate over the window reached the threshold; calls fail fast with CircuitOpenError
+  so callers go straight to their fallback (BM25 index, no-RAG, the other LLM provider)
+- half_open: after reset_timeout one probe call is let through; success closes, failure re-opens
+- Cancelled calls (client left, hedge lost) are not counted as failures
+"""
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Tuple, Type
+
+from ..config import get_settings
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Circuit đang mở: không gọi upstream, dùng đường dự phòng"""
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker theo tỷ lệ lỗi trong cửa sổ thời gian trượt
+    """
+
+    def __init__(self, name: str, error_rate_threshold: float = 0.5, min_calls: int = 5,
+                 window_seconds: float = 60.0, reset_timeout: float = 30.0):
+        self.name = name
+        self.error_rate_threshold = error_rate_threshold
+        self.min_calls = min_calls
+        self.window_seconds = window_seconds
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        # (thời điểm, thành công, độ trễ) của các lời gọi trong cửa sổ
+        self._outcomes: Deque[Tuple[float, bool, float]] = deque()
+        self._lock = threading.Lock()
+        self.short_circuited = 0
+        self.times_opened = 0
+
+    def _prune_locked(self, now: float) -> None:
+        while self._outcomes and now - self._outcomes[0][0] > self.window_seconds:
+            self._outcomes.popleft()
+
+    @property
+    def is_open(self) -> bool:
+        """Circuit đang mở và chưa tới lúc thử lại (kiểm tra không chiếm lượt probe)"""
+        return self.state == OPEN and time.monotonic() - self._opened_at < self.reset_timeout
+
+    def allow(self) -> bool:
+        """Có được gọi upstream không; ở half_open chỉ một lời gọi probe được đi qua"""
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = HALF_OPEN
+                logger.info(f"Circuit '{self.name}' half-open, probing upstream")
+            if self.state == HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            self.short_circuited += 1
+            return False
+
+    def _open_locked(self, now: float) -> None:
+        self.state = OPEN
+        self._opened_at = now
+        self.times_opened += 1
+
+    def record_success(self, latency: float) -> None:
+        now = time.monotonic()
+        with self._lock:
+            if self.state == HALF_OPEN:
+                logger.info(f"Circuit '{self.name}' closed, upstream recovered")
+                self.state = CLOSED
+                self._probe_in_flight = False
+                self._outcomes.clear()
+            self._outcomes.append((now, True, latency))
+            self._prune_locked(now)
+
+    def record_failure(self, latency: float) -> None:
+        now = time.monotonic()
+        with self._lock:
+            self._outcomes.append((now, False, latency))
+            self._prune_locked(now)
+            if self.state == HALF_OPEN:
+                self._probe_in_flight = False
+                self._open_locked(now)
+                logger.warning(f"Circuit '{self.name}' probe failed, re-opened for {self.reset_timeout}s")
+                return
+            if self.state == CLOSED and len(self._outcomes) >= self.min_calls:
+                failures = sum(1 for _, ok, _ in self._outcomes if not ok)
+                if failures / len(self._outcomes) >= self.error_rate_threshold:
+                    self._open_locked(now)
+                    logger.warning(f"Circuit '{self.name}' opened: {failures}/{len(self._outcomes)} "
+                                   f"calls failed in the last {self.window_seconds:.0f}s")
+
+    def release_probe(self) -> None:
+        """Trả lại lượt probe khi lời gọi bị hủy (không tính thành công hay lỗi)"""
+        with self._lock:
+            self._probe_in_flight = False
+
+    async def call(
+        self,
+        factory: Callable[[], Awaitable[Any]],
+        failure_types: Tuple[Type[BaseException], ...] = (Exception,)
+    ) -> Any:
+        """
+        Gọi upstream qua circuit breaker
+
+        Args:
+            factory: Hàm tạo coroutine gọi upstream
+            failure_types: Lỗi được tính là upstream hỏng; lỗi khác (vd. parse kết quả) vẫn được ném ra
+                nhưng tính là lời gọi thành công vì upstream đã phản hồi
+
+        Raises:
+            CircuitOpenError: Circuit đang mở (không có lời gọi nào được thực hiện)
+        """
+        if not self.allow():
+            raise CircuitOpenError(f"Circuit '{self.name}' is open")
+        start = time.monotonic()
+        try:
+            result = await factory()
+        except asyncio.CancelledError:
+            self.release_probe()
+            raise
+        except Exception as e:
+            if isinstance(e, failure_types):
+                self.record_failure(time.monotonic() - start)
+            else:
+                self.record_success(time.monotonic() - start)
+            raise
+        self.record_success(time.monotonic() - start)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        with self._lock:
+            self._prune_locked(now)
+            outcomes = list(self._outcomes)
+        calls = len(outcomes)
+        failures = sum(1 for _, ok, _ in outcomes if not ok)
+        latencies = sorted(latency for _, _, latency in outcomes)
+        error_rate = failures / calls if calls else 0.0
+        return {
+            "state": OPEN if self.is_open else (HALF_OPEN if self.state != CLOSED else CLOSED),
+            "calls": calls,
+            "error_rate": round(error_rate, 4),
+            # Điểm sức khỏe 0..1 (1 = không lỗi); circuit mở = 0
+            "health": 0.0 if self.is_open else round(1.0 - error_rate, 4),
+            "p95_latency_ms": round(latencies[min(calls - 1, int(calls * 0.95))] * 1000, 1) if calls else None,
+            "short_circuited": self.short_circuited,
+            "times_opened": self.times_opened,
+        }
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(name: str) -> CircuitBreaker:
+    """Circuit breaker dùng chung theo tên (tạo ở lần gọi đầu với cấu hình từ settings)"""
+    with _breakers_lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            settings = get_settings()
+            breaker = _breakers[name] = CircuitBreaker(
+                name,
+                error_rate_threshold=settings.circuit_breaker_error_rate,
+                min_calls=settings.circuit_breaker_min_calls,
+                window_seconds=settings.circuit_breaker_window,
+                reset_timeout=settings.circuit_breaker_reset_timeout,
+            )
+        return breaker
+
+
+def circuit_breaker_stats() -> Dict[str, Dict[str, Any]]:
+    return {name: breaker.stats() for name, breaker in sorted(_breakers.items())}
@@ -3,6 +3,7 @@ Gemini AI Service for streaming responses
 """
 import asyncio
 import logging
+import time
 import json
 from typing import List, Dict, Any, Optional, AsyncIterable
 from google import genai
@@ -12,6 +13,7 @@ from sqlalchemy.orm import Session
 from ...config import get_settings
 from ...crud import chat_crud
 from .base import LLMService
+from ..circuit_breaker import get_circuit_breaker
 
 logger = logging.getLogger(__name__)
 
@@ -55,7 +57,14 @@ class GeminiService(LLMService):
         if not self.client:
             yield "Gemini service not available."
             return
-        
+
+        # Gemini đang ngắt mạch: trả lời ngay thay vì chờ một lời gọi gần như chắc chắn lỗi
+        breaker = get_circuit_breaker("llm:gemini")
+        if not breaker.allow():
+            yield "Gemini service temporarily unavailable. Please try again later."
+            return
+        start = time.monotonic()
+        finished = False
         try:
             # Prepare contents for Gemini
             contents = []
@@ -91,10 +100,17 @@ class GeminiService(LLMService):
                     for part in chunk.candidates[0].content.parts:
                         if hasattr(part, 'text') and part.text:
                             yield part.text
+            finished = True
+            breaker.record_success(time.monotonic() - start)
                             
         except Exception as e:
+            finished = True
+            breaker.record_failure(time.monotonic() - start)
             logger.error(f"Error in Gemini generate_stream: {e}")
             yield f"Lỗi khi tạo phản hồi: {str(e)}"
+        finally:
+            if not finished:
+                breaker.release_probe()
     
     async def generate(
         self,
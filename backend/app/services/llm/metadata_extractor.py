@@ -1,7 +1,10 @@
 import sys
 import os
+import re
+import asyncio
 import logging
 import json
+from dataclasses import dataclass
 from typing import List, Optional, Dict, Any, Union
 from pydantic import BaseModel, Field
 
@@ -12,12 +15,19 @@ sys.path.append(app_path)
 # Import tuyệt đối
 import config
 
+import httpx
+import openai
 from langchain_openai import ChatOpenAI
 from langchain_core.output_parsers import PydanticOutputParser
 from langchain_core.prompts import ChatPromptTemplate
 
+from ..circuit_breaker import CircuitOpenError, get_circuit_breaker
+
 logger = logging.getLogger(__name__)
 
+# Chỉ lỗi gọi API (mạng, timeout, lỗi từ OpenAI) mới làm mở circuit; lỗi parse/validate output thì không
+LLM_FAILURE_TYPES = (openai.APIError, httpx.TransportError, asyncio.TimeoutError)
+
 class MathQueryMetadata(BaseModel):
     """Schema cho metadata được trích xuất từ câu hỏi toán học - Cấu trúc mới"""
     
@@ -85,24 +95,64 @@ class MathQueryMetadata(BaseModel):
     class Config:
         extra = "forbid"  # Không cho phép thêm trường khác
 
-class MetadataExtractor:
-    def __init__(self, api_key: Optional[str] = None):
-        self.api_key = api_key or os.getenv("OPENAI_API_KEY")
-        self.llm = ChatOpenAI(
-            model="gpt-3.5-turbo",
-            temperature=0.1,  # Thấp để ổn định
-            api_key=self.api_key
-        )
-        self.parser = PydanticOutputParser(pydantic_object=MathQueryMetadata)
-        
-    async def extract_metadata(self, query: str, max_retries: int = 2) -> MathQueryMetadata:
-        """
-        Trích xuất metadata từ câu hỏi với retry logic
-        """
-        format_instructions = self.parser.get_format_instructions()
-        prompt_template = ChatPromptTemplate.from_messages([
-            ("system",
-                """
+# Từ khóa lấy từ phần REQUESTING_SOLUTION / DISPLAY_MODE DETECTION trong prompt của MetadataExtractor.
+# Danh sách trong prompt chỉ là gợi ý cho LLM: ở đây chỉ cụm từ giải/xem đề rõ ràng mới đủ tin cậy để bỏ qua LLM
+SOLUTION_KEYWORDS = [
+    "giải", "hướng dẫn", "cách làm", "lời giải", "solution", "solve", "how to", "làm thế nào",
+    "giúp tôi làm", "chỉ cách", "hướng dẫn giải", "giải thích", "explain", "tại sao", "why",
+    "phương pháp", "method", "cách tiếp cận", "approach", "hiểu", "understand", "học", "learn",
+]
+# Yêu cầu chung chung ("cho tôi biết hạng của ma trận..."): chưa đủ để kết luận, vẫn hỏi LLM
+PROBLEM_REQUEST_KEYWORDS = [
+    "cho tôi", "muốn xem", "đưa ra", "cung cấp", "hiển thị",
+    "show me", "give me", "list", "liệt kê",
+]
+DISPLAY_KEYWORDS = [
+    "xem đề", "đưa ra đề", "cung cấp đề", "hiển thị đề", "muốn xem đề", "đề bài", "bài số",
+]
+
+
+def _keyword_pattern(keywords: List[str]) -> "re.Pattern":
+    # Khớp nguyên từ/cụm từ để "có" không khớp bên trong từ khác
+    alternatives = "|".join(re.escape(k) for k in sorted(keywords, key=len, reverse=True))
+    return re.compile(rf"(?<!\w)(?:{alternatives})(?!\w)", re.IGNORECASE)
+
+
+_SOLUTION_PATTERN = _keyword_pattern(SOLUTION_KEYWORDS)
+_PROBLEM_REQUEST_PATTERN = _keyword_pattern(PROBLEM_REQUEST_KEYWORDS)
+_DISPLAY_PATTERN = _keyword_pattern(DISPLAY_KEYWORDS)
+
+
+@dataclass
+class IntentClassification:
+    requesting_solution: bool
+    display_mode: bool
+    confidence: float
+
+
+def classify_intent(query: str) -> IntentClassification:
+    """
+    Phân loại requesting_solution / display_mode bằng từ khóa (không gọi LLM), kèm độ tin cậy:
+    chỉ cụm từ xin lời giải hoặc chỉ cụm từ xem đề thì chắc chắn, cả hai thì theo quy tắc ưu tiên
+    của prompt; chỉ có từ yêu cầu chung chung hoặc không khớp gì thì mơ hồ (để LLM quyết định)
+    """
+    text = query or ""
+    solution = bool(_SOLUTION_PATTERN.search(text))
+    request = bool(_PROBLEM_REQUEST_PATTERN.search(text))
+    display = bool(_DISPLAY_PATTERN.search(text))
+    if solution and not display:
+        return IntentClassification(requesting_solution=True, display_mode=False, confidence=0.95)
+    if display and not solution:
+        return IntentClassification(requesting_solution=False, display_mode=True, confidence=0.9)
+    if request and not solution:
+        return IntentClassification(requesting_solution=False, display_mode=False, confidence=0.5)
+    if solution:
+        # Có cả hai loại từ khóa: ưu tiên yêu cầu lời giải (sinh viên muốn học)
+        return IntentClassification(requesting_solution=True, display_mode=False, confidence=0.6)
+    return IntentClassification(requesting_solution=False, display_mode=False, confidence=0.3)
+
+
+METADATA_SYSTEM_PROMPT = """
 Bạn là chuyên gia trích xuất metadata từ câu hỏi toán học với cấu trúc mới.
 CHỈ trả về một object JSON hợp lệ theo schema dưới đây, KHÔNG giải thích, KHÔNG lặp lại schema, KHÔNG trả về mô tả schema, KHÔNG trả về bất kỳ thông tin nào ngoài object JSON.
 
@@ -186,46 +236,97 @@ Output: {{"category": "baitap", "subject_area": "dai_so_tuyen_tinh", "tags": ["h
 User: Tại sao phải dùng phương pháp này để tính định thức?
 Output: {{"category": "baitap", "subcategory": "dt", "subject_area": "dai_so_tuyen_tinh", "tags": ["định thức", "phương pháp"], "requesting_solution": true}}
 """
-            ),
+
+
+class MetadataExtractor:
+    def __init__(self, api_key: Optional[str] = None, structured_output: bool = True):
+        self.api_key = api_key or os.getenv("OPENAI_API_KEY")
+        self.llm = ChatOpenAI(
+            model="gpt-3.5-turbo",
+            temperature=0.1,  # Thấp để ổn định
+            api_key=self.api_key
+        )
+        self.parser = PydanticOutputParser(pydantic_object=MathQueryMetadata)
+        self.structured_output = structured_output
+        # Prompt và chain được dựng một lần cho mỗi instance
+        self.chain = self._build_chain()
+
+    def _build_chain(self):
+        prompt_template = ChatPromptTemplate.from_messages([
+            ("system", METADATA_SYSTEM_PROMPT),
             ("user", "Câu hỏi: {query}")
         ])
+        if self.structured_output:
+            try:
+                # Function calling: schema gửi qua tool definition, không cần parse văn bản tự do
+                prompt = prompt_template.partial(
+                    format_instructions="(schema MathQueryMetadata được cung cấp qua function calling)"
+                )
+                return prompt | self.llm.with_structured_output(MathQueryMetadata, method="function_calling")
+            except Exception as e:
+                logger.warning(f"Structured output unavailable, parsing free-text JSON instead: {e}")
+                self.structured_output = False
+        prompt = prompt_template.partial(format_instructions=self.parser.get_format_instructions())
+        return prompt | self.llm | self.parser
+
+    @staticmethod
+    def _postprocess(result: MathQueryMetadata) -> MathQueryMetadata:
+        # Xử lý hậu kỳ để chuẩn hóa trường question
+        if result.question:
+            # Loại bỏ các tiền tố như "bài", "câu", v.v.
+            question = result.question.lower()
+            question = question.replace("bài", "").replace("câu", "").replace("toán", "").strip()
+            # Chỉ giữ lại số và chữ cái (nếu có)
+            result.question = question
+            logger.info(f"Normalized question: {result.question}")
+        return result
+
+    @staticmethod
+    def _default_metadata(query: str) -> MathQueryMetadata:
+        # Fallback: trả về metadata mặc định
+        return MathQueryMetadata(
+            requesting_solution="giải" in query.lower() or "lời giải" in query.lower()
+        )
         
+    async def extract_metadata(self, query: str, max_retries: int = 2) -> MathQueryMetadata:
+        """
+        Trích xuất metadata từ câu hỏi với retry logic (circuit đang mở thì dùng metadata mặc định ngay).
+        Dùng circuit riêng: lỗi trích xuất không làm chat chuyển sang Gemini
+        """
+        breaker = get_circuit_breaker("llm:metadata")
         for attempt in range(max_retries + 1):
             try:
-                # Tạo chain với structured output
-                chain = prompt_template | self.llm | self.parser
-                
-                # Thực thi
-                result = await chain.ainvoke({
-                    "query": query,
-                    "format_instructions": self.parser.get_format_instructions()
-                })
-                
+                result = await breaker.call(lambda: self.chain.ainvoke({"query": query}), LLM_FAILURE_TYPES)
                 logger.info(f"Metadata extracted successfully: {result}")
-                
-                # Xử lý hậu kỳ để chuẩn hóa trường question
-                if result.question:
-                    # Loại bỏ các tiền tố như "bài", "câu", v.v.
-                    question = result.question.lower()
-                    question = question.replace("bài", "").replace("câu", "").replace("toán", "").strip()
-                    # Chỉ giữ lại số và chữ cái (nếu có)
-                    result.question = question
-                    logger.info(f"Normalized question: {result.question}")
-                
-                return result
-                
+                return self._postprocess(result)
+            except CircuitOpenError as e:
+                logger.warning(f"{e}, skipping metadata extraction")
+                break
             except Exception as e:
                 logger.warning(f"Attempt {attempt + 1} failed: {str(e)}")
-                
-                if attempt < max_retries:
-                    # Thêm context lỗi cho lần thử tiếp theo
-                    query = f"{query}\n\nLỗi trước đó: {str(e)}. Hãy cố gắng trích xuất chính xác hơn."
-                else:
-                    # Fallback: trả về metadata mặc định
-                    logger.error(f"All attempts failed for query: {query}")
-                    return MathQueryMetadata(
-                        requesting_solution="giải" in query.lower() or "lời giải" in query.lower()
-                    )
+        logger.error(f"All attempts failed for query: {query}")
+        return self._default_metadata(query)
+
+    async def extract_metadata_batch(self, queries: List[str], max_concurrency: int = 4) -> List[MathQueryMetadata]:
+        """
+        Trích xuất metadata cho nhiều câu hỏi (đánh giá offline, làm nóng cache) với số request đồng thời giới hạn
+
+        Returns:
+            List[MathQueryMetadata]: Kết quả theo đúng thứ tự queries (metadata mặc định nếu lỗi)
+        """
+        results = await self.chain.abatch(
+            [{"query": query} for query in queries],
+            config={"max_concurrency": max_concurrency},
+            return_exceptions=True
+        )
+        metadata_list = []
+        for query, result in zip(queries, results):
+            if isinstance(result, Exception):
+                logger.warning(f"Batch metadata extraction failed for query {query!r}: {result}")
+                metadata_list.append(self._default_metadata(query))
+            else:
+                metadata_list.append(self._postprocess(result))
+        return metadata_list
 
 # Test function
 async def test_extractor():
@@ -1,4 +1,5 @@
 import os
+import time
 import logging
 from typing import List, Dict, Any, Optional, AsyncGenerator, Union
 import json
@@ -6,6 +7,7 @@ from openai import AsyncOpenAI, OpenAI
 
 from ...config import get_settings
 from .base import LLMService
+from ..circuit_breaker import CircuitOpenError, get_circuit_breaker
 
 logger = logging.getLogger(__name__)
 
@@ -62,7 +64,15 @@ class OpenAIService(LLMService):
             
         Yields:
             Các chunks của response
+
+        Raises:
+            CircuitOpenError: OpenAI đang ngắt mạch (gọi chưa tới API), caller chuyển sang Gemini
         """
+        breaker = get_circuit_breaker("llm:openai")
+        if not breaker.allow():
+            raise CircuitOpenError("OpenAI circuit is open")
+        start = time.monotonic()
+        finished = False
         try:
             # Tạo messages
             messages = [
@@ -94,9 +104,17 @@ class OpenAIService(LLMService):
                     content = chunk.choices[0].delta.content
                     # Đảm bảo nội dung LaTeX không bị cắt giữa chừng
                     yield content
+            finished = True
+            breaker.record_success(time.monotonic() - start)
         except Exception as e:
+            finished = True
+            breaker.record_failure(time.monotonic() - start)
             logger.error(f"Error in generate_stream: {e}")
             raise
+        finally:
+            # Consumer dừng giữa chừng (client ngắt kết nối): không tính là lỗi của OpenAI
+            if not finished:
+                breaker.release_probe()
     
     def generate(
         self, 
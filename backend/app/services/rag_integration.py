@@ -7,6 +7,7 @@ from langchain_core.documents import Document
 from sqlalchemy.orm import Session
 
 from ..rag.rag_service import RAGService
+from ..rag.rag_provider import rag_provider
 from ..services.topic_classifier import topic_classifier
 from ..config import get_settings
 
@@ -24,10 +25,10 @@ class RAGIntegrationService:
         Khởi tạo service tích hợp RAG
         
         Args:
-            rag_service: RAGService instance (tạo mới nếu không có)
+            rag_service: RAGService instance (dùng RAGService chung của process nếu không có)
         """
         self.settings = get_settings()
-        self.rag_service = rag_service or RAGService()
+        self.rag_service = rag_service
         
     async def process_message_for_rag(
         self, 
@@ -70,7 +71,8 @@ class RAGIntegrationService:
             filter_condition = {"category": "olympic"}
             
         # Lấy ngữ cảnh đã định dạng và thông tin thành công
-        context, success = await self.rag_service.get_formatted_context(
+        rag_service = self.rag_service or await rag_provider.get_service()
+        context, success = await rag_service.get_formatted_context(
             query=user_message,
             filter=filter_condition
         )
@@ -1,6 +1,6 @@
 import logging
 import re
-from typing import Dict, Tuple
+from typing import Dict, Iterable, List, Tuple
 
 logger = logging.getLogger(__name__)
 
@@ -98,6 +98,53 @@ OLYMPIC_PATTERNS = [
 ]
 
 
+# Một "atom" của pattern: escape, lớp ký tự [...], nhóm (...) không lồng nhau hoặc một ký tự
+_ATOM_PATTERN = re.compile(r"\\.|\[[^\]]*\]|\((?:[^()\\]|\\.)*\)|.", re.DOTALL)
+
+
+def _pattern_atoms(pattern: str) -> List[str]:
+    """Tách pattern thành các atom (kèm quantifier *, +, ? nếu có)"""
+    atoms = []
+    position = 0
+    while position < len(pattern):
+        atom = _ATOM_PATTERN.match(pattern, position).group()
+        position += len(atom)
+        if position < len(pattern) and pattern[position] in "*+?":
+            atom += pattern[position]
+            position += 1
+        atoms.append(atom)
+    return atoms
+
+
+def _compile_trie(patterns: List[str], prefix: str):
+    """
+    Gộp các pattern thành một regex dạng trie (các tiền tố chung chỉ được thử một lần).
+    Mỗi pattern kết thúc bằng một named group rỗng để biết pattern nào đã khớp;
+    nhánh dài hơn đứng trước nhánh kết thúc nên tại cùng vị trí luôn khớp cụm dài nhất.
+    
+    Returns:
+        (regex đã compile, tên group -> pattern gốc)
+    """
+    trie: Dict = {}
+    for pattern in patterns:
+        node = trie
+        for atom in _pattern_atoms(pattern):
+            node = node.setdefault(atom, {})
+        node.setdefault(None, pattern)
+    
+    names: Dict[str, str] = {}
+    
+    def emit(node: Dict) -> str:
+        branches = [atom + emit(child) for atom, child in node.items() if atom is not None]
+        if None in node:
+            name = f"{prefix}{len(names)}"
+            names[name] = node[None]
+            branches.append(f"(?P<{name}>)")
+        return branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+    
+    return re.compile(emit(trie)), names
+
+
 class TopicClassifier:
     """
     Phân loại chủ đề của câu hỏi
@@ -107,9 +154,25 @@ class TopicClassifier:
         """
         Khởi tạo classifier
         """
-        # Compile regex patterns cho hiệu năng
-        self.la_patterns = [re.compile(pattern, re.IGNORECASE) for pattern in LINEAR_ALGEBRA_KEYWORDS]
-        self.olympic_patterns = [re.compile(pattern, re.IGNORECASE) for pattern in OLYMPIC_PATTERNS]
+        # Text đã được lower() nên không cần re.IGNORECASE (cờ này làm mất tối ưu tiền tố literal)
+        # Một regex dạng trie cho toàn bộ từ khóa (quét một lần, trả về mọi vị trí khớp)
+        self.la_pattern, self._la_names = _compile_trie(LINEAR_ALGEBRA_KEYWORDS, "k")
+        # Trie các dạng bài Olympic dùng làm bộ lọc nhanh; chỉ khi có khớp mới kiểm tra
+        # từng pattern để liệt kê đầy đủ (các pattern ".*" có thể chồng lấn nhau)
+        self.olympic_pattern, _ = _compile_trie(OLYMPIC_PATTERNS, "o")
+        self.olympic_patterns = [re.compile(pattern) for pattern in OLYMPIC_PATTERNS]
+    
+    def find_keywords(self, text: str) -> List[Tuple[int, int, str]]:
+        """
+        Mọi vị trí khớp từ khóa đại số tuyến tính (không chồng lấn) trong một lần quét
+        
+        Returns:
+            List[Tuple[int, int, str]]: (start, end, pattern từ khóa)
+        """
+        return [
+            (match.start(), match.end(), self._la_names[match.lastgroup])
+            for match in self.la_pattern.finditer(text.lower())
+        ]
         
     def classify(self, text: str) -> Tuple[bool, Dict]:
         """
@@ -127,13 +190,15 @@ class TopicClassifier:
         normalized_text = text.lower()
         
         # Kiểm tra xem có phải đại số tuyến tính không
-        is_linear_algebra = any(pattern.search(normalized_text) for pattern in self.la_patterns)
+        is_linear_algebra = self.la_pattern.search(normalized_text) is not None
         
         # Kiểm tra dạng bài Olympic
-        olympic_patterns_found = [
-            pattern.pattern for pattern in self.olympic_patterns 
-            if pattern.search(normalized_text)
-        ]
+        olympic_patterns_found = []
+        if self.olympic_pattern.search(normalized_text):
+            olympic_patterns_found = [
+                pattern.pattern for pattern in self.olympic_patterns 
+                if pattern.search(normalized_text)
+            ]
         is_olympic = len(olympic_patterns_found) > 0
         
         # Nếu tìm thấy dạng bài Olympic, ưu tiên nhận biết là đại số tuyến tính
@@ -149,6 +214,19 @@ class TopicClassifier:
         }
         
         return is_linear_algebra, metadata
+    
+    def classify_many(self, texts: Iterable[str]) -> List[Tuple[bool, Dict]]:
+        """
+        Phân loại hàng loạt (phân tích log, thống kê chủ đề)
+        
+        Args:
+            texts: Danh sách nội dung câu hỏi
+            
+        Returns:
+            List[Tuple[bool, Dict]]: Kết quả classify() theo đúng thứ tự đầu vào
+        """
+        classify = self.classify
+        return [classify(text) for text in texts]
         
 
 # Singleton instance
@@ -60,7 +60,7 @@ async def ingest_directory(
         if clear_collection:
             logger.info(f"Xóa collection {collection_name} nếu tồn tại")
             try:
-                qdrant.client.delete_collection(collection_name=collection_name)
+                qdrant.sync_client.delete_collection(collection_name=collection_name)
                 logger.info(f"Đã xóa collection {collection_name}")
                 
                 # Tạo lại connector sau khi xóa collection
@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""
+Export the Qdrant collection to a local vector index snapshot (read-only on Qdrant):
+- Scroll every point with payload + `semantic_vector`
+- Write vectors.npy (normalised float32), payloads.json, manifest.json
+- Backend uses it with RAG_VECTOR_BACKEND=local (RAG_LOCAL_INDEX_PATH points to the output dir)
+
+Usage (from the repo root):
+    python data/scripts/export_local_vector_index.py [output_dir]
+"""
+import os
+import sys
+import time
+
+from dotenv import load_dotenv
+from qdrant_client import QdrantClient
+
+sys.path.append('backend')
+from app.rag.local_vector_index import LocalVectorIndex
+
+# Load environment variables from backend/.env
+load_dotenv("backend/.env")
+
+
+def main():
+    qdrant_url = os.getenv("QDRANT_URL")
+    collection = os.getenv("QDRANT_COLLECTION_NAME", "math_collection")
+    output_dir = sys.argv[1] if len(sys.argv) > 1 else os.getenv("RAG_LOCAL_INDEX_PATH", "backend/data/local_index")
+    if not qdrant_url:
+        raise RuntimeError("Missing env var: QDRANT_URL")
+
+    qdrant = QdrantClient(url=qdrant_url, api_key=os.getenv("QDRANT_API_KEY"), timeout=60)
+    print(f"[INFO] Collection: {collection}")
+    print(f"[INFO] Output: {output_dir}")
+
+    t0 = time.time()
+    count = LocalVectorIndex.export_snapshot(qdrant, collection, output_dir)
+    print(f"  OK Exported {count} points in {time.time() - t0:.2f}s")
+
+    # Kiểm tra snapshot nạp lại được
+    index = LocalVectorIndex.load(output_dir)
+    print(f"  OK Snapshot loads: {len(index)} points, dim={index.dim}")
+
+
+if __name__ == "__main__":
+    main()
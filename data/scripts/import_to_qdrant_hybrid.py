@@ -18,6 +18,8 @@ from openai import OpenAI
 from qdrant_client import QdrantClient
 from qdrant_client.http import models
 import glob
+import sys
+import argparse
 
 # Load environment variables from backend/.env
 load_dotenv("backend/.env")
@@ -38,9 +40,23 @@ qdrant_client = QdrantClient(
 # Cấu hình
 EMBEDDING_MODEL = "text-embedding-3-small"
 VECTOR_SIZE = 1536
+SPARSE_VECTORS_CONFIG = {
+    "keyword_vector": models.SparseVectorParams(modifier=models.Modifier.IDF)
+}
+# False khi collection cũ chưa có keyword_vector: chỉ upsert semantic_vector (chạy lại với --recreate để có hybrid)
+KEYWORD_VECTOR_ENABLED = True
+
+# Kho embedding dùng chung với backend: chạy lại ingest không phải trả tiền embedding lần nữa
+sys.path.append('backend')
+from app.rag.embedding_store import EmbeddingStore
+from app.rag.text_tokenizer import sparse_document_vector
+from app.rag.context_builder import payload_token_counts
+from app.rag.context_fragments import FRAGMENT_VERSION, render_fragments
+
+EMBEDDING_STORE_PATH = os.getenv("RAG_EMBEDDING_STORE_PATH", "backend/data/embedding_store.sqlite3")
+embedding_store = EmbeddingStore(EMBEDDING_STORE_PATH) if EMBEDDING_STORE_PATH else None
 
 # Import Smart Translator
-import sys
 sys.path.append('data/scripts')
 from smart_latex_translator import SmartLatexTranslator
 
@@ -104,50 +120,44 @@ def create_enhanced_embedding_text(item):
     return "\n".join(parts)
 
 def get_embedding(text):
-    """Tạo semantic embedding từ OpenAI"""
+    """Tạo semantic embedding từ OpenAI (đọc/ghi qua kho embedding dùng chung)"""
+    if embedding_store is not None:
+        stored = embedding_store.get(text, EMBEDDING_MODEL)
+        if stored is not None:
+            return stored
     try:
         response = client.embeddings.create(
             model=EMBEDDING_MODEL,
             input=text
         )
-        return response.data[0].embedding
+        embedding = response.data[0].embedding
+        if embedding_store is not None:
+            embedding_store.put(text, EMBEDDING_MODEL, embedding)
+        return embedding
     except Exception as e:
         print(f"❌ Lỗi tạo embedding: {e}")
         return None
 
+def create_keyword_text(item, problem_natural=""):
+    """Văn bản cho sparse vector: tiêu đề + đề bài (LaTeX gốc và bản dịch) + các câu hỏi con"""
+    parts = [item.get("title") or "", item.get("problem_statement") or "", problem_natural or ""]
+    parts.extend(item.get("problem_parts", {}).values())
+    return "\n".join(part for part in parts if part)
+
 def create_keyword_vector(text):
-    """Tạo keyword vector (sparse) cho hybrid search - Simple TF-IDF approach"""
-    
-    # Simple keyword extraction cho Vietnamese math terms
-    import re
-    from collections import Counter
-    
-    # Normalize text
-    text_lower = text.lower()
-    
-    # Extract important math keywords
-    math_keywords = [
-        'ma trận', 'matrix', 'định thức', 'det', 'hạng', 'rank',
-        'phương trình', 'equation', 'hệ', 'system', 'nghiệm', 'solution',
-        'giá trị riêng', 'eigenvalue', 'vector riêng', 'eigenvector',
-        'không gian', 'space', 'tuyến tính', 'linear', 'độc lập', 'independent',
-        'tích phân', 'integral', 'đạo hàm', 'derivative', 'giới hạn', 'limit',
-        'tổ hợp', 'combination', 'đa thức', 'polynomial'
-    ]
-    
-    # Simple keyword scoring
-    keyword_scores = {}
-    for i, keyword in enumerate(math_keywords):
-        count = text_lower.count(keyword)
-        if count > 0:
-            keyword_scores[i] = float(count)
-    
-    # Convert to sparse vector format (simple approach)
-    # Note: Trong production, nên dùng SPLADE hoặc BM25
-    return keyword_scores if keyword_scores else None
+    """Tạo keyword vector (sparse, BM25) cho hybrid search; IDF do Qdrant tính (Modifier.IDF)"""
+    indices, values = sparse_document_vector(text)
+    if not indices:
+        return None
+    return models.SparseVector(indices=indices, values=values)
 
-def create_collection():
-    """Tạo collection với MULTI-VECTOR schema theo khuyến nghị Gemini"""
+def create_collection(recreate=False):
+    """Tạo collection với MULTI-VECTOR schema theo khuyến nghị Gemini
+
+    Args:
+        recreate: Xóa và tạo lại collection đã tồn tại (cần để thêm keyword_vector vào collection cũ)
+    """
+    global KEYWORD_VECTOR_ENABLED
     
     collection_name = QDRANT_COLLECTION_NAME  # Sử dụng tên từ .env
     
@@ -155,15 +165,24 @@ def create_collection():
         # Kiểm tra collection cũ (KHÔNG xóa tự động để tránh mất dữ liệu)
         try:
             existing = qdrant_client.get_collection(collection_name)
-            print(f"⚠️ Collection {collection_name} đã tồn tại. Sẽ thêm dữ liệu vào collection hiện có.")
         except:
-            print(f"📝 Tạo collection mới: {collection_name}")
+            existing = None
+        
+        if existing is not None and recreate:
+            print(f"🗑️ --recreate: xóa collection {collection_name} để tạo lại với keyword_vector")
+            qdrant_client.delete_collection(collection_name)
+            existing = None
         
         # Tạo collection với MULTI-VECTOR configuration (chỉ khi chưa tồn tại)
-        try:
-            qdrant_client.get_collection(collection_name)
-            print(f"✅ Collection {collection_name} đã tồn tại, bỏ qua tạo mới")
-        except:
+        if existing is not None:
+            print(f"⚠️ Collection {collection_name} đã tồn tại. Sẽ thêm dữ liệu vào collection hiện có.")
+            # Qdrant không thêm được sparse vector mới vào collection đã có (update_collection chỉ sửa vector sẵn có)
+            if "keyword_vector" not in (existing.config.params.sparse_vectors or {}):
+                KEYWORD_VECTOR_ENABLED = False
+                print(f"⚠️ Collection {collection_name} chưa có keyword_vector: chỉ upload semantic_vector.")
+                print("   Để dùng hybrid search, chạy lại với --recreate (xóa và ingest lại toàn bộ collection).")
+        else:
+            print(f"📝 Tạo collection mới: {collection_name}")
             qdrant_client.create_collection(
                 collection_name=collection_name,
                 vectors_config={
@@ -172,9 +191,9 @@ def create_collection():
                         size=VECTOR_SIZE,  # 1536 for text-embedding-3-small
                         distance=models.Distance.COSINE
                     ),
-                    # Vector thưa cho keyword matching (sẽ implement sau)
-                    # "keyword_vector": models.SparseVectorParams()
-                }
+                },
+                # Vector thưa (BM25) cho keyword matching
+                sparse_vectors_config=SPARSE_VECTORS_CONFIG
             )
             print(f"✅ Đã tạo collection mới: {collection_name}")
         
@@ -220,6 +239,27 @@ def create_collection():
     
     return True
 
+def bump_collection_version(uploaded_count):
+    """
+    Tăng data_version trong metadata của collection: backend xóa cache kết quả truy xuất khi thấy phiên bản mới.
+    Ghi fragments_version khi mọi point của collection vừa được upload lại (đều có fragment render sẵn):
+    backend khi đó chỉ lấy các khối render sẵn thay cho trường gốc.
+    """
+    try:
+        info = qdrant_client.get_collection(QDRANT_COLLECTION_NAME)
+        metadata = dict(getattr(info.config, "metadata", None) or {})
+        metadata["data_version"] = int(metadata.get("data_version", 0)) + 1
+        if info.points_count == uploaded_count:
+            metadata["fragments_version"] = FRAGMENT_VERSION
+        else:
+            metadata.pop("fragments_version", None)
+            print(f"⚠️ Collection có {info.points_count} points nhưng chỉ {uploaded_count} được upload lại: "
+                  f"backend sẽ dùng trường gốc (chạy lại với --recreate)")
+        qdrant_client.update_collection(collection_name=QDRANT_COLLECTION_NAME, metadata=metadata)
+        print(f"✅ Collection data_version = {metadata['data_version']}")
+    except Exception as e:
+        print(f"⚠️ Không cập nhật được data_version: {e}")
+
 def extract_problem_section(question_number: str, category: str) -> str:
     """Extract problem section from question_number based on category."""
     if not question_number:
@@ -275,6 +315,9 @@ def upload_item_to_qdrant(item):
         if solution_parts_natural:
             solution_natural['solution_parts'] = solution_parts_natural
         
+        # === TẠO KEYWORD VECTOR (sparse, BM25) ===
+        keyword_vector = create_keyword_vector(create_keyword_text(item, problem_natural))
+        
         # === THÊM PROBLEM_SECTION ===
         question_number = item.get("question_number", "")
         category = item.get("category", "")
@@ -316,18 +359,23 @@ def upload_item_to_qdrant(item):
             "embedding_text": embedding_text  # Để debug và analysis
         }
         
+        # Số token của problem/parts/solution: backend xếp context theo budget mà không phải đếm lại
+        payload["token_counts"] = payload_token_counts(payload)
+        # Fragment prompt/hiển thị render sẵn (problem_block, solution_block, display_block + số token)
+        payload.update(render_fragments(payload, page_content=problem_natural))
+        
         # === TẠO NUMERIC ID cho Qdrant Cloud ===
         numeric_id = create_numeric_id(item["id"])
         
         # === UPLOAD VÀO QDRANT với MULTI-VECTOR ===
+        vectors = {"semantic_vector": semantic_vector}
+        if keyword_vector is not None and KEYWORD_VECTOR_ENABLED:
+            vectors["keyword_vector"] = keyword_vector
         qdrant_client.upsert(
             collection_name=QDRANT_COLLECTION_NAME,  # Sử dụng collection name từ .env
             points=[{
                 "id": numeric_id,  # Sử dụng numeric ID
-                "vector": {
-                    "semantic_vector": semantic_vector
-                    # "keyword_vector": keyword_vector  # Sẽ implement sau
-                },
+                "vector": vectors,
                 "payload": payload
             }]
         )
@@ -487,6 +535,13 @@ def load_and_upload_data():
 def main():
     """Hàm main"""
     
+    parser = argparse.ArgumentParser(description="Import dữ liệu vào Qdrant (dense + sparse)")
+    parser.add_argument(
+        "--recreate", action="store_true",
+        help="Xóa và tạo lại collection (cần khi collection cũ chưa có keyword_vector)"
+    )
+    args = parser.parse_args()
+    
     print("🚀 BẮT ĐẦU IMPORT DỮ LIỆU VÀO QDRANT CLOUD")
     print("=" * 50)
     
@@ -499,13 +554,15 @@ def main():
     print(f"📦 COLLECTION: {QDRANT_COLLECTION_NAME}")
     
     # Tạo collection
-    if not create_collection():
+    if not create_collection(recreate=args.recreate):
         return
     
     # Upload dữ liệu
     success_count = load_and_upload_data()
     
     if success_count > 0:
+        bump_collection_version(success_count)
+        
         # Test search
         test_search_functionality()
         
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark cho TopicClassifier.
+- Baseline: mỗi từ khóa / dạng bài Olympic là một regex riêng, search lần lượt (cách cũ)
+- Hiện tại: classify() với một regex dạng trie đã compile, và classify_many() cho cả lô
+- Tin nhắn có độ dài thực tế: câu chat ngắn, câu hỏi trung bình, đề bài dán nguyên văn (LaTeX)
+
+Usage (from the repo root):
+    python data/scripts/topic_classifier_benchmark.py [số vòng lặp]
+"""
+import re
+import sys
+import time
+from pathlib import Path
+
+# Add backend to path
+backend_path = Path(__file__).resolve().parent.parent.parent / "backend"
+sys.path.insert(0, str(backend_path))
+
+from app.services.topic_classifier import (  # noqa: E402
+    LINEAR_ALGEBRA_KEYWORDS,
+    OLYMPIC_PATTERNS,
+    topic_classifier,
+)
+
+MESSAGES = {
+    "short": [
+        "xin chào, bạn là ai?",
+        "cho tôi bài tập ma trận năm 2023",
+        "thời tiết hôm nay thế nào",
+        "giải bài 2.1 đề thi bảng A",
+    ],
+    "medium": [
+        "Em đang ôn thi Olympic, thầy có thể giải thích giúp em cách tính định thức của một ma trận "
+        "cấp 4 bằng khai triển Laplace không ạ? Em hay bị nhầm dấu ở các phần bù đại số, "
+        "và không biết khi nào nên dùng biến đổi sơ cấp trước khi khai triển.",
+        "Mình muốn hỏi về lịch thi của trường năm nay, khi nào có thông báo chính thức và đăng ký "
+        "ở đâu vậy? Ngoài ra phòng thi có cho mang máy tính cầm tay vào không?",
+    ],
+    "long": [
+        ("Cho ma trận $A = \\begin{pmatrix} 1 & 2 & 0 \\\\ 0 & 1 & 3 \\\\ 2 & 0 & 1 \\end{pmatrix}$. "
+         "a) Tính định thức của $A$ và chứng minh rằng $A$ khả nghịch. "
+         "b) Tìm ma trận $X$ sao cho $AX = B$ với $B$ là ma trận đơn vị cấp 3. "
+         "c) Tìm trị riêng và vector riêng của $A^T A$, từ đó suy ra $A^T A$ chéo hóa được. ") * 4,
+        ("Hôm qua mình đọc một bài viết rất dài về lịch sử của toán học ứng dụng ở Việt Nam, "
+         "từ những năm đầu thành lập các khoa toán cho đến các kỳ thi sinh viên gần đây. "
+         "Bài viết nhắc đến nhiều thầy cô, nhiều câu chuyện thú vị về cách dạy và học. ") * 6,
+    ],
+}
+
+
+class BaselineClassifier:
+    """Cách cũ: ~120 regex riêng biệt cho từ khóa + từng pattern Olympic"""
+
+    def __init__(self):
+        self.la_patterns = [re.compile(pattern, re.IGNORECASE) for pattern in LINEAR_ALGEBRA_KEYWORDS]
+        self.olympic_patterns = [re.compile(pattern, re.IGNORECASE) for pattern in OLYMPIC_PATTERNS]
+
+    def classify(self, text: str):
+        normalized_text = text.lower()
+        is_linear_algebra = any(pattern.search(normalized_text) for pattern in self.la_patterns)
+        olympic_patterns_found = [
+            pattern.pattern for pattern in self.olympic_patterns
+            if pattern.search(normalized_text)
+        ]
+        is_olympic = len(olympic_patterns_found) > 0
+        if is_olympic:
+            is_linear_algebra = True
+        return is_linear_algebra, {
+            "is_linear_algebra": is_linear_algebra,
+            "is_olympic": is_olympic,
+            "olympic_patterns": olympic_patterns_found if is_olympic else [],
+            "confidence": "high" if is_olympic else ("medium" if is_linear_algebra else "low")
+        }
+
+
+def _timeit(func, rounds: int) -> float:
+    """Thời gian trung bình mỗi vòng (micro giây)"""
+    start = time.perf_counter()
+    for _ in range(rounds):
+        func()
+    return (time.perf_counter() - start) / rounds * 1e6
+
+
+def main():
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    baseline = BaselineClassifier()
+
+    print(f"{'messages':<10}{'avg chars':>10}{'baseline':>12}{'classify':>12}{'batch/msg':>12}{'speedup':>10}")
+    for name, messages in MESSAGES.items():
+        # Kết quả phải giống hệt cách cũ
+        expected = [baseline.classify(message) for message in messages]
+        assert [topic_classifier.classify(message) for message in messages] == expected
+        assert topic_classifier.classify_many(messages) == expected
+
+        old = _timeit(lambda: [baseline.classify(message) for message in messages], rounds) / len(messages)
+        new = _timeit(lambda: [topic_classifier.classify(message) for message in messages], rounds) / len(messages)
+        batch = _timeit(lambda: topic_classifier.classify_many(messages), rounds) / len(messages)
+        avg_chars = sum(len(message) for message in messages) / len(messages)
+        print(f"{name:<10}{avg_chars:>10.0f}{old:>10.1f}us{new:>10.1f}us{batch:>10.1f}us{old / new:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()